@@ -0,0 +1,310 @@
+"""
+Title: calibration_design.py
+
+Summary:
+Optimal design of the calibration points (test pressures of the fluigent pump and mass balance measurement durations)
+for the correction model Q_actual = B_1*Q_sli + B_o of plotting_combined_df.py, to reach a target relative uncertainty
+of the slope, u_beta_1_hat_rel [%], with the least bench time. Each calibration point costs the settling time of the
+set-point plus its measurement duration.
+
+For a design of k points (signed pressures P_i, negative for negative_q, and measurement durations T_i) the expected
+sensor flow rate of each point is Q_sli_i = c*P_i, where c [uL/min/mbar] is the slope of Q_sli vs P estimated from the
+existing data of each flow case (laminar flow). The expected random scatter of each point about the fitted line is
+
+s_i^2 = sigma_scatter^2 + u_q_m^2 + beta_1^2*noise_std^2/(sample_rate*T)
+u_q_m = |Q_actual|*time_resolution/T                             (mass_fr_to_vol_fr.py)
+
+where noise_std^2/(sample_rate*T) is the variance of the average sensor flow rate of a run (random part of u_sli_1 in
+sensiron_first_order_uncertainty, functions.py) and sigma_scatter is the scatter of the existing fit not explained by
+these random terms (residual variance minus the average random variance of the existing points). The accuracy of the
+sensor (u_sli_o, % of reading and % of full scale) is systematic, the same error for every run at the same flow rate, so
+it is not part of the scatter and does not decrease with more points or longer runs.
+
+The parameters are estimated by unweighted OLS (fit_linear_correction fn in pipeline_stages.py), so with model rows
+f_i = [1, Q_sli_i] and X^T*X = sum(f_i*f_i^T) the expected covariance of the parameters is s_bar^2*(X^T*X)^-1, with
+s_bar^2 the average of s_i^2 (expected residual variance), and the expected uncertainty of the slope is
+
+u_beta_1 = t(0.975, k-2)*sqrt(s_bar^2*(X^T*X)^-1[1,1])    (95% confidence, as u_beta_1_hat in plotting_combined_df.py)
+
+Designs are compared by the D-optimal criterion (det(M), M = X^T*X/s_bar^2, maximized) or the I-optimal criterion
+(average prediction variance over the flow rate range, trace(M^-1*R), minimized). Many candidate designs (random
+subsets of the candidate pressures) are evaluated at once as stacked 2x2 matrices, and the best are refined by
+vectorized point exchange (every point of the design swapped with every candidate pressure in one batch).
+
+Dependencies:
+1. Path from pathlib
+2. numpy
+3. pandas
+4. scipy.stats
+5. functions.py
+6. correction_models.py
+
+Notes:
+1. noise_std, sample_rate_hz, time_resolution and settle_time_s are assumptions/settings of the setup, change them to
+    the values of the equipment used
+2. the candidate pressures are limited to the range of the fluigent (0-1 bar) pump
+
+"""
+
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from scipy import stats
+from functions import zero_order_uncertainty
+from correction_models import read_correction_data, model_matrix, batched_ols
+
+
+"""
+Function: design_model_from_data(df, flow_meter='SLI-0430', bits=11)
+
+Summary:
+Function estimates the quantities needed to predict the uncertainty of a design from the combined data of a viscosity
+(see neg_and_pos_q_combined_file.py) and outputs a dictionary (c is the slope of |Q_sli| vs |P|) of the form
+
+{'slope_pos': c for positive_q [uL/min/mbar], 'slope_neg': c for negative_q [uL/min/mbar], 'beta_0', 'beta_1',
+ 'sigma_res': residual standard deviation of the OLS fit [uL/min], 'sigma_scatter': scatter not explained by the random
+ uncertainty of the points [uL/min]}
+
+The random variance of each existing point is beta_1^2*(u_q_sli^2 - u_sli_o^2)/4 + u_q_m^2, with (u_q_sli^2 -
+u_sli_o^2)/4 the variance of the average sensor flow rate (u_q_sli = u_sli_1, coverage factor 2, see
+sensiron_first_order_uncertainty fn in functions.py).
+
+"""
+
+def design_model_from_data(df, flow_meter='SLI-0430', bits=11):
+    q_sli = df['Q_sli [uL/min]'].values
+    pressure = np.abs(df['P [mbar]'].values)
+    pos = q_sli > 0
+    neg = q_sli < 0
+
+    #slope of |Q_sli| vs P through the origin for each flow case
+    slope_pos = np.sum(q_sli[pos]*pressure[pos])/np.sum(pressure[pos]**2) if np.any(pos) else np.nan
+    slope_neg = np.sum(-q_sli[neg]*pressure[neg])/np.sum(pressure[neg]**2) if np.any(neg) else np.nan
+
+    spec = {'name': 'poly_1', 'kind': 'polynomial', 'degree': 1}
+    results = batched_ols(model_matrix(q_sli, spec)[None], df['Q_mass_meas [uL/min]'].values[None],
+                          np.ones((1, len(q_sli))))
+    beta_1 = results['beta_hat'][0, 1]
+    sigma_res_sq = results['sigma_hat_sq'][0]
+
+    #residual variance not explained by the random uncertainty of the existing points
+    random_var = 0.0
+    if 'u_q_sli [uL/min]' in df.columns and 'u_q_m [uL/min]' in df.columns:
+        u_sli_o = zero_order_uncertainty(q_sli, flow_meter, bits)
+        sli_random_var = np.maximum(df['u_q_sli [uL/min]'].values**2 - u_sli_o**2, 0)/4
+        random_var = np.mean(beta_1**2*sli_random_var + df['u_q_m [uL/min]'].values**2)
+    return {'slope_pos': slope_pos, 'slope_neg': slope_neg, 'beta_0': results['beta_hat'][0, 0], 'beta_1': beta_1,
+            'sigma_res': np.sqrt(sigma_res_sq), 'sigma_scatter': np.sqrt(max(sigma_res_sq - random_var, 0))}
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: point_variances(signed_pressure, duration_s, design_model, noise_std=5.0, sample_rate_hz=10.0,
+                           time_resolution=0.005)
+
+Summary:
+Function calculates the expected sensor flow rate, Q_sli [uL/min], and random scatter variance, s^2 [(uL/min)^2], of
+calibration points at the given signed pressures [mbar] (negative for negative_q) and measurement durations [s] (arrays
+of any matching shape), see summary. Outputs the tuple (q_sli, var).
+
+"""
+
+def point_variances(signed_pressure, duration_s, design_model, noise_std=5.0, sample_rate_hz=10.0,
+                    time_resolution=0.005):
+    signed_pressure = np.asarray(signed_pressure, dtype=float)
+    duration_s = np.asarray(duration_s, dtype=float)
+    q_sli = np.where(signed_pressure >= 0, design_model['slope_pos']*signed_pressure,
+                     design_model['slope_neg']*signed_pressure)
+    q_actual = design_model['beta_0'] + design_model['beta_1']*q_sli
+
+    sli_random_var = noise_std**2/(sample_rate_hz*duration_s)
+    u_q_m = np.abs(q_actual)*time_resolution/duration_s
+    var = design_model['sigma_scatter']**2 + u_q_m**2 + design_model['beta_1']**2*sli_random_var
+    return q_sli, np.broadcast_to(var, q_sli.shape)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: evaluate_designs(q_sli, var, designs, q_range=None, confidence=0.95)
+
+Summary:
+Function evaluates many designs at once. q_sli and var are the expected sensor flow rates and scatter variances of the
+candidate points (see point_variances fn) and designs is an integer array (S x k) of the indices of the candidate points
+of each of S designs. Outputs a dictionary of arrays (S) of the form {'det': det(M), 'i_crit': trace(M^-1*R),
+'u_beta_0': t*sqrt(M^-1[0,0]), 'u_beta_1': t*sqrt(M^-1[1,1])}, where M = X^T*X/s_bar^2 (see summary), t the t quantile
+of the confidence level with k-2 degrees of freedom and R the average of f*f^T over q_range (min and max Q_sli of
+candidates if None).
+
+"""
+
+def evaluate_designs(q_sli, var, designs, q_range=None, confidence=0.95):
+    q_d = q_sli[designs]
+    s_bar_sq = var[designs].mean(axis=1)
+    #information matrix M = [[k, sum q], [sum q, sum q^2]]/s_bar^2 of every design (unweighted OLS)
+    m_00 = designs.shape[1]/s_bar_sq
+    m_01 = q_d.sum(axis=1)/s_bar_sq
+    m_11 = (q_d**2).sum(axis=1)/s_bar_sq
+    det = m_00*m_11 - m_01**2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inv_00 = m_11/det
+        inv_01 = -m_01/det
+        inv_11 = m_00/det
+
+    #R = average of [[1, q], [q, q^2]] for q uniform over q_range
+    if q_range is None:
+        q_range = (q_sli.min(), q_sli.max())
+    a, b = q_range
+    r_01 = (a+b)/2
+    r_11 = (a**2 + a*b + b**2)/3
+    i_crit = inv_00 + 2*inv_01*r_01 + inv_11*r_11
+
+    dof = designs.shape[1]-2
+    t_crit = stats.t.ppf(0.5+confidence/2, dof) if dof > 0 else np.inf
+    valid = (det > 0) & (dof > 0)
+    return {'det': np.where(valid, det, 0.0), 'i_crit': np.where(valid, i_crit, np.inf),
+            'u_beta_0': np.where(valid, t_crit*np.sqrt(np.abs(inv_00)), np.inf),
+            'u_beta_1': np.where(valid, t_crit*np.sqrt(np.abs(inv_11)), np.inf)}
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: optimal_design(q_sli, var, k, criterion='D', num_random=20000, num_exchange=10, seed=0)
+
+Summary:
+Function searches for the optimal design of k distinct candidate points. num_random random designs are evaluated at once
+and the best one is improved by point exchange, where every (design point, candidate point) swap is evaluated in one
+batch and the best swap is kept, until no swap improves the criterion (or num_exchange rounds). Outputs the tuple
+(indices of the design points (k), evaluation of the design (see evaluate_designs fn)).
+
+Inputs:
+1. q_sli, var, expected sensor flow rates and scatter variances of the candidate points (see point_variances fn)
+2. k, number of points of the design
+3. criterion, 'D' (maximize det(M)) or 'I' (minimize average prediction variance)
+4. num_random, number of random designs evaluated
+5. num_exchange, maximum number of exchange rounds
+6. seed, seed of random number generator
+
+"""
+
+def optimal_design(q_sli, var, k, criterion='D', num_random=20000, num_exchange=10, seed=0):
+    rng = np.random.default_rng(seed)
+    num_candidates = len(q_sli)
+    k = min(k, num_candidates)
+
+    def score(evaluation):
+        return -evaluation['det'] if criterion == 'D' else evaluation['i_crit']
+
+    designs = np.argsort(rng.random((num_random, num_candidates)), axis=1)[:, :k]
+    best = designs[np.argmin(score(evaluate_designs(q_sli, var, designs)))]
+    best_score = score(evaluate_designs(q_sli, var, best[None]))[0]
+
+    for round_num in range(num_exchange):
+        #every swap of design point j with candidate c
+        swaps = np.repeat(best[None], k*num_candidates, axis=0)
+        swap_rows = np.arange(k*num_candidates)
+        swaps[swap_rows, np.repeat(np.arange(k), num_candidates)] = np.tile(np.arange(num_candidates), k)
+        #removing designs with repeated points
+        sorted_swaps = np.sort(swaps, axis=1)
+        distinct = np.all(sorted_swaps[:, 1:] != sorted_swaps[:, :-1], axis=1)
+        swap_scores = np.where(distinct, score(evaluate_designs(q_sli, var, swaps)), np.inf)
+        i_best = np.argmin(swap_scores)
+        if swap_scores[i_best] >= best_score:
+            break
+        best = swaps[i_best]
+        best_score = swap_scores[i_best]
+
+    best = np.sort(best)
+    return best, {key: value[0] for key, value in evaluate_designs(q_sli, var, best[None]).items()}
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: recommend_design(df, target_u_beta_1_rel, pressures=None, durations_s=(60, 120, 300, 600), k_min=3,
+                           k_max=20, settle_time_s=120, criterion='D', **uncertainty_kwargs)
+
+Summary:
+Function searches, for every number of points k_min..k_max and every measurement duration (same duration for every point
+of a design), for the optimal design of a viscosity (combined data, see neg_and_pos_q_combined_file.py) and outputs the
+tuple (df_recommended, df_search) where df_search has one row per (k, duration) of the form
+
+[k, Measurement Time [s], bench_time [s], u_beta_1_hat_rel [%], u_beta_0_hat [uL/min], criterion value, pressures]
+
+and df_recommended is the design with the least bench time that reaches target_u_beta_1_rel [%], of the form
+[P [mbar], flow_case, Measurement Time [s], expected Q_sli [uL/min]] (empty if the target cannot be reached).
+
+Inputs:
+1. df, combined data of the viscosity
+2. target_u_beta_1_rel, target relative uncertainty of beta_1 [%] (95% confidence)
+3. pressures, candidate pressures [mbar] (25 to 1000 mbar in steps of 25 mbar, for both flow cases, if None)
+4. durations_s, candidate measurement durations [s]
+5. k_min, k_max, range of number of points
+6. settle_time_s, settling time of each set-point [s]
+7. criterion, 'D' or 'I'
+8. uncertainty_kwargs, keyword arguments of point_variances fn (noise_std, sample_rate_hz, time_resolution)
+
+"""
+
+def recommend_design(df, target_u_beta_1_rel, pressures=None, durations_s=(60, 120, 300, 600), k_min=3, k_max=20,
+                     settle_time_s=120, criterion='D', **uncertainty_kwargs):
+    design_model = design_model_from_data(df)
+    if pressures is None:
+        pressures = np.arange(25, 1001, 25)
+    signed_pressure = np.concatenate((-np.asarray(pressures)[::-1], np.asarray(pressures))).astype(float)
+    if np.isnan(design_model['slope_neg']):
+        signed_pressure = signed_pressure[signed_pressure > 0]
+    if np.isnan(design_model['slope_pos']):
+        signed_pressure = signed_pressure[signed_pressure < 0]
+
+    rows = []
+    for duration in durations_s:
+        q_sli, var = point_variances(signed_pressure, duration, design_model, **uncertainty_kwargs)
+        for k in range(k_min, min(k_max, len(signed_pressure))+1):
+            design, evaluation = optimal_design(q_sli, var, k, criterion=criterion)
+            rows.append({'k': k, 'Measurement Time [s]': duration, 'bench_time [s]': k*(settle_time_s+duration),
+                         'u_beta_1_hat_rel [%]': evaluation['u_beta_1']/abs(design_model['beta_1'])*100,
+                         'u_beta_0_hat [uL/min]': evaluation['u_beta_0'],
+                         'criterion': evaluation['det'] if criterion == 'D' else evaluation['i_crit'],
+                         'pressures': signed_pressure[design], 'q_sli': q_sli[design]})
+
+    df_search = pd.DataFrame(rows).sort_values(['bench_time [s]', 'u_beta_1_hat_rel [%]']).reset_index(drop=True)
+    reached = df_search[df_search['u_beta_1_hat_rel [%]'] <= target_u_beta_1_rel]
+    if len(reached) == 0:
+        df_recommended = pd.DataFrame(columns=['P [mbar]', 'flow_case', 'Measurement Time [s]', 'Q_sli [uL/min]'])
+    else:
+        best = reached.iloc[0]
+        df_recommended = pd.DataFrame({'P [mbar]': np.abs(best['pressures']).astype(int),
+                                       'flow_case': np.where(best['pressures'] < 0, 'negative_q', 'positive_q'),
+                                       'Measurement Time [s]': best['Measurement Time [s]'],
+                                       'Q_sli [uL/min]': best['q_sli']})
+    return df_recommended, df_search.drop(columns=['q_sli'])
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+if __name__ == '__main__':
+    #target relative uncertainty of beta_1 [%] (95% confidence) and design criterion ('D' or 'I')
+    target_u_beta_1_rel = 0.5
+    criterion = 'D'
+
+    # specify path of data used to estimate the flow rate vs pressure and residual scatter of each viscosity
+    p = Path('./outputs/combined_pos_neg_q/')
+    dict_of_combined_data = read_correction_data(p)
+
+    for key in dict_of_combined_data:
+        df_recommended, df_search = recommend_design(dict_of_combined_data[key], target_u_beta_1_rel,
+                                                     criterion=criterion)
+        print(key)
+        if len(df_recommended) == 0:
+            print('target u_beta_1_hat_rel = ' + str(target_u_beta_1_rel) + ' % cannot be reached, best designs:')
+            print(df_search.sort_values('u_beta_1_hat_rel [%]').head().to_string())
+        else:
+            print(df_recommended.to_string())
@@ -0,0 +1,725 @@
+"""
+Title: correction_models.py
+
+Summary:
+Functions for fitting and selecting correction models between the flow rate measured by the SLI-0430 flow sensor, Q_sli,
+and the true flow rate determined from the mass balance measurements, Q_mass_meas. plotting_combined_df.py only fits
+
+Q_actual = B_1*Q_sli + B_o
+
+separately for each viscosity, the functions in this file extend this to the following candidate models:
+
+1. polynomial, Q_actual = B_o + B_1*Q_sli + B_2*Q_sli^2 + ... + B_d*Q_sli^d
+2. piecewise linear split at zero flow (different slope for negative and positive flow rates),
+    Q_actual = B_o + B_n*min(Q_sli,0) + B_p*max(Q_sli,0)
+3. global viscosity model, a single fit over all viscosities where each coefficient of the polynomial in Q_sli is itself a
+    polynomial in L = ln(viscosity [cSt]),
+    Q_actual = sum_i sum_j B_ij*L^j*Q_sli^i
+4. temperature model, for each viscosity the coefficients of the polynomial in Q_sli are polynomials in the temperature
+    of the fluid, dT = T - T_ref [C] (temperature column of the sensor export, see fit_temperature_model fn),
+    Q_actual = sum_i sum_j B_ij*dT^j*Q_sli^i
+    or, shared by every viscosity, the global viscosity model evaluated at the kinematic viscosity of the fluid at the
+    temperature of each calibration point, L = ln(nu(T)) (see fluid_properties.py and fit_global_viscosity_model fn),
+    which only needs a spread of viscosities, not a spread of temperatures for each viscosity
+
+All models are linear in their parameters so they are fit using OLS estimation (see plotting_combined_df.py), which is
+done in batched form for all viscosities at once. The data for each viscosity (group) is stacked into padded arrays of
+shape (G, N_max, M) with a weight mask of shape (G, N_max) that is 1 for observations and 0 for padding, so that
+
+B_hat_g = (X_g^T*W_g*X_g)^-1*X_g^T*W_g*y_g
+
+is obtained for all groups with a single batched singular value decomposition of the centred and scaled model matrices
+(see batched_ols fn). Models that can not be estimated for a group (fewer observations than parameters, or a column
+without information such as min(Q_sli,0) of positive flow rates only) are flagged instead of stopping the fit of the
+other groups.
+
+Model selection is done with the Akaike and Bayesian information criteria (AIC/BIC, gaussian likelihood with the error
+variance counted as a parameter) and k-fold cross-validation root mean square error (cv_rmse). The global viscosity model
+is validated using leave-one-viscosity-out cross-validation, i.e. how well the model corrects a fluid it has not been
+calibrated with.
+
+Dependencies:
+1. Path from pathlib
+2. numpy
+3. pandas
+4. fluid_properties.py
+
+Notes:
+1. models are described by a dictionary (model spec) of the form {'name': str, 'kind': str, ...} see model_matrix fn
+2. keys of the data dictionaries are assumed to be of the form visc_cSt (e.g. 5_cSt) as in the other programs
+
+"""
+
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from fluid_properties import kinematic_viscosity
+
+
+"""
+Function: read_correction_data(p)
+
+Summary:
+Function intakes the path of a folder of .csv files created by flow_meter_fr_and_meas_fr_to_csv.py or
+neg_and_pos_q_combined_file.py (named visc_cSt.csv) and outputs a dictionary of the form {'visc_cSt': dataframe} sorted in
+ascending order of viscosity.
+
+Inputs:
+1. p, path of folder where the .csv files are stored (e.g. Path('./outputs/combined_pos_neg_q/'))
+
+"""
+
+def read_correction_data(p):
+    csv_paths = sorted(Path(p).glob('./*.csv'), key=lambda path: viscosity_from_key(path.stem))
+    dict_of_data = {}
+    for path in csv_paths:
+        dict_of_data[path.stem] = pd.read_csv(path, index_col=0)
+    return dict_of_data
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: viscosity_from_key(key)
+
+Summary:
+Function converts a key of the form visc_cSt (e.g. '5_cSt') to the value of the viscosity in cSt as a float.
+
+"""
+
+def viscosity_from_key(key):
+    return float(key.replace('_cSt', ''))
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: model_matrix(q_sli, spec, viscosity=None, temperature=None)
+
+Summary:
+Function creates the model matrix, X, (N x M) for a given model spec from the sensor flow rates, q_sli, (and viscosity for
+the global model or temperature for the temperature model). Supported model specs are:
+
+{'kind': 'polynomial', 'degree': d}, X = |1 x_1 ... x_1^d|
+{'kind': 'piecewise', 'breakpoint': b}, X = |1 min(x_1-b,0) max(x_1-b,0)| (continuous at the breakpoint)
+{'kind': 'global', 'degree': d, 'visc_degree': k}, X = |x_1^i*L_1^j| for i = 0..d, j = 0..k, L = ln(viscosity)
+{'kind': 'temperature', 'degree': d, 'temp_degree': k, 't_ref': T_ref}, X = |x_1^i*dT_1^j| for i = 0..d, j = 0..k,
+    dT = temperature - T_ref
+
+Inputs:
+1. q_sli, array of sensor flow rates [uL/min]
+2. spec, model spec dictionary
+3. viscosity, viscosity of each observation [cSt] (scalar or array, only used by the global model)
+4. temperature, temperature of each observation [C] (scalar or array, only used by the temperature model)
+
+"""
+
+def model_matrix(q_sli, spec, viscosity=None, temperature=None):
+    x = np.atleast_1d(np.asarray(q_sli, dtype=float))
+    kind = spec['kind']
+    if kind == 'polynomial':
+        return np.vander(x, spec['degree']+1, increasing=True)
+    elif kind == 'piecewise':
+        x_shift = x - spec.get('breakpoint', 0.0)
+        return np.column_stack([np.ones_like(x), np.minimum(x_shift, 0.0), np.maximum(x_shift, 0.0)])
+    elif kind == 'global':
+        if viscosity is None:
+            raise ValueError('global model requires the viscosity of each observation')
+        log_visc = np.log(np.broadcast_to(np.asarray(viscosity, dtype=float), x.shape))
+        x_powers = np.vander(x, spec['degree']+1, increasing=True)
+        visc_powers = np.vander(log_visc, spec['visc_degree']+1, increasing=True)
+        #columns ordered as x^0*L^0, x^0*L^1, ..., x^d*L^k
+        return (x_powers[:, :, None]*visc_powers[:, None, :]).reshape(len(x), -1)
+    elif kind == 'temperature':
+        if temperature is None:
+            raise ValueError('temperature model requires the temperature of each observation')
+        d_temp = np.broadcast_to(np.asarray(temperature, dtype=float), x.shape) - spec.get('t_ref', 25.0)
+        x_powers = np.vander(x, spec['degree']+1, increasing=True)
+        temp_powers = np.vander(d_temp, spec['temp_degree']+1, increasing=True)
+        #columns ordered as x^0*dT^0, x^0*dT^1, ..., x^d*dT^k
+        return (x_powers[:, :, None]*temp_powers[:, None, :]).reshape(len(x), -1)
+    raise ValueError("unknown model kind '" + str(kind) + "'")
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: stack_groups(list_of_x_mat, list_of_y)
+
+Summary:
+Function stacks the model matrices and response vectors of G groups (e.g. viscosities) with different numbers of
+observations into zero padded arrays X (G x N_max x M), y (G x N_max) and the weight mask w (G x N_max).
+
+"""
+
+def stack_groups(list_of_x_mat, list_of_y):
+    num_groups = len(list_of_x_mat)
+    n_max = max(len(y) for y in list_of_y)
+    num_params = list_of_x_mat[0].shape[1]
+    x_stack = np.zeros((num_groups, n_max, num_params))
+    y_stack = np.zeros((num_groups, n_max))
+    w = np.zeros((num_groups, n_max))
+    for g, (x_mat, y) in enumerate(zip(list_of_x_mat, list_of_y)):
+        n = len(y)
+        x_stack[g, :n] = x_mat
+        y_stack[g, :n] = y
+        w[g, :n] = 1.0
+    return x_stack, y_stack, w
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: scale_columns(x_stack, w, tol=1e-10)
+
+Summary:
+Function centres (if column 0 is the intercept, i.e. 1 for every observation with non-zero weight) and scales the
+columns of the model matrix of every group of the stacked arrays to a weighted root mean square of 1, so that the least
+squares problem is well conditioned (e.g. the columns 1, Q_sli, ..., Q_sli^3 of Q_sli up to 1000 uL/min span 9 orders
+of magnitude). Outputs the tuple (x_scaled, t_mat) with x_scaled = X*T (G x N_max x M) and the transformation T
+(G x M x M), so that B_hat = T*B_hat_scaled and (X^T*W*X)^-1 = T*(X_s^T*W*X_s)^-1*T^T.
+
+Columns that are constant (collinear with the intercept after centring, e.g. the temperature of points all taken at one
+temperature) or zero (e.g. min(Q_sli,0) of positive flow rates only) are set to exactly zero instead of scaling up their
+rounding errors, the fit of their group is then rank deficient (see batched_ols fn).
+
+Inputs:
+1. x_stack, w, stacked arrays (see stack_groups fn)
+2. tol, columns with a root mean square below tol times the root mean square of the uncentred column are set to zero
+
+"""
+
+def scale_columns(x_stack, w, tol=1e-10):
+    num_groups, n_max, num_params = x_stack.shape
+    sum_w = np.sum(w, axis=1)
+    sum_w = np.where(sum_w > 0, sum_w, 1.0)
+    t_mat = np.tile(np.eye(num_params), (num_groups, 1, 1))
+    x_scaled = np.array(x_stack, dtype=float)
+
+    if np.all(np.where(w > 0, x_stack[:, :, 0] == 1, True)):
+        mean = np.einsum('gn,gnm->gm', w, x_stack)/sum_w[:, None]
+        mean[:, 0] = 0.0
+        x_scaled -= x_stack[:, :, :1]*mean[:, None, :]
+        t_mat[:, 0, :] -= mean
+
+    rms = np.sqrt(np.einsum('gn,gnm->gm', w, x_scaled**2)/sum_w[:, None])
+    rms_uncentred = np.sqrt(np.einsum('gn,gnm->gm', w, x_stack**2)/sum_w[:, None])
+    degenerate = rms <= tol*rms_uncentred
+    scale = np.where(degenerate, 1.0, rms)
+    x_scaled = np.where(degenerate[:, None, :], 0.0, x_scaled/scale[:, None, :])
+    return x_scaled, t_mat/scale[:, None, :]
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: batched_ols(x_stack, y_stack, w)
+
+Summary:
+Function performs OLS estimation for every group of the stacked arrays created by stack_groups at once and outputs a
+dictionary with the estimated parameters and fit statistics for each group:
+
+{'beta_hat': (G x M), 'cov_beta_hat': (G x M x M), 'y_hat': (G x N_max), 'residuals': (G x N_max), 'sse': (G),
+ 'n': (G), 'dof': (G), 'sigma_hat_sq': (G), 'r_squared': (G), 'xtx_inv': (G x M x M), 'rank': (G), 'estimable': (G)}
+
+The least squares problem of each group is solved by a batched singular value decomposition of the weighted, centred
+and scaled model matrix (see scale_columns fn) instead of inverting the normal equations, which squares the condition
+number.
+Groups whose model matrix has a rank below M (fewer observations than parameters, a column without information such as
+min(Q_sli,0) of positive flow rates only, collinear columns) can not be estimated, estimable is False and every output
+of the group is NaN.
+
+Inputs:
+1. x_stack, model matrices (G x N_max x M)
+2. y_stack, responses (G x N_max)
+3. w, weights (G x N_max), 1 for observations used in the fit and 0 otherwise (padding or held out observations)
+
+Notes:
+1. residuals and y_hat are also given for observations with zero weight (i.e. predictions of held out data)
+2. the rank is determined with the tolerance of np.linalg.matrix_rank on the scaled model matrix
+
+"""
+
+def batched_ols(x_stack, y_stack, w):
+    num_params = x_stack.shape[2]
+    x_scaled, t_mat = scale_columns(x_stack, w)
+    sqrt_w = np.sqrt(w)
+    u_mat, sing, vt_mat = np.linalg.svd(sqrt_w[:, :, None]*x_scaled, full_matrices=False)
+    tol = sing[:, :1]*max(x_stack.shape[1], num_params)*np.finfo(float).eps
+    rank = np.sum(sing > tol, axis=1)
+    estimable = rank == num_params
+    with np.errstate(divide='ignore'):
+        sing_inv = np.where(estimable[:, None] & (sing > 0), 1/sing, 0.0)
+
+    beta_scaled = np.einsum('gkm,gk,gnk,gn->gm', vt_mat, sing_inv, u_mat, sqrt_w*y_stack)
+    beta_hat = np.einsum('gmk,gk->gm', t_mat, beta_scaled)
+    xtx_inv = np.einsum('gmi,gki,gk,gkj,gnj->gmn', t_mat, vt_mat, sing_inv**2, vt_mat, t_mat)
+    beta_hat[~estimable] = np.nan
+    xtx_inv[~estimable] = np.nan
+
+    y_hat = np.einsum('gnm,gm->gn', x_scaled, beta_scaled)
+    y_hat[~estimable] = np.nan
+    residuals = y_stack - y_hat
+    sse = np.sum(w*residuals**2, axis=1)
+    n = np.sum(w, axis=1)
+    dof = n - num_params
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sigma_hat_sq = np.where(dof > 0, sse/dof, np.nan)
+        y_bar = np.sum(w*y_stack, axis=1)/n
+        sst = np.sum(w*(y_stack-y_bar[:, None])**2, axis=1)
+        r_squared = 1 - sse/sst
+
+    return {'beta_hat': beta_hat, 'cov_beta_hat': xtx_inv*sigma_hat_sq[:, None, None], 'y_hat': y_hat,
+            'residuals': residuals, 'sse': sse, 'n': n, 'dof': dof, 'sigma_hat_sq': sigma_hat_sq,
+            'r_squared': r_squared, 'xtx_inv': xtx_inv, 'rank': rank, 'estimable': estimable}
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: information_criteria(sse, n, num_params)
+
+Summary:
+Function calculates the AIC and BIC of gaussian OLS fits from the sum of squared errors, number of observations and number
+of parameters (vectorized). The error variance is counted as an additional parameter, i.e.
+
+log_l = -n/2*(ln(2*pi) + ln(SSE/n) + 1)
+AIC = 2*(M+1) - 2*log_l
+BIC = ln(n)*(M+1) - 2*log_l
+
+"""
+
+def information_criteria(sse, n, num_params):
+    sse = np.asarray(sse, dtype=float)
+    n = np.asarray(n, dtype=float)
+    log_l = -0.5*n*(np.log(2*np.pi) + np.log(sse/n) + 1)
+    k = num_params + 1
+    aic = 2*k - 2*log_l
+    bic = np.log(n)*k - 2*log_l
+    return aic, bic
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: hat_matrix(x_stack, w, xtx_inv)
+
+Summary:
+Function calculates the hat matrix, H = X*(X^T*W*X)^-1*X^T, (G x N_max x N_max) of every group of the stacked arrays,
+where y_hat = H*W*y. The diagonal of H gives the leverage, h_ii, of each observation (0 for padding).
+
+Inputs:
+1. x_stack, w, stacked arrays (see stack_groups fn)
+2. xtx_inv, (X^T*W*X)^-1 of each group (output of batched_ols fn)
+
+"""
+
+def hat_matrix(x_stack, w, xtx_inv):
+    return np.einsum('gnm,gmk,gjk->gnj', x_stack, xtx_inv, x_stack)*(w[:, :, None]*w[:, None, :])
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: loo_residuals(x_stack, y_stack, w)
+
+Summary:
+Function calculates the leave-one-out (deleted) residuals of every observation of every group of the stacked arrays in
+closed form from a single fit, without refitting, using
+
+e_(i) = e_i/(1-h_ii)
+
+where e_i is the OLS residual and h_ii the leverage of observation i. Outputs the loo residuals (G x N_max, 0 for padding)
+and the leverages (G x N_max). Residuals of observations with h_ii = 1 (the model can not be estimated without them) and
+of groups that can not be estimated (see batched_ols fn) are NaN.
+
+"""
+
+def loo_residuals(x_stack, y_stack, w):
+    results = batched_ols(x_stack, y_stack, w)
+    leverage = np.diagonal(hat_matrix(x_stack, w, results['xtx_inv']), axis1=1, axis2=2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        e_loo = np.where(w > 0, results['residuals']/(1-leverage), 0.0)
+    e_loo[(w > 0) & ~(1-leverage > 1e-10)] = np.nan
+    return e_loo, leverage
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: kfold_cv_residuals(x_stack, y_stack, w, k=5, seed=0)
+
+Summary:
+Function calculates the k-fold cross-validation residuals (prediction errors of held out observations) of every group of
+the stacked arrays in closed form from a single fit. Observations of each group are randomly assigned to k folds and the
+residuals of the held out fold, S, are obtained from the full fit residuals, e_S, and hat matrix as
+
+e_cv_S = (I-H_SS)^-1*e_S
+
+which is solved for all groups at once for each fold (k small batched solves of size N_max, instead of k refits). Outputs
+the cv residuals (G x N_max, 0 for padding) and the fold of each observation (G x N_max, -1 for padding). Residuals of
+folds without which the model can not be estimated (I-H_SS singular, see batched_ols fn) and of groups that can not be
+estimated are NaN.
+
+Inputs:
+1. x_stack, y_stack, w, stacked arrays (see stack_groups fn)
+2. k, number of folds (limited to the number of observations of the smallest group, k = n gives leave-one-out)
+3. seed, seed of random number generator used to assign folds
+
+"""
+
+def kfold_cv_residuals(x_stack, y_stack, w, k=5, seed=0):
+    rng = np.random.default_rng(seed)
+    n = np.sum(w, axis=1).astype(int)
+    k = int(min(k, n.min()))
+
+    #assigning each observation of each group to a fold (padding is given fold -1)
+    folds = np.full(w.shape, -1)
+    for g in range(len(n)):
+        folds[g, :n[g]] = rng.permutation(np.arange(n[g]) % k)
+
+    results = batched_ols(x_stack, y_stack, w)
+    h_mat = hat_matrix(x_stack, w, results['xtx_inv'])
+    identity = np.eye(w.shape[1])
+    e_cv = np.zeros(w.shape)
+    for fold in range(k):
+        in_fold = (folds == fold).astype(float)
+        #(I-H_SS) on the rows/columns of the fold, identity elsewhere
+        a_mat = identity - h_mat*(in_fold[:, :, None]*in_fold[:, None, :])
+        #groups that can not be estimated without the fold are solved with the identity and set to NaN
+        singular = ~batched_ols(x_stack, y_stack, w*(1-in_fold))['estimable'] | ~results['estimable']
+        a_mat[singular] = identity
+        e_fold = np.linalg.solve(a_mat, np.nan_to_num(in_fold*results['residuals'])[:, :, None])[:, :, 0]
+        e_fold[singular] = np.where(in_fold[singular] > 0, np.nan, 0.0)
+        e_cv += e_fold
+    return e_cv, folds
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: kfold_cv_rmse(x_stack, y_stack, w, k=5, seed=0)
+
+Summary:
+Function calculates the k-fold cross-validation root mean square prediction error for every group of the stacked arrays at
+once (see kfold_cv_residuals fn).
+
+"""
+
+def kfold_cv_rmse(x_stack, y_stack, w, k=5, seed=0):
+    e_cv, folds = kfold_cv_residuals(x_stack, y_stack, w, k=k, seed=seed)
+    return np.sqrt(np.sum(e_cv**2, axis=1)/np.sum(w, axis=1))
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: default_candidate_models(max_degree=3)
+
+Summary:
+Function outputs the list of model specs considered for each viscosity by fit_candidate_models, polynomial models of
+degree 1 (the model of plotting_combined_df.py) to max_degree and the piecewise linear model split at zero flow.
+
+"""
+
+def default_candidate_models(max_degree=3):
+    specs = [{'name': 'poly_'+str(d), 'kind': 'polynomial', 'degree': d} for d in range(1, max_degree+1)]
+    specs.append({'name': 'piecewise_0', 'kind': 'piecewise', 'breakpoint': 0.0})
+    return specs
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: fit_candidate_models(dict_of_data, specs=None, k=5, seed=0)
+
+Summary:
+Function intakes a dictionary of dataframes of the form {'visc_cSt': df} (see read_correction_data fn) and fits every
+candidate model spec to every viscosity (batched over viscosities) and outputs a dataframe of the form
+
+[Viscosity [cSt], model, num_params, n, estimable, sse, r_squared, aic, bic, cv_rmse [uL/min], best_aic, best_bic,
+ best_cv]
+
+along with a dictionary of the batched fit results for each model, {'model_name': (list_of_keys, batched_ols output)}.
+Models that can not be estimated for a viscosity (e.g. piecewise_0 of data of one flow direction only, or more
+parameters than calibration points) have estimable False and NaN statistics and are not considered for the best models.
+
+Inputs:
+1. dict_of_data, dictionary of dataframes with columns 'Q_sli [uL/min]' and 'Q_mass_meas [uL/min]'
+2. specs, list of model specs (default_candidate_models() if None)
+3. k, number of folds used for the cross-validation
+4. seed, seed of random number generator used to assign folds
+
+"""
+
+def fit_candidate_models(dict_of_data, specs=None, k=5, seed=0):
+    if specs is None:
+        specs = default_candidate_models()
+    keys = list(dict_of_data)
+    list_of_q_sli = [dict_of_data[key]['Q_sli [uL/min]'].values for key in keys]
+    list_of_y = [dict_of_data[key]['Q_mass_meas [uL/min]'].values for key in keys]
+    viscosity = np.array([viscosity_from_key(key) for key in keys])
+
+    list_of_rows = []
+    dict_of_fits = {}
+    for spec in specs:
+        x_stack, y_stack, w = stack_groups([model_matrix(q, spec) for q in list_of_q_sli], list_of_y)
+        results = batched_ols(x_stack, y_stack, w)
+        num_params = x_stack.shape[2]
+        aic, bic = information_criteria(results['sse'], results['n'], num_params)
+        cv_rmse = kfold_cv_rmse(x_stack, y_stack, w, k=k, seed=seed)
+        dict_of_fits[spec['name']] = (keys, results)
+        list_of_rows.append(pd.DataFrame({'Viscosity [cSt]': viscosity, 'model': spec['name'], 'num_params': num_params,
+                                          'n': results['n'].astype(int), 'estimable': results['estimable'],
+                                          'sse': results['sse'],
+                                          'r_squared': results['r_squared'], 'aic': aic, 'bic': bic,
+                                          'cv_rmse [uL/min]': cv_rmse}))
+
+    df_models = pd.concat(list_of_rows, ignore_index=True)
+    #flagging best model of each viscosity for each criterion
+    for col, criterion in [('best_aic', 'aic'), ('best_bic', 'bic'), ('best_cv', 'cv_rmse [uL/min]')]:
+        df_valid = df_models[df_models['estimable'] & np.isfinite(df_models[criterion])]
+        idx_best = df_valid.groupby('Viscosity [cSt]')[criterion].idxmin()
+        df_models[col] = df_models.index.isin(idx_best)
+    df_models = df_models.sort_values(['Viscosity [cSt]', 'num_params', 'model']).reset_index(drop=True)
+    return df_models, dict_of_fits
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: fit_global_viscosity_model(dict_of_data, degree=1, visc_degree=2, temperature=False, dict_of_tables=None)
+
+Summary:
+Function fits a single global model over all viscosities where the coefficients of the polynomial in Q_sli are polynomials
+in ln(viscosity) (see model_matrix fn), and validates it by leave-one-viscosity-out cross-validation (each viscosity is
+held out in turn and predicted by the model fit to the remaining viscosities, batched as G groups of the full data).
+If temperature is True the viscosity of each calibration point is the kinematic viscosity of the fluid at its
+temperature, nu(T [C]) (see kinematic_viscosity fn in fluid_properties.py), so the temperature dependence of the
+correction is shared by every viscosity through nu(T) (apply it with global_model_coefficients fn at nu of the fluid at
+the temperature of the measurement). Outputs a dictionary of the form
+
+{'spec': model spec, 'beta_hat': (M), 'cov_beta_hat': (M x M), 'sse', 'n', 'r_squared', 'aic', 'bic',
+ 'lovo_rmse': {'visc_cSt': rmse of held out viscosity [uL/min]}}
+
+Inputs:
+1. dict_of_data, dictionary of dataframes with columns 'Q_sli [uL/min]' and 'Q_mass_meas [uL/min]' (and 'T [C]' if
+    temperature is True)
+2. degree, degree of polynomial in Q_sli
+3. visc_degree, degree of polynomial in ln(viscosity) for each coefficient
+4. temperature, whether the viscosity of each point is nu(T [C]) of the fluid instead of the nominal viscosity of the
+    key
+5. dict_of_tables, dictionary of the form {'visc_cSt': property table} of measured property tables of the fluids (see
+    read_property_table fn in fluid_properties.py), generated tables for fluids that are not in it
+
+Notes:
+1. leave-one-viscosity-out requires more viscosities than visc_degree+1
+
+"""
+
+def fit_global_viscosity_model(dict_of_data, degree=1, visc_degree=2, temperature=False, dict_of_tables=None):
+    spec = {'name': 'global_'+str(degree)+'_'+str(visc_degree), 'kind': 'global', 'degree': degree,
+            'visc_degree': visc_degree}
+    keys = list(dict_of_data)
+    q_sli = np.concatenate([dict_of_data[key]['Q_sli [uL/min]'].values for key in keys])
+    y = np.concatenate([dict_of_data[key]['Q_mass_meas [uL/min]'].values for key in keys])
+    group = np.concatenate([np.full(len(dict_of_data[key]), i) for i, key in enumerate(keys)])
+    if temperature:
+        spec['name'] = spec['name'] + '_nu_t'
+        for key in keys:
+            if 'T [C]' not in dict_of_data[key].columns:
+                raise ValueError("data of '" + key + "' has no temperature column 'T [C]'")
+        viscosity = np.concatenate([kinematic_viscosity(key, dict_of_data[key]['T [C]'].values,
+                                                        (dict_of_tables or {}).get(key)) for key in keys])
+    else:
+        viscosity = np.array([viscosity_from_key(key) for key in keys])[group]
+    x_mat = model_matrix(q_sli, spec, viscosity)
+
+    #full fit (single group)
+    results = batched_ols(x_mat[None], y[None], np.ones((1, len(y))))
+    aic, bic = information_criteria(results['sse'], results['n'], x_mat.shape[1])
+
+    #leave-one-viscosity-out (group g holds out viscosity g)
+    num_groups = len(keys)
+    dict_of_lovo_rmse = {}
+    if num_groups > visc_degree+1:
+        held_out = group[None, :] == np.arange(num_groups)[:, None]
+        x_stack = np.broadcast_to(x_mat, (num_groups,)+x_mat.shape)
+        y_stack = np.broadcast_to(y, (num_groups, len(y)))
+        lovo = batched_ols(x_stack, y_stack, (~held_out).astype(float))
+        sq_err = np.where(held_out, lovo['residuals'], 0.0)**2
+        lovo_rmse = np.sqrt(np.sum(sq_err, axis=1)/np.sum(held_out, axis=1))
+        dict_of_lovo_rmse = dict(zip(keys, lovo_rmse))
+
+    return {'spec': spec, 'beta_hat': results['beta_hat'][0], 'cov_beta_hat': results['cov_beta_hat'][0],
+            'sse': results['sse'][0], 'n': int(results['n'][0]), 'r_squared': results['r_squared'][0],
+            'aic': aic[0], 'bic': bic[0], 'lovo_rmse': dict_of_lovo_rmse}
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: global_model_coefficients(global_fit, viscosity)
+
+Summary:
+Function evaluates the coefficients of the polynomial in Q_sli of a fitted global viscosity model at the given viscosities
+[cSt]. Outputs an array of shape (len(viscosity) x degree+1), where column i is the coefficient of Q_sli^i (i.e. for
+degree 1, column 0 is beta_0 [uL/min] and column 1 is beta_1 for a fluid of that viscosity).
+
+"""
+
+def global_model_coefficients(global_fit, viscosity):
+    spec = global_fit['spec']
+    log_visc = np.log(np.atleast_1d(np.asarray(viscosity, dtype=float)))
+    visc_powers = np.vander(log_visc, spec['visc_degree']+1, increasing=True)
+    beta_mat = global_fit['beta_hat'].reshape(spec['degree']+1, spec['visc_degree']+1)
+    return visc_powers @ beta_mat.T
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: apply_correction(q_sli, spec, beta_hat, viscosity=None, temperature=None)
+
+Summary:
+Function applies a fitted correction model to sensor flow rates, q_sli [uL/min], and outputs the corrected flow rates
+Q_actual [uL/min] (i.e. X*B_hat).
+
+Inputs:
+1. q_sli, array of sensor flow rates [uL/min]
+2. spec, model spec dictionary of the fitted model
+3. beta_hat, estimated parameters of the model
+4. viscosity, viscosity of the fluid [cSt] (only used by the global model)
+5. temperature, temperature of the fluid [C] (scalar or array of the same length as q_sli, only used by the temperature
+    model)
+
+"""
+
+def apply_correction(q_sli, spec, beta_hat, viscosity=None, temperature=None):
+    return model_matrix(q_sli, spec, viscosity, temperature) @ np.asarray(beta_hat, dtype=float)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: apply_correction_bulk(q_sli, spec, beta_hat, group, viscosity=None, temperature=None)
+
+Summary:
+Function applies the correction models fitted to several groups (e.g. the per viscosity fits of fit_temperature_model or
+fit_candidate_models) to the sensor flow rates of all groups at once and outputs the corrected flow rates Q_actual
+[uL/min], where observation n is corrected with the parameters beta_hat[group[n]] (one row-wise product, no loop over
+groups).
+
+Inputs:
+1. q_sli, array of sensor flow rates [uL/min] (N)
+2. spec, model spec dictionary of the fitted models
+3. beta_hat, estimated parameters of each group (G x M)
+4. group, index of the group of each observation (N)
+5. viscosity, temperature, viscosity [cSt] and temperature [C] of each observation (see model_matrix fn)
+
+"""
+
+def apply_correction_bulk(q_sli, spec, beta_hat, group, viscosity=None, temperature=None):
+    x_mat = model_matrix(q_sli, spec, viscosity, temperature)
+    return np.einsum('nm,nm->n', x_mat, np.asarray(beta_hat, dtype=float)[np.asarray(group)])
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: fit_temperature_model(dict_of_data, degree=1, temp_degree=1, t_ref=25.0, k=5, seed=0, min_temp_spread=1.0)
+
+Summary:
+Function fits the temperature model (see model_matrix fn) to every viscosity at once (batched over viscosities) and
+compares it to the polynomial model of the same degree without temperature by k-fold cross-validation. The data of each
+viscosity must have a temperature column 'T [C]' (average temperature of each calibration point from the temperature
+channel of the sensor export). Outputs a dictionary of the form
+
+{'spec': model spec, 'keys': list of keys, 'beta_hat': (G x M), 'cov_beta_hat': (G x M x M), 'sse', 'n', 'r_squared',
+ 'aic', 'bic', 'cv_rmse', 'cv_rmse_no_temp', 'temp_spread', 'temperature_identifiable'}
+
+where each entry is an array over the viscosities (in the order of keys). The temperature terms of a viscosity are not
+identifiable if its temperatures span less than min_temp_spread [C], there are no more than temp_degree distinct
+temperatures or the model matrix is rank deficient (see batched_ols fn), e.g. every point of the viscosity measured at
+one lab temperature. temperature_identifiable is then False and the viscosity falls back to the model without
+temperature, its coefficients B_i0 (and their covariance and fit statistics) are those of the polynomial fit and its
+temperature coefficients B_ij (j > 0) are 0, so the fitted coefficients of every viscosity can still be applied with
+apply_correction_bulk fn.
+
+Inputs:
+1. dict_of_data, dictionary of dataframes with columns 'Q_sli [uL/min]', 'Q_mass_meas [uL/min]' and 'T [C]'
+2. degree, degree of polynomial in Q_sli
+3. temp_degree, degree of polynomial in T - t_ref for each coefficient
+4. t_ref, reference temperature [C] (coefficients j = 0 are the correction at t_ref)
+5. k, number of folds used for the cross-validation
+6. seed, seed of random number generator used to assign folds
+7. min_temp_spread, smallest range of temperatures [C] of a viscosity for which its temperature terms are fit
+
+Notes:
+1. a temperature dependence shared by every viscosity through nu(T), identifiable without a spread of temperatures for
+    each viscosity, is fit by fit_global_viscosity_model fn with temperature=True
+
+"""
+
+def fit_temperature_model(dict_of_data, degree=1, temp_degree=1, t_ref=25.0, k=5, seed=0, min_temp_spread=1.0):
+    spec = {'name': 'temperature_'+str(degree)+'_'+str(temp_degree), 'kind': 'temperature', 'degree': degree,
+            'temp_degree': temp_degree, 't_ref': t_ref}
+    spec_no_temp = {'name': 'poly_'+str(degree), 'kind': 'polynomial', 'degree': degree}
+    keys = list(dict_of_data)
+    for key in keys:
+        if 'T [C]' not in dict_of_data[key].columns:
+            raise ValueError("data of '" + key + "' has no temperature column 'T [C]'")
+    list_of_y = [dict_of_data[key]['Q_mass_meas [uL/min]'].values for key in keys]
+    list_of_x_mat = [model_matrix(dict_of_data[key]['Q_sli [uL/min]'].values, spec,
+                                  temperature=dict_of_data[key]['T [C]'].values) for key in keys]
+    x_stack, y_stack, w = stack_groups(list_of_x_mat, list_of_y)
+    results = batched_ols(x_stack, y_stack, w)
+    aic, bic = information_criteria(results['sse'], results['n'], x_stack.shape[2])
+    cv_rmse = kfold_cv_rmse(x_stack, y_stack, w, k=k, seed=seed)
+
+    x_stack_no_temp, y_stack, w = stack_groups([model_matrix(dict_of_data[key]['Q_sli [uL/min]'].values, spec_no_temp)
+                                                for key in keys], list_of_y)
+    results_no_temp = batched_ols(x_stack_no_temp, y_stack, w)
+    aic_no_temp, bic_no_temp = information_criteria(results_no_temp['sse'], results_no_temp['n'], degree+1)
+    cv_rmse_no_temp = kfold_cv_rmse(x_stack_no_temp, y_stack, w, k=k, seed=seed)
+
+    #viscosities without the temperature information to fit the temperature terms fall back to the model without them
+    list_of_temps = [dict_of_data[key]['T [C]'].values for key in keys]
+    temp_spread = np.array([np.ptp(temps) if len(temps) > 0 else 0.0 for temps in list_of_temps])
+    num_temps = np.array([len(np.unique(temps)) for temps in list_of_temps])
+    identifiable = results['estimable'] & (temp_spread >= min_temp_spread) & (num_temps > temp_degree)
+    beta_hat = results['beta_hat'].copy()
+    cov_beta_hat = results['cov_beta_hat'].copy()
+    i_no_temp = np.arange(degree+1)*(temp_degree+1)
+    fallback = ~identifiable
+    beta_hat[fallback] = 0.0
+    beta_hat[np.ix_(fallback, i_no_temp)] = results_no_temp['beta_hat'][fallback]
+    cov_beta_hat[fallback] = 0.0
+    cov_beta_hat[np.ix_(fallback, i_no_temp, i_no_temp)] = results_no_temp['cov_beta_hat'][fallback]
+    return {'spec': spec, 'keys': keys, 'beta_hat': beta_hat, 'cov_beta_hat': cov_beta_hat,
+            'sse': np.where(identifiable, results['sse'], results_no_temp['sse']), 'n': results['n'].astype(int),
+            'r_squared': np.where(identifiable, results['r_squared'], results_no_temp['r_squared']),
+            'aic': np.where(identifiable, aic, aic_no_temp), 'bic': np.where(identifiable, bic, bic_no_temp),
+            'cv_rmse': np.where(identifiable, cv_rmse, cv_rmse_no_temp), 'cv_rmse_no_temp': cv_rmse_no_temp,
+            'temp_spread': temp_spread, 'temperature_identifiable': identifiable}
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
@@ -22,6 +22,8 @@ Q_mass_meas = Q from mass difference over time interval measurements
 u = uncertainty
 u_rel = relative uncertainty
 
+and T [C] (average temperature of each run) added if the files of flow_rate_meas_to_avg.py have it.
+
 This output .csv file is then to be used for plotting of Q_mass_meas = f(Q_sli) and for OLS estimation of an appropriate correction
 factor model for true flow rate measurements of a fluid that is not calibrated for a given sensiron flow meter.
 
@@ -113,6 +115,10 @@ for keys in dict_of_meas_df:
     df_combined['u_q_m [uL/min]'] = df_v_fr_from_m_fr['u_q_vl [uL/min]']
     df_combined['u_q_m_rel [%]'] = df_v_fr_from_m_fr['u_q_vl [uL/min]']/abs(df_v_fr_from_m_fr['Q [uL/min]'])*100
 
+    #adding average temperature of each run (for fit_temperature_model fn in correction_models.py)
+    if 'T [C]' in df_meas.columns:
+        df_combined['T [C]'] = df_meas['T [C]']
+
     #appending combined df to dict_of_combined_df
     dict_of_combined_df[keys] = df_combined
 
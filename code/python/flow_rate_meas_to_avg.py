@@ -9,6 +9,7 @@ is the flow rate data at a constant pressure (named pressure_mbar.csv, where pre
 
 [Pressure [mbar], # of Samples, Avg. Flow [uL/min], u_sli_o [uL/min], u_sli_1 [uL/min]] ; # of Samples = # of samples of flow rate takem, Avg.Flow = average of all flow rate measurements
 
+(with the average temperature of each run, T [C], added if the sensor export has a temperature column)
 for each viscosity case, in ./outputs/avg_flow_rate_from_meas/frcase/, where frcase = negative_q or positive_q.
 Program assumes that viscosities of the fluids are in cSt (like for silicone oil) and path for input file is of the form:
 
@@ -25,7 +26,7 @@ Dependencies:
 2. numpy
 3. pandas
 4. csv
-5. sensiron_first_order_uncertainty from functions.py
+5. sensiron_first_order_uncertainty, find_temperature_column from functions.py
 
 Notes:
     1. must specify flow case, and viscosity on each run (lines 47 and 50)
@@ -41,7 +42,7 @@ from pathlib import Path
 import numpy as np
 import pandas as pd
 import csv
-from functions import sensiron_zero_order_uncertainty, sensiron_first_order_uncertainty
+from functions import sensiron_zero_order_uncertainty, sensiron_first_order_uncertainty, find_temperature_column
 
 #specify flow case (negative_q or positive_q) (change on each run)
 flow_case = 'positive_q'
@@ -59,6 +60,9 @@ csv_paths = list(p.glob('./*.csv'))
 #create empty dictionary to hold edited csv data as dataframe, key-value pair: ['pressure_in_mbar': dataframe_for_given_pressure]
 dict_of_edited_csvs = {}
 
+#create empty dictionary to hold average temperature [C] of each run (only if the export has a temperature column)
+dict_of_avg_temp = {}
+
 for path in csv_paths:
     #converting path to string
     p_str = str(path)
@@ -100,6 +104,11 @@ for path in csv_paths:
     df['Relative Time[s]']=df['Relative Time[s]'].str.replace(',','').astype(float)
     df['Flow [ul/min]']=df['Flow [ul/min]'].astype(float)
 
+    #average temperature of run if sensor exports a temperature channel (see find_temperature_column fn in functions.py)
+    temp_column = find_temperature_column(df)
+    if temp_column is not None:
+        dict_of_avg_temp[key_title] = pd.to_numeric(df[temp_column], errors='coerce').mean()
+
     #add dataframe to dictionary
     dict_of_edited_csvs[key_title] = df
 
@@ -135,6 +144,10 @@ dict_of_avg_flow_w_u_1 =  sensiron_first_order_uncertainty(dict_of_edited_csvs,
 column_names = ['Pressure [mbar]', '# Samples', 'Avg. Flow [uL/min]','u_sli_o [uL/min]', 'u_sli_1 [uL/min]' ]
 avg_flow_df = pd.DataFrame.from_dict(dict_of_avg_flow_w_u_1, orient='index', columns=column_names)
 
+#adding average temperature of each run (used for density of fluid in mass_fr_to_vol_fr.py and temperature model)
+if len(dict_of_avg_temp) > 0:
+    avg_flow_df['T [C]'] = pd.Series(dict_of_avg_temp)
+
 #sorting avg_flow_df in ascending order
 avg_flow_df_sort = avg_flow_df.sort_values('Pressure [mbar]')
 
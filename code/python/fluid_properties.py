@@ -0,0 +1,120 @@
+"""
+Title: fluid_properties.py
+
+Summary:
+Temperature dependent density and kinematic viscosity of the calibration fluids (si oil), used to convert the mass flow
+rates of the mass balance to volume flow rates at the temperature of each measurement (instead of the fixed densities at
+25 C of mass_fr_to_vol_fr.py) and to evaluate the viscosity of the fluid at the temperature of each calibration point.
+
+Properties are given by a table of the form [T [C], rho [kg/m^3], nu [cSt]] for each fluid, linearly interpolated at
+the temperatures of the measurements. If no measured table is given (see read_property_table fn), the table is generated
+from the properties at 25 C (on bottle and sigma aldrich website) with
+
+rho(T) = rho_25/(1 + alpha*(T - 25))                         (volumetric thermal expansion coefficient alpha [1/K])
+nu(T) = nu_25*exp(b*(1/(T + 273.15) - 1/298.15))             (Arrhenius, b [K] from the viscosity temperature
+                                                              coefficient VTC = 1 - nu(99 C)/nu(38 C))
+
+Dependencies:
+1. Path from pathlib
+2. numpy
+3. pandas
+
+Notes:
+1. alpha and VTC of si_oil_properties are typical values of polydimethylsiloxane fluids, replace them (or use measured
+    tables) for better accuracy
+2. temperatures outside of the table are clipped to the ends of the table (np.interp)
+
+"""
+
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+#properties at 25 C of si oil for each viscosity, rho_25 [kg/m^3], nu_25 [cSt], alpha [1/K], vtc
+si_oil_properties = {'5_cSt': {'rho_25': 913, 'nu_25': 5.0, 'alpha': 1.05e-3, 'vtc': 0.55},
+                     '10_cSt': {'rho_25': 930, 'nu_25': 10.0, 'alpha': 1.08e-3, 'vtc': 0.56},
+                     '20_cSt': {'rho_25': 950, 'nu_25': 20.0, 'alpha': 1.07e-3, 'vtc': 0.59},
+                     '50_cSt': {'rho_25': 960, 'nu_25': 50.0, 'alpha': 1.04e-3, 'vtc': 0.59},
+                     '100_cSt': {'rho_25': 960, 'nu_25': 100.0, 'alpha': 9.6e-4, 'vtc': 0.60}}
+
+#temperatures [C] of the generated tables
+table_temperatures = np.arange(5.0, 50.5, 0.5)
+
+
+"""
+Function: property_table(fluid_key, temperatures=None)
+
+Summary:
+Function generates the table [T [C], rho [kg/m^3], nu [cSt]] of a fluid of si_oil_properties (e.g. '5_cSt') at the given
+temperatures [C] (table_temperatures if None).
+
+"""
+
+def property_table(fluid_key, temperatures=None):
+    if fluid_key not in si_oil_properties:
+        raise ValueError("no properties for fluid '" + str(fluid_key) + "'")
+    props = si_oil_properties[fluid_key]
+    temperatures = table_temperatures if temperatures is None else np.asarray(temperatures, dtype=float)
+    t_kelvin = temperatures + 273.15
+    b = np.log(1-props['vtc'])/(1/(99+273.15) - 1/(38+273.15))
+    rho = props['rho_25']/(1 + props['alpha']*(temperatures - 25))
+    nu = props['nu_25']*np.exp(b*(1/t_kelvin - 1/298.15))
+    return pd.DataFrame({'T [C]': temperatures, 'rho [kg/m^3]': rho, 'nu [cSt]': nu})
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: read_property_table(path)
+
+Summary:
+Function reads a measured property table of a fluid from a .csv file with columns T [C], rho [kg/m^3] and nu [cSt] and
+outputs it sorted in ascending order of temperature (to be passed as table to density and kinematic_viscosity fns).
+
+"""
+
+def read_property_table(path):
+    df = pd.read_csv(Path(path))
+    return df[['T [C]', 'rho [kg/m^3]', 'nu [cSt]']].sort_values('T [C]').reset_index(drop=True)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: density(fluid_key, temperature, table=None)
+
+Summary:
+Function outputs the density [kg/m^3] of a fluid at the given temperatures [C] (scalar or array), interpolated in table
+(see property_table and read_property_table fns, generated table of fluid_key if None).
+
+"""
+
+def density(fluid_key, temperature, table=None):
+    if table is None:
+        table = property_table(fluid_key)
+    return np.interp(temperature, table['T [C]'].values, table['rho [kg/m^3]'].values)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: kinematic_viscosity(fluid_key, temperature, table=None)
+
+Summary:
+Function outputs the kinematic viscosity [cSt] of a fluid at the given temperatures [C] (scalar or array), interpolated
+in table (see property_table and read_property_table fns, generated table of fluid_key if None). Interpolation is done
+on ln(nu), which is close to linear in temperature.
+
+"""
+
+def kinematic_viscosity(fluid_key, temperature, table=None):
+    if table is None:
+        table = property_table(fluid_key)
+    return np.exp(np.interp(temperature, table['T [C]'].values, np.log(table['nu [cSt]'].values)))
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
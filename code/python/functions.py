@@ -3,6 +3,114 @@ import pandas as pd
 import numpy as np
 import math as m
 
+"""
+Function: sensiron_specs(flow_meter='SLI-0430', bits=11)
+
+Summary:
+Function outputs a dictionary of the specifications of a given sensiron flow meter needed to calculate the uncertainty of
+its flow rate measurements, of the form
+
+{'full_scale': [uL/min], 'full_range': [uL/min], 'fs_acc': [uL/min], 'mv_acc_percent': fraction of measured value,
+ 'resolution': [uL/min], 'precision': [uL/min]}
+
+Inputs:
+1. flow_meter, type of sensiron flow meter used, currently only data for SLI-0430 is considered in fn
+2. bits, resolution at which the sampling of the data was done in the sensiron viewer software
+
+Notes:
+1. For new sensiron flow meters must add a new conditonal case for the accuracy, full-scale, full range, etc.
+
+"""
+
+def sensiron_specs(flow_meter='SLI-0430', bits=11):
+    if flow_meter == 'SLI-0430':
+        full_scale = 1000 #uL/min
+        full_range = 1200 #uL/min
+        fs_acc_percent = 0.01
+        mv_acc_percent = 0.20
+    else:
+        raise ValueError("no specifications for flow meter '" + str(flow_meter) + "'")
+    resolution = (full_range/(2**bits-1))
+    return {'full_scale': full_scale, 'full_range': full_range, 'fs_acc': fs_acc_percent*full_scale,
+            'mv_acc_percent': mv_acc_percent, 'resolution': resolution, 'precision': 0.5*resolution}
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: zero_order_uncertainty(flow, flow_meter='SLI-0430', bits=11, out=None)
+
+Summary:
+Function calculates the zeroth order uncertainty, u_sli_o [uL/min], of each flow rate measurement [uL/min] in flow
+(array, pandas series or any buffer/memoryview of floats) as an element-wise (ufunc style) numpy expression,
+
+u_sli_o = sqrt(max(|flow|*mv_acc_percent, fs_acc)^2 + precision^2)
+
+without modifying or copying the input. If out is given the result is written into it (e.g. a preallocated buffer that
+is reused for every chunk of a stream of samples), otherwise a new array is output.
+
+Inputs:
+1. flow, flow rate measurements [uL/min]
+2. flow_meter, type of sensiron flow meter used (see sensiron_specs fn)
+3. bits, resolution at which the sampling of the data was done in the sensiron viewer software
+4. out, optional float64 array of the same shape as flow to store the result in
+
+"""
+
+def zero_order_uncertainty(flow, flow_meter='SLI-0430', bits=11, out=None):
+    specs = sensiron_specs(flow_meter, bits)
+    flow = np.asarray(flow, dtype=float)
+    if out is None:
+        out = np.empty(flow.shape)
+    np.abs(flow, out=out)
+    np.multiply(out, specs['mv_acc_percent'], out=out)
+    np.maximum(out, specs['fs_acc'], out=out)
+    np.square(out, out=out)
+    np.add(out, specs['precision']**2, out=out)
+    return np.sqrt(out, out=out)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: iter_zero_order_uncertainty(dict_of_df, flow_meter='SLI-0430', bits=11, chunk_size=1000000)
+
+Summary:
+Function lazily calculates the zeroth order uncertainty of each flow rate measurement of a dictionary of dataframes
+(key-value pair {'pressure_in_mbar': dataframe_for_given_pressure}) of form:
+
+[Sample # Relative Time[s] Flow [ul/min]]
+
+chunk by chunk. It is a generator that yields tuples of the form (key, start, u_sli_o_chunk) where u_sli_o_chunk is the
+uncertainty [uL/min] of rows start to start+len(u_sli_o_chunk) of the dataframe at key. Only one chunk sized buffer is
+allocated (and reused for every chunk), so the per-sample uncertainty can be streamed, plotted or aggregated without
+being stored next to every raw sample and without modifying the input dataframes.
+
+Inputs:
+1. dict_of_df, dictionary of dataframes of the form [Sample # Relative Time[s] Flow [ul/min]]
+2. flow_meter, type of sensiron flow meter used (see sensiron_specs fn)
+3. bits, resolution at which the sampling of the data was done in the sensiron viewer software
+4. chunk_size, number of samples per chunk
+
+Notes:
+1. the yielded array is overwritten by the next chunk, copy it (np.copy) if it must be kept
+
+"""
+
+def iter_zero_order_uncertainty(dict_of_df, flow_meter='SLI-0430', bits=11, chunk_size=1000000):
+    buffer = np.empty(chunk_size)
+    for key in dict_of_df:
+        flow = dict_of_df[key]['Flow [ul/min]'].to_numpy()
+        for start in range(0, len(flow), chunk_size):
+            chunk = flow[start:start+chunk_size]
+            yield key, start, zero_order_uncertainty(chunk, flow_meter, bits, out=buffer[:len(chunk)])
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
 """
 Function: sensiron_zero_order_uncertatinty(dict_of_df,flow_meter='SLI-0430', bits =11)
 
@@ -13,9 +121,7 @@ Function intakes a dictionary of dataframes (key-value pair {'pressure_in_mbar':
 
 along with a given sensiron flow meter and the resolution at which the data was sampled to calculate the zeroth order
 uncertainty of each flow rate measurement obtained using the sensiron software and outputs a new dictionary of the form
-{'pressure_in_mbar': dataframe_for_given_pressure} with dataframes of the form 
-
-[Sample # Relative Time[s] Flow [ul/min] u_sli_o [uL/min]]
+{'pressure_in_mbar': u_sli_o} with u_sli_o the array of the uncertainty [uL/min] of each row of the dataframe
 
 Inputs:
 1. dict_of_df, dictionary of dataframes of the form [Sample # Relative Time[s] Flow [ul/min]]
@@ -23,38 +129,30 @@ Inputs:
 3. bits, resolution at which the sampling of the data was done in the sensiron viewer software
 
 Notes:
-1. For new sensiron flow meters must add a new conditonal case for the accuracy, full-scale, full range, etc. 
+1. For new sensiron flow meters must add a new conditonal case for the accuracy, full-scale, full range, etc. (see
+    sensiron_specs fn)
+2. The input dataframes are neither modified nor copied, only the uncertainty arrays are allocated (add them to a
+    dataframe with df['u_sli_o [uL/min]'] = u_sli_o if needed). For large runs use zero_order_uncertainty or
+    iter_zero_order_uncertainty instead, which calculate the uncertainty on demand without storing it next to every raw
+    sample.
 
 """
 
 def sensiron_zero_order_uncertainty(dict_of_df,flow_meter='SLI-0430', bits =11):
-    if flow_meter == 'SLI-0430':
-        full_scale = 1000 #uL/min
-        full_range = 1200 #uL/min
-        fs_acc_percent = 0.01
-        mv_acc_percent = 0.20
-    fs_acc = fs_acc_percent*full_scale
-    resolution = (full_range/(2**bits-1))
-    precision = 0.5*resolution
-
-    dict_of_df_w_zero_order_uncertainty ={}
+    dict_of_zero_order_uncertainty ={}
 
     for key in dict_of_df:
         df =dict_of_df[key]
-        flow = df['Flow [ul/min]'].values
-        flow_mv_acc = abs(flow*mv_acc_percent)
-        flow_acc = np.where(flow_mv_acc>fs_acc, flow_mv_acc,fs_acc)
-        u_sli_o = np.sqrt(np.square(flow_acc)+(precision)**2)
-        df['u_sli_o [uL/min]'] = u_sli_o
-        dict_of_df_w_zero_order_uncertainty[key] = df
-    return(dict_of_df_w_zero_order_uncertainty)
+        dict_of_zero_order_uncertainty[key] = zero_order_uncertainty(df['Flow [ul/min]'].values, flow_meter, bits)
+    return(dict_of_zero_order_uncertainty)
 
 '''
 ********************************************END OF FUNCTION************************************************************
 '''
 
 """
-Function: sensiron_first_order_uncertatinty(dict_of_df,flow_meter='SLI-0430', bits =11)
+Function: sensiron_first_order_uncertatinty(dict_of_df,flow_meter='SLI-0430', bits =11, quantized=False,
+                                             off_grid_tol=0.05)
 
 Summary:
 Function intakes a dictionary of dataframes (key-value pair {'pressure_in_mbar': dataframe_for_given_pressure}) of form:
@@ -71,26 +169,39 @@ Inputs:
 1. dict_of_df, dictionary of dataframes of the form [Sample # Relative Time[s] Flow [ul/min]]
 2. flow_meter, type of sensiron flow meter used, currently only data for SLI-0430 is considered in fn
 3. bits, resolution at which the sampling of the data was done in the sensiron viewer software
+4. quantized, if True the average and standard deviation are calculated exactly in integer arithmetic from the codes of
+    the flow rates (see histogram_moments fn), i.e. the Flow [code] column of read_sensirion_csv(..., codes=True) or the
+    flow rates converted to codes (a ValueError is raised if they are not on the code grid, see flow_to_codes fn)
+5. off_grid_tol, tolerance in codes of the check of the code grid (only used if quantized)
 
 Notes:
 1. For new sensiron flow meters must add a new conditonal case for the accuracy, full-scale, full range, etc. 
 
 """
 
-def sensiron_first_order_uncertainty(dict_of_df,flow_meter='SLI-0430', bits =11):
-    if flow_meter == 'SLI-0430':
-        full_scale = 1000 #uL/min
-        full_range = 1200 #uL/min
-        fs_acc_percent = 0.01
-        mv_acc_percent = 0.20
-    fs_acc = fs_acc_percent*full_scale
-    resolution = (full_range/(2**bits-1))
-    precision = 0.5*resolution
+def sensiron_first_order_uncertainty(dict_of_df,flow_meter='SLI-0430', bits =11, quantized=False, off_grid_tol=0.05):
+    specs = sensiron_specs(flow_meter, bits)
+    fs_acc = specs['fs_acc']
+    mv_acc_percent = specs['mv_acc_percent']
+    precision = specs['precision']
 
     dict_of_avg_flow_w_first_order_u = {}
     for key in dict_of_df:
         df =dict_of_df[key]
-        flow = df['Flow [ul/min]'].values
+
+        #integer statistics of the codes of the flow rates (see quantized_first_order_uncertainty fn)
+        if quantized:
+            if 'Flow [code]' in df.columns:
+                codes = df['Flow [code]'].values
+            else:
+                codes = flow_to_codes(df['Flow [ul/min]'].values, flow_meter, bits, off_grid_tol=off_grid_tol)
+            hist = code_histogram(codes, bits)
+            dict_of_avg_flow_w_first_order_u[key] = quantized_first_order_uncertainty(hist, key, flow_meter, bits)
+            continue
+        if 'Flow [ul/min]' in df.columns:
+            flow = df['Flow [ul/min]'].values
+        else:
+            flow = codes_to_flow(df['Flow [code]'].values, flow_meter, bits)
 
         #calculating average flow rate from measurements
         avg_flow = np.mean(flow)
@@ -119,3 +230,303 @@ def sensiron_first_order_uncertainty(dict_of_df,flow_meter='SLI-0430', bits =11)
 ********************************************END OF FUNCTION************************************************************
 '''
 
+
+"""
+Function: read_sensirion_csv(path, header_row=14, codes=False, flow_meter='SLI-0430', bits=11, off_grid_tol=0.05)
+
+Summary:
+Function intakes the path of a .csv file output by the sensiron flow viewer software (USB connection) and outputs a tuple
+of the form (df, header_lines), where df is a dataframe of the measurement data of the form
+
+[Sample # Relative Time[s] Flow [ul/min]]     ([Sample # Relative Time[s] Flow [code]] if codes)
+
+(with any additional columns of the export kept) and header_lines is the list of the lines of the file before the column
+names (sensor information, sampling settings, etc.).
+
+Inputs:
+1. path, path of the .csv file
+2. header_row, index of the row containing the column names (row 14 for the sensiron flow viewer export)
+3. codes, if True the flow rates are stored as int16 codes of the given flow meter and bits (Flow [code] column, see
+    flow_to_codes fn) instead of float64 flow rates, a ValueError is raised if the flow rates are not on the code grid
+4. flow_meter, bits, see sensiron_specs fn (only used if codes)
+5. off_grid_tol, tolerance in codes of the check of the code grid (see flow_to_codes fn)
+
+Notes:
+1. values of Relative Time[s] above 1000 are written with a thousands separator (e.g. "1,234.5") by the sensiron software
+2. with codes the flow rates take 2 instead of 8 bytes per sample, use codes_to_flow fn to get the flow rates back
+
+"""
+
+def read_sensirion_csv(path, header_row=14, codes=False, flow_meter='SLI-0430', bits=11, off_grid_tol=0.05):
+    #reading the lines before the column names
+    with open(path, newline='') as csvfile:
+        header_lines = [next(csvfile).rstrip('\r\n') for i in range(header_row)]
+
+    #reading measurement data
+    df = pd.read_csv(path, skiprows=header_row, header=0, thousands=',')
+    df = df.dropna(subset=['Sample #', 'Relative Time[s]', 'Flow [ul/min]'])
+
+    #convert columns to ints and floats
+    df['Sample #'] = df['Sample #'].astype(int)
+    df['Relative Time[s]'] = pd.to_numeric(df['Relative Time[s]'].astype(str).str.replace(',', ''))
+    df['Flow [ul/min]'] = df['Flow [ul/min]'].astype(float)
+    df = df.reset_index(drop=True)
+
+    #replacing flow rates by their int16 codes (refusing data that is not on the code grid)
+    if codes:
+        try:
+            flow_codes = flow_to_codes(df['Flow [ul/min]'].values, flow_meter, bits, off_grid_tol=off_grid_tol)
+        except ValueError as e:
+            raise ValueError(str(path) + ': ' + str(e))
+        df.insert(df.columns.get_loc('Flow [ul/min]'), 'Flow [code]', flow_codes)
+        df = df.drop(columns=['Flow [ul/min]'])
+    return df, header_lines
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: find_temperature_column(df)
+
+Summary:
+Function outputs the name of the temperature column of a dataframe read by read_sensirion_csv (sensors with a
+temperature channel export it next to the flow rate, e.g. 'Temperature [C]'), i.e. the first column whose name starts with 'temp'
+(not case sensitive), or None if the export has no temperature column.
+
+"""
+
+def find_temperature_column(df):
+    for column in df.columns:
+        if str(column).strip().lower().startswith('temp'):
+            return column
+    return None
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: steady_state_window(flow, window=None, tol=None, flow_meter='SLI-0430', bits=11)
+
+Summary:
+Function determines the steady state portion of a run at constant pressure from its flow rate measurements [uL/min] and
+outputs the tuple (i_start, i_end) of indices such that flow[i_start:i_end] is at steady state. The rolling mean of the flow
+over window samples is compared to the mean of the last half of the run, and i_start is the first sample after which the
+rolling mean stays within tol of it for the rest of the run.
+
+Inputs:
+1. flow, flow rate measurements [uL/min]
+2. window, number of samples of the rolling mean (1% of the run, minimum 10, if None)
+3. tol, tolerance [uL/min] (zeroth order uncertainty of the final mean flow rate if None, see zero_order_uncertainty fn)
+4. flow_meter, bits, see sensiron_specs fn
+
+"""
+
+def steady_state_window(flow, window=None, tol=None, flow_meter='SLI-0430', bits=11):
+    flow = np.asarray(flow, dtype=float)
+    n = len(flow)
+    if window is None:
+        window = max(10, n//100)
+    window = min(window, n)
+    final_mean = np.mean(flow[n//2:])
+    if tol is None:
+        tol = float(zero_order_uncertainty(final_mean, flow_meter, bits))
+
+    #rolling mean of each window (rolling_mean[i] = mean of flow[i:i+window])
+    cumsum = np.concatenate(([0.0], np.cumsum(flow)))
+    rolling_mean = (cumsum[window:]-cumsum[:-window])/window
+
+    #largest deviation from final mean of the rolling mean from each window to the end of the run
+    deviation = np.abs(rolling_mean-final_mean)
+    max_deviation_to_end = np.maximum.accumulate(deviation[::-1])[::-1]
+    within_tol = np.nonzero(max_deviation_to_end <= tol)[0]
+    i_start = int(within_tol[0]) if len(within_tol) > 0 else 0
+    return i_start, n
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: flow_to_codes(flow, flow_meter='SLI-0430', bits=11, off_grid_tol=None)
+
+Summary:
+Function converts flow rate measurements [uL/min] to the integer codes of the analog to digital conversion of the sensor,
+code = round(flow/resolution), where resolution = full_range/(2^bits-1) [uL/min] (see sensiron_specs fn), and outputs
+them as an int16 array (a quarter of the memory of the float64 flow rates). The flow rate of a code is code*resolution
+(see codes_to_flow fn).
+
+Inputs:
+1. flow, flow rate measurements [uL/min]
+2. flow_meter, type of sensiron flow meter used (see sensiron_specs fn)
+3. bits, resolution at which the sampling of the data was done in the sensiron viewer software
+4. off_grid_tol, if given a ValueError is raised when any flow rate is further than off_grid_tol codes from a code
+    (data not sampled at the given bits or rescaled, rounding it to codes would bias the average), see
+    quantization_report fn
+
+Notes:
+1. flow rates are signed, so codes are in -(2^bits-1) to 2^bits-1, which fits in int16 for bits <= 15
+2. flow rates outside of +/- full_range are clipped to the largest code (the sensor saturates there)
+
+"""
+
+def flow_to_codes(flow, flow_meter='SLI-0430', bits=11, off_grid_tol=None):
+    if bits > 15:
+        raise ValueError('codes of ' + str(bits) + ' bit sampling do not fit in int16')
+    specs = sensiron_specs(flow_meter, bits)
+    max_code = 2**bits-1
+    scaled = np.asarray(flow, dtype=float)/specs['resolution']
+    codes = np.rint(scaled)
+    if off_grid_tol is not None:
+        off_grid = np.abs(scaled-codes) > off_grid_tol
+        if np.any(off_grid):
+            max_off_grid = quantization_report(flow, flow_meter, bits, off_grid_tol)['max_off_grid [codes]']
+            raise ValueError(str(int(np.sum(off_grid))) + ' of ' + str(len(scaled)) + ' flow rates are not on the code '
+                             'grid of ' + str(bits) + ' bit sampling (max. ' + str(round(max_off_grid, 3)) +
+                             ' codes off), check bits or use the flow rates without quantization')
+    return np.clip(codes, -max_code, max_code).astype(np.int16)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: codes_to_flow(codes, flow_meter='SLI-0430', bits=11)
+
+Summary:
+Function converts integer codes (see flow_to_codes fn) back to flow rates [uL/min], flow = code*resolution.
+
+"""
+
+def codes_to_flow(codes, flow_meter='SLI-0430', bits=11):
+    return np.asarray(codes, dtype=float)*sensiron_specs(flow_meter, bits)['resolution']
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: code_histogram(codes, bits=11)
+
+Summary:
+Function counts the number of samples of each code and outputs the histogram as an int64 array of length 2*(2^bits-1)+1,
+where hist[code + 2^bits-1] is the number of samples with the given code. Histograms of parts of a run (chunks of a
+stream, files read by parallel workers, etc.) are merged exactly by adding them (see merge_code_histograms fn).
+
+"""
+
+def code_histogram(codes, bits=11):
+    max_code = 2**bits-1
+    return np.bincount(np.asarray(codes, dtype=np.int64)+max_code, minlength=2*max_code+1).astype(np.int64)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: merge_code_histograms(list_of_hist)
+
+Summary:
+Function merges histograms of codes (see code_histogram fn) of the same bits by adding them in integer arithmetic, so
+the result does not depend on the order or the number of parts.
+
+"""
+
+def merge_code_histograms(list_of_hist):
+    merged = np.zeros_like(list_of_hist[0])
+    for hist in list_of_hist:
+        merged += hist
+    return merged
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: histogram_moments(hist, flow_meter='SLI-0430', bits=11)
+
+Summary:
+Function calculates the number of samples, mean [uL/min] and sample standard deviation [uL/min] of the flow rates of a
+histogram of codes (see code_histogram fn) and outputs the tuple (num_samples, avg_flow, std_dev). The count, sum and
+sum of squares of the codes are accumulated as python integers (no rounding error or overflow), so
+
+avg_flow = resolution*S_1/n,    std_dev = resolution*sqrt((n*S_2 - S_1^2)/(n*(n-1)))
+
+are exact up to the final division, and equal for any split of the samples into merged histograms.
+
+"""
+
+def histogram_moments(hist, flow_meter='SLI-0430', bits=11):
+    resolution = sensiron_specs(flow_meter, bits)['resolution']
+    max_code = 2**bits-1
+    nonzero = np.nonzero(hist)[0]
+    counts = [int(c) for c in hist[nonzero]]
+    values = [int(i)-max_code for i in nonzero]
+    n = sum(counts)
+    s_1 = sum(c*v for c, v in zip(counts, values))
+    s_2 = sum(c*v*v for c, v in zip(counts, values))
+    avg_flow = resolution*s_1/n
+    std_dev = resolution*m.sqrt((n*s_2 - s_1*s_1)/(n*(n-1))) if n > 1 else float('nan')
+    return n, avg_flow, std_dev
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: quantized_first_order_uncertainty(hist, key, flow_meter='SLI-0430', bits=11)
+
+Summary:
+Function calculates the first order uncertainty of the average flow rate of a run from the histogram of its codes (see
+code_histogram fn) and outputs a list of the form (as sensiron_first_order_uncertainty fn)
+
+[Pressure [mbar], # of Samples, Avg. Flow [uL/min], u_sli_o [uL/min], u_sli_1 [uL/min]]
+
+"""
+
+def quantized_first_order_uncertainty(hist, key, flow_meter='SLI-0430', bits=11):
+    num_samples, avg_flow, std_dev = histogram_moments(hist, flow_meter, bits)
+    u_sli_o = float(zero_order_uncertainty(avg_flow, flow_meter, bits))
+    u_sli_t = (2*std_dev)/m.sqrt(num_samples)
+    u_sli_1 = m.sqrt((u_sli_o**2)+(u_sli_t**2))
+    return [int(key), num_samples, avg_flow, u_sli_o, u_sli_1]
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: quantization_report(flow, flow_meter='SLI-0430', bits=11, off_grid_tol=0.05)
+
+Summary:
+Function checks the flow rate measurements [uL/min] of a run for quantization artifacts and outputs a dictionary of the
+form
+
+{'# Samples', 'resolution [uL/min]', 'off_grid_fraction': fraction of samples further than off_grid_tol*resolution from
+ a code (data not sampled at the given bits or rescaled), 'max_off_grid [codes]', '# Codes Used', 'missing_codes':
+ number of codes between the smallest and largest code with no samples (missing codes of the converter), 'max_code_fraction':
+ fraction of samples at the most common code (stuck output), 'std_dev [codes]': standard deviation of the codes (below
+ ~0.5 the standard deviation, and so u_sli_1, is dominated by quantization), 'saturated_fraction': fraction of samples
+ at the largest code}
+
+"""
+
+def quantization_report(flow, flow_meter='SLI-0430', bits=11, off_grid_tol=0.05):
+    flow = np.asarray(flow, dtype=float)
+    resolution = sensiron_specs(flow_meter, bits)['resolution']
+    max_code = 2**bits-1
+    codes = flow_to_codes(flow, flow_meter, bits)
+    off_grid = np.abs(flow/resolution - codes)
+    hist = code_histogram(codes, bits)
+    used = np.nonzero(hist)[0]
+    num_samples, avg_flow, std_dev = histogram_moments(hist, flow_meter, bits)
+    return {'# Samples': num_samples, 'resolution [uL/min]': resolution,
+            'off_grid_fraction': np.mean(off_grid > off_grid_tol), 'max_off_grid [codes]': np.max(off_grid),
+            '# Codes Used': len(used), 'missing_codes': int(used[-1]-used[0]+1-len(used)),
+            'max_code_fraction': hist.max()/num_samples, 'std_dev [codes]': std_dev/resolution,
+            'saturated_fraction': np.mean(np.abs(codes) == max_code)}
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
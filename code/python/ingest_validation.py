@@ -0,0 +1,386 @@
+"""
+Title: ingest_validation.py
+
+Summary:
+Checks every raw input file of a campaign before any processing, so that a malformed batch is rejected in seconds with a
+list of all of its problems instead of failing deep inside the pipeline (or giving silently misaligned results). Files
+are expected in the layout of watch_pipeline.py:
+
+flow_rate_measurements/flow_case/visc_(visc)_cSt/(pressure)_mbar.csv     (sensiron flow viewer export)
+mass_balance_measurements/flow_case/visc_(visc)_cSt_mass_(n or p)_q.csv  (mass balance measurements)
+
+Checks of each sensor file (vectorized over the rows with numpy/pandas):
+1. name, pressure of the file name is an integer
+2. header, column names on row header_row (14) with the columns Sample #, Relative Time[s] and Flow [ul/min]
+3. dtype, every value of the columns is numeric (Sample # an integer)
+4. nan, no missing values (rows with every value missing and trailing rows with missing values, e.g. the last row of a
+    file that is still being written, are accepted since read_sensirion_csv fn in functions.py drops them)
+5. monotonic, Sample # and Relative Time[s] strictly increasing
+
+Checks of each mass balance file:
+1. header, columns P [mbar], Measurement Time [s], M_i [g] and M_f [g]
+2. dtype, nan, as above, and Measurement Time [s] > 0
+3. duplicate, no pressure measured twice
+4. order, pressures in ascending order (rows are matched by position to the sensor averages sorted by pressure, see
+    combine_sensor_and_mass fn in pipeline_stages.py)
+
+Checks across files of each flow case and viscosity:
+1. duplicate, no two sensor files of the same pressure and no two mass balance files
+2. counterpart, the pressures of the sensor files and of the mass balance file are the same, and (if
+    require_counterparts) every set of sensor files has a mass balance file and vice versa
+
+Files are checked in parallel worker processes. Problems are output as a dataframe of the form
+[File, Check, Rows, Message], where Rows is the number of rows affected (0 for problems of the whole file).
+
+Dependencies:
+1. Path from pathlib
+2. time
+3. concurrent.futures
+4. numpy
+5. pandas
+
+Notes:
+1. set validate = True in watch_pipeline.py to check new and changed files before every recalculation (groups of files
+    with problems are skipped until fixed)
+2. checks of missing counterparts are optional since during a campaign the mass balance file is often written after
+    the sensor files
+
+"""
+
+from pathlib import Path
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+sensor_columns = ['Sample #', 'Relative Time[s]', 'Flow [ul/min]']
+mass_columns = ['P [mbar]', 'Measurement Time [s]', 'M_i [g]', 'M_f [g]']
+problem_columns = ['File', 'Check', 'Rows', 'Message']
+
+
+"""
+Function: list_input_files(data_dir)
+
+Summary:
+Function outputs the sorted list of the paths (relative to data_dir, e.g. ../../data/si_oil/) of the sensor and mass
+balance files of a campaign, see summary.
+
+"""
+
+def list_input_files(data_dir):
+    data_dir = Path(data_dir)
+    list_of_paths = list(data_dir.glob('flow_rate_measurements/*/visc_*/*_mbar.csv'))
+    list_of_paths += list(data_dir.glob('mass_balance_measurements/*/visc_*_mass_*.csv'))
+    return sorted(path.relative_to(data_dir).as_posix() for path in list_of_paths)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: check_numeric_columns(df, columns, rel_path, integer_columns=(), accept_dropped=False)
+
+Summary:
+Function checks that every value of the given columns of a dataframe is numeric (and an integer for integer_columns) and
+not missing, and outputs the tuple (dict_of_values, list_of_problems) where dict_of_values is {column: float array}
+(NaN for missing or non numeric values). If accept_dropped, rows with every value missing and rows with missing values
+after the last complete row are not reported (read_sensirion_csv fn in functions.py drops them, mass balance files are
+read as they are).
+
+"""
+
+def check_numeric_columns(df, columns, rel_path, integer_columns=(), accept_dropped=False):
+    dict_of_values = {}
+    list_of_problems = []
+
+    #rows dropped by the reader, every value missing or after the last complete row
+    missing_table = df[columns].isna().values
+    dropped = np.zeros(len(df), dtype=bool)
+    if accept_dropped:
+        complete = np.nonzero(~np.any(missing_table, axis=1))[0]
+        last_complete = complete[-1] if len(complete) > 0 else -1
+        dropped = np.all(missing_table, axis=1) | (np.arange(len(df)) > last_complete)
+
+    for column in columns:
+        raw = df[column]
+        missing = raw.isna().values & ~dropped
+        if pd.api.types.is_numeric_dtype(raw):
+            values = raw.values.astype(float)
+        else:
+            values = pd.to_numeric(raw.astype(str).str.replace(',', ''), errors='coerce').values
+        values = np.where(dropped, np.nan, values)
+        bad = np.isnan(values) & ~raw.isna().values & ~dropped
+        if column in integer_columns:
+            bad |= ~np.isnan(values) & (values != np.round(values))
+        if np.any(bad):
+            list_of_problems.append([rel_path, 'dtype', int(np.sum(bad)), column + ' has non numeric values, first ' +
+                                     'on data row ' + str(int(np.argmax(bad)))])
+        if np.any(missing):
+            list_of_problems.append([rel_path, 'nan', int(np.sum(missing)), column + ' has missing values, first on ' +
+                                     'data row ' + str(int(np.argmax(missing)))])
+        dict_of_values[column] = values
+    return dict_of_values, list_of_problems
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: validate_sensor_file(data_dir, rel_path, header_row=14)
+
+Summary:
+Function checks a sensiron flow viewer .csv file (see summary) and outputs the tuple (pressure, list_of_problems), where
+pressure is the pressure [mbar] of the file name (None if not an integer) and list_of_problems is a list of rows
+[File, Check, Rows, Message].
+
+"""
+
+def validate_sensor_file(data_dir, rel_path, header_row=14):
+    path = Path(data_dir) / rel_path
+    list_of_problems = []
+    try:
+        pressure = int(path.name.replace('_mbar.csv', ''))
+    except ValueError:
+        pressure = None
+        list_of_problems.append([rel_path, 'name', 0, 'pressure of file name is not an integer'])
+
+    #column names must be on row header_row, look for them on other rows to report where they are
+    with open(path, newline='') as csvfile:
+        lines = [[name.strip().strip('"') for name in line.rstrip('\r\n').split(',')]
+                 for i, line in zip(range(header_row + 50), csvfile)]
+    if len(lines) <= header_row or not all(column in lines[header_row] for column in sensor_columns):
+        rows = [i for i, line in enumerate(lines) if all(column in line for column in sensor_columns)]
+        if rows:
+            message = 'column names on row ' + str(rows[0]) + ' instead of row ' + str(header_row)
+        else:
+            message = 'columns ' + ', '.join(sensor_columns) + ' not found'
+        list_of_problems.append([rel_path, 'header', 0, message])
+        return pressure, list_of_problems
+
+    df = pd.read_csv(path, skiprows=header_row, header=0, thousands=',')
+    if len(df) == 0:
+        list_of_problems.append([rel_path, 'nan', 0, 'no measurements'])
+        return pressure, list_of_problems
+    dict_of_values, list_of_dtype_problems = check_numeric_columns(df, sensor_columns, rel_path,
+                                                                   integer_columns=['Sample #'], accept_dropped=True)
+    list_of_problems += list_of_dtype_problems
+
+    #strictly increasing sample numbers and times (comparisons with NaN are False, so missing values are not counted)
+    for column in ['Sample #', 'Relative Time[s]']:
+        not_increasing = np.diff(dict_of_values[column]) <= 0
+        if np.any(not_increasing):
+            list_of_problems.append([rel_path, 'monotonic', int(np.sum(not_increasing)), column + ' not increasing, ' +
+                                     'first on data row ' + str(int(np.argmax(not_increasing)) + 1)])
+    return pressure, list_of_problems
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: validate_mass_file(data_dir, rel_path)
+
+Summary:
+Function checks a mass balance .csv file (see summary) and outputs the tuple (pressures, list_of_problems), where
+pressures is the list of pressures [mbar] of the file (None if they can not be read) and list_of_problems is a list of
+rows [File, Check, Rows, Message].
+
+"""
+
+def validate_mass_file(data_dir, rel_path):
+    df = pd.read_csv(Path(data_dir) / rel_path)
+    missing_columns = [column for column in mass_columns if column not in df.columns]
+    if missing_columns:
+        return None, [[rel_path, 'header', 0, 'columns ' + ', '.join(missing_columns) + ' not found']]
+    if len(df) == 0:
+        return None, [[rel_path, 'nan', 0, 'no measurements']]
+
+    dict_of_values, list_of_problems = check_numeric_columns(df, mass_columns, rel_path)
+    time_not_positive = dict_of_values['Measurement Time [s]'] <= 0
+    if np.any(time_not_positive):
+        list_of_problems.append([rel_path, 'dtype', int(np.sum(time_not_positive)),
+                                 'Measurement Time [s] not positive'])
+
+    pressures = dict_of_values['P [mbar]']
+    pressures = pressures[~np.isnan(pressures)]
+    unique_pressures, counts = np.unique(pressures, return_counts=True)
+    if np.any(counts > 1):
+        list_of_problems.append([rel_path, 'duplicate', int(np.sum(counts[counts > 1])), 'pressures measured more ' +
+                                 'than once: ' + ', '.join('%g' % p for p in unique_pressures[counts > 1])])
+    if np.any(np.diff(pressures) < 0):
+        list_of_problems.append([rel_path, 'order', int(np.sum(np.diff(pressures) < 0)), 'pressures not in ascending ' +
+                                 'order, rows are matched by position to the sensor averages'])
+    return pressures.tolist(), list_of_problems
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: validate_file(task)
+
+Summary:
+Function checks a single input file, task is of the form (data_dir, rel_path, header_row). Outputs the tuple
+(rel_path, pressures, list_of_problems), see validate_sensor_file and validate_mass_file fns. Files that can not be read
+at all are reported as a 'read' problem.
+
+"""
+
+def validate_file(task):
+    data_dir, rel_path, header_row = task
+    try:
+        if rel_path.startswith('flow_rate_measurements'):
+            pressure, list_of_problems = validate_sensor_file(data_dir, rel_path, header_row)
+            return rel_path, pressure, list_of_problems
+        pressures, list_of_problems = validate_mass_file(data_dir, rel_path)
+        return rel_path, pressures, list_of_problems
+    except (OSError, UnicodeDecodeError, pd.errors.ParserError, pd.errors.EmptyDataError) as e:
+        return rel_path, None, [[rel_path, 'read', 0, type(e).__name__ + ': ' + str(e).strip()]]
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: file_group(rel_path)
+
+Summary:
+Function outputs the flow case and viscosity of an input file (see summary), e.g. 'positive_q/5_cSt' for
+flow_rate_measurements/positive_q/visc_5_cSt/100_mbar.csv, i.e. the group of the file in the cross checks. Names that
+are not input file paths (File of the problems of the cross checks) are output unchanged.
+
+"""
+
+def file_group(rel_path):
+    parts = Path(rel_path).as_posix().split('/')
+    if parts[0] == 'flow_rate_measurements' and len(parts) > 2:
+        return parts[1] + '/' + parts[2].replace('visc_', '')
+    if parts[0] == 'mass_balance_measurements' and len(parts) > 2:
+        return parts[1] + '/' + parts[2].replace('visc_', '').split('_mass_')[0]
+    return rel_path
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: cross_check(dict_of_pressures, require_counterparts=True)
+
+Summary:
+Function checks the sensor and mass balance files of each flow case and viscosity against each other (see summary) from
+a dictionary of the form {rel_path: pressures} (pressure of each sensor file, list of pressures of each mass balance
+file, None if unknown) and outputs a list of rows [File, Check, Rows, Message].
+
+"""
+
+def cross_check(dict_of_pressures, require_counterparts=True):
+    #grouping files by flow case and viscosity, e.g. positive_q/5_cSt
+    groups = {}
+    for rel_path, pressures in dict_of_pressures.items():
+        group = groups.setdefault(file_group(rel_path), {'sensor': {}, 'mass': {}})
+        if rel_path.startswith('flow_rate_measurements'):
+            group['sensor'][rel_path] = pressures
+        else:
+            group['mass'][rel_path] = pressures
+
+    list_of_problems = []
+    for name in sorted(groups):
+        sensor, mass = groups[name]['sensor'], groups[name]['mass']
+        sensor_pressures = [p for p in sensor.values() if p is not None]
+        unique_pressures, counts = np.unique(sensor_pressures, return_counts=True)
+        if np.any(counts > 1):
+            list_of_problems.append([name, 'duplicate', int(np.sum(counts[counts > 1])), 'sensor files of the same ' +
+                                     'pressure: ' + ', '.join(str(p) for p in unique_pressures[counts > 1])])
+        if len(mass) > 1:
+            list_of_problems.append([name, 'duplicate', len(mass), 'more than one mass balance file: ' +
+                                     ', '.join(sorted(mass))])
+        if require_counterparts and not sensor:
+            list_of_problems.append([name, 'counterpart', 0, 'mass balance file without sensor files'])
+        if require_counterparts and not mass:
+            list_of_problems.append([name, 'counterpart', 0, 'sensor files without mass balance file'])
+        if not sensor or not mass:
+            continue
+
+        #pressures of the sensor files and of the mass balance file must match one to one
+        mass_path = sorted(mass)[0]
+        if mass[mass_path] is None:
+            continue
+        missing_mass = sorted(set(sensor_pressures) - set(mass[mass_path]))
+        missing_sensor = sorted(set(mass[mass_path]) - set(sensor_pressures))
+        if missing_mass:
+            list_of_problems.append([name, 'counterpart', len(missing_mass), 'pressures without mass balance ' +
+                                     'measurement: ' + ', '.join(str(p) for p in missing_mass)])
+        if missing_sensor:
+            list_of_problems.append([name, 'counterpart', len(missing_sensor), 'pressures without sensor file: ' +
+                                     ', '.join(str(p) for p in missing_sensor)])
+    return list_of_problems
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: validate_inputs(data_dir, rel_paths=None, header_row=14, require_counterparts=True, max_workers=None)
+
+Summary:
+Function checks the input files of a campaign (see summary) in parallel and outputs a dataframe of every problem found,
+of the form [File, Check, Rows, Message] (empty if every file is valid).
+
+Inputs:
+1. data_dir, folder of the raw data (e.g. ../../data/si_oil/)
+2. rel_paths, paths of the sensor files to check relative to data_dir (every file if None), mass balance files are
+    always checked since the cross checks need their pressures
+3. header_row, index of the row of the column names of the sensor files (see read_sensirion_csv fn in functions.py)
+4. require_counterparts, report sets of sensor files without mass balance file and vice versa
+5. max_workers, number of worker processes (number of cpus if None, checked in this process if 1)
+
+"""
+
+def validate_inputs(data_dir, rel_paths=None, header_row=14, require_counterparts=True, max_workers=None):
+    all_paths = list_input_files(data_dir)
+    if rel_paths is None:
+        rel_paths = all_paths
+    rel_paths = sorted(set(Path(rel_path).as_posix() for rel_path in rel_paths) |
+                       set(rel_path for rel_path in all_paths if rel_path.startswith('mass_balance_measurements')))
+    tasks = [(str(data_dir), rel_path, header_row) for rel_path in rel_paths]
+
+    if max_workers == 1 or len(tasks) < 2:
+        results = [validate_file(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(validate_file, tasks, chunksize=max(1, len(tasks)//64)))
+
+    list_of_problems = []
+    dict_of_pressures = {}
+    for rel_path, pressures, list_of_file_problems in results:
+        list_of_problems += list_of_file_problems
+        dict_of_pressures[rel_path] = pressures
+
+    #cross checks use the pressure of every sensor file of data_dir (from its name)
+    for rel_path in all_paths:
+        if rel_path not in dict_of_pressures:
+            try:
+                dict_of_pressures[rel_path] = int(Path(rel_path).name.replace('_mbar.csv', ''))
+            except ValueError:
+                dict_of_pressures[rel_path] = None
+    list_of_problems += cross_check(dict_of_pressures, require_counterparts)
+    return pd.DataFrame(list_of_problems, columns=problem_columns)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+if __name__ == '__main__':
+    #input path of folder of raw data
+    data_dir = Path('../../data/si_oil/')
+
+    t_start = time.perf_counter()
+    df_problems = validate_inputs(data_dir)
+    t_check = time.perf_counter()-t_start
+    num_files = len(list_input_files(data_dir))
+    if len(df_problems) == 0:
+        print(str(num_files) + ' files checked in ' + str(round(t_check, 3)) + ' s, no problems found')
+    else:
+        print(df_problems.to_string(index=False))
+        print(str(len(df_problems)) + ' problems in ' + str(num_files) + ' files (checked in ' +
+              str(round(t_check, 3)) + ' s)')
@@ -0,0 +1,509 @@
+"""
+Title: lut_export.py
+
+Summary:
+Exports the fitted correction of every viscosity as dense lookup tables (LUT) for controllers that cannot evaluate the
+correction model, together with error bounds and the inverse mapping used for set-point control:
+
+1. forward table, raw sensor code -> corrected flow rate Q_actual [uL/min], for every code of the sensor
+    (code = round(Q_sli/resolution), -(2^bits-1) to 2^bits-1, see flow_to_codes fn in functions.py)
+2. error bound table, half width of the confidence interval of the corrected flow rate of each code [uL/min],
+    t*sqrt(f^T*cov_beta_hat*f) with f the row of the model matrix of the code (see correction_models.py), plus the
+    estimated interpolation error for interpolated viscosities and the rounding error of fixed point values
+3. inverse table, target flow rate -> raw code at which the sensor reads the target (target flow rates on the same
+    grid as the codes, target = index*resolution), so that a controller can compare the raw sensor output to the code of
+    its set-point
+
+Tables are generated for the calibrated viscosities and, optionally, for other viscosities in between, where the
+corrected flow rate and error bound of each code are linearly interpolated in ln(viscosity) between the two closest
+calibrated viscosities (as the global model of correction_models.py). The interpolation error is estimated by leaving
+out each inner calibrated viscosity and interpolating it from its neighbours (at least 3 calibrated viscosities are
+needed to interpolate). The calibrated code range of each viscosity (codes of the Q_sli range of its calibration points)
+is stored with the tables, corrected flow rates outside of it are extrapolations of the fit. Tables are written as
+
+1. binary (.bin), little endian, of the form
+    [magic 'SLILUT02' (8 bytes)][bits, num_visc, num_codes, value_type (int32 each)][scale (float64)]
+    [viscosities (float32 x num_visc)][calibrated code range (int16 x num_visc x 2, min and max code)]
+    [forward (num_visc x num_codes)][bound (num_visc x num_codes)][inverse (int16 x num_visc x num_codes)]
+    where value_type 0 is float32 values and 1 is int16 fixed point values (value = int16*scale [uL/min])
+2. C header (.h) with the same arrays as const arrays and the code offset
+3. .csv (one row per viscosity and code)
+
+Dependencies:
+1. Path from pathlib
+2. struct
+3. time
+4. numpy
+5. pandas
+6. scipy.stats
+7. functions.py
+8. correction_models.py
+
+Notes:
+1. index of code c in a table is c + 2^bits - 1
+2. the interpolation error estimate is taken over twice the spacing of the calibrated viscosities and includes the
+    scatter of three fits, it is usually conservative but is not a confidence bound, calibrate the viscosities used most
+    often (see the leave-one-viscosity-out check of verify_lut fn)
+3. with fixed point values the rounding error (scale/2) is added to the error bound before it is rounded up to the
+    scale, see quantize_bound fn
+4. codes outside of the calibrated code range are not clamped, controllers should check the range
+
+"""
+
+from pathlib import Path
+import struct
+import time
+import numpy as np
+import pandas as pd
+from scipy import stats
+from functions import sensiron_specs
+from correction_models import read_correction_data, viscosity_from_key, model_matrix, stack_groups, batched_ols
+
+lut_magic = b'SLILUT02'
+
+
+"""
+Function: fit_for_lut(dict_of_data, spec=None, confidence=0.95)
+
+Summary:
+Function fits the model spec to every viscosity of a dictionary of dataframes of the form {'visc_cSt': df} (see
+read_correction_data fn in correction_models.py) at once and outputs a dictionary of the form
+
+{'spec', 'viscosity': (G), 'beta_hat': (G x M), 'cov_beta_hat': (G x M x M), 't_crit': (G), 'q_sli_range': (G x 2)}
+
+where t_crit is the t quantile of the confidence level of each fit (as fit_linear_correction fn in pipeline_stages.py)
+and q_sli_range is the min and max Q_sli [uL/min] of the calibration points of each viscosity.
+
+"""
+
+def fit_for_lut(dict_of_data, spec=None, confidence=0.95):
+    if spec is None:
+        spec = {'name': 'poly_1', 'kind': 'polynomial', 'degree': 1}
+    keys = list(dict_of_data)
+    list_of_x_mat = [model_matrix(dict_of_data[key]['Q_sli [uL/min]'].values, spec) for key in keys]
+    list_of_y = [dict_of_data[key]['Q_mass_meas [uL/min]'].values for key in keys]
+    results = batched_ols(*stack_groups(list_of_x_mat, list_of_y))
+    return {'spec': spec, 'viscosity': np.array([viscosity_from_key(key) for key in keys]),
+            'beta_hat': results['beta_hat'], 'cov_beta_hat': results['cov_beta_hat'],
+            't_crit': stats.t.ppf(0.5+confidence/2, results['dof']),
+            'q_sli_range': np.array([[np.min(dict_of_data[key]['Q_sli [uL/min]']),
+                                      np.max(dict_of_data[key]['Q_sli [uL/min]'])] for key in keys])}
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: build_lut(fits, viscosities=None, flow_meter='SLI-0430', bits=11)
+
+Summary:
+Function builds the forward, error bound and inverse tables (see summary) for the given viscosities [cSt] (calibrated
+viscosities of fits if None, see fit_for_lut fn) and outputs a dictionary of the form
+
+{'bits', 'flow_meter', 'resolution', 'code_offset', 'viscosity': (V), 'interpolated': bool (V), 'code_range': int16
+ (V x 2), 'q_sli': (C), 'forward': (V x C), 'bound': (V x C), 'inverse': int16 (V x C)}
+
+where C = 2*(2^bits-1)+1 is the number of codes and code_range is the calibrated code range of each viscosity (of the
+Q_sli range of the calibration points, intersection of the ranges of the two calibrated viscosities of an interpolated
+viscosity). The bound of an interpolated viscosity includes the leave-one-viscosity-out interpolation error (see
+summary), the larger of the errors of the two calibrated viscosities next to it.
+
+Notes:
+1. viscosities outside of the calibrated range raise a ValueError (no extrapolation), as do interpolated viscosities
+    with fewer than 3 calibrated viscosities (interpolation error can not be estimated)
+2. the forward table of each viscosity must be increasing for the inverse table to be defined
+
+"""
+
+def build_lut(fits, viscosities=None, flow_meter='SLI-0430', bits=11):
+    resolution = sensiron_specs(flow_meter, bits)['resolution']
+    code_offset = 2**bits-1
+    codes = np.arange(-code_offset, code_offset+1)
+    q_sli = codes*resolution
+
+    #corrected flow rate and error bound of every code for every calibrated viscosity (G x C)
+    x_mat = model_matrix(q_sli, fits['spec'])
+    forward_cal = fits['beta_hat'] @ x_mat.T
+    var_cal = np.einsum('cm,gmk,ck->gc', x_mat, fits['cov_beta_hat'], x_mat)
+    bound_cal = fits['t_crit'][:, None]*np.sqrt(var_cal)
+
+    order = np.argsort(fits['viscosity'])
+    log_visc_cal = np.log(fits['viscosity'][order])
+    forward_cal = forward_cal[order]
+    bound_cal = bound_cal[order]
+    q_sli_range_cal = fits['q_sli_range'][order]
+    viscosity = fits['viscosity'][order] if viscosities is None else np.asarray(viscosities, dtype=float)
+    log_visc = np.log(viscosity)
+    if np.any(log_visc < log_visc_cal[0]-1e-12) or np.any(log_visc > log_visc_cal[-1]+1e-12):
+        raise ValueError('viscosities must be within the calibrated range ' + str(fits['viscosity'].min()) + ' - ' +
+                         str(fits['viscosity'].max()) + ' cSt')
+
+    #linear interpolation in ln(viscosity) between the closest calibrated viscosities
+    i_upper = np.clip(np.searchsorted(log_visc_cal, log_visc), 1, max(len(log_visc_cal)-1, 1))
+    if len(log_visc_cal) == 1:
+        weight = np.zeros(len(log_visc))
+        i_lower = i_upper = np.zeros(len(log_visc), dtype=int)
+    else:
+        i_lower = i_upper-1
+        weight = np.clip((log_visc-log_visc_cal[i_lower])/(log_visc_cal[i_upper]-log_visc_cal[i_lower]), 0.0, 1.0)
+    forward = (1-weight)[:, None]*forward_cal[i_lower] + weight[:, None]*forward_cal[i_upper]
+    bound = (1-weight)[:, None]*bound_cal[i_lower] + weight[:, None]*bound_cal[i_upper]
+
+    #leave-one-viscosity-out interpolation error of each inner calibrated viscosity (nan at the ends), added to the
+    #bound of the interpolated viscosities next to it
+    interpolated = (weight > 1e-12) & (weight < 1-1e-12)
+    if np.any(interpolated):
+        if len(log_visc_cal) < 3:
+            raise ValueError('interpolated viscosities need at least 3 calibrated viscosities to estimate the '
+                             'interpolation error')
+        lovo_error = np.full(forward_cal.shape, np.nan)
+        for g in range(1, len(log_visc_cal)-1):
+            weight_g = (log_visc_cal[g]-log_visc_cal[g-1])/(log_visc_cal[g+1]-log_visc_cal[g-1])
+            lovo_error[g] = np.abs((1-weight_g)*forward_cal[g-1] + weight_g*forward_cal[g+1] - forward_cal[g])
+        interpolation_error = np.fmax(lovo_error[i_lower], lovo_error[i_upper])
+        bound = bound + np.where(interpolated[:, None], interpolation_error, 0.0)
+
+    #calibrated code range, Q_sli range of the calibrated viscosities used for each viscosity
+    q_sli_min = np.maximum(np.where(weight < 1, q_sli_range_cal[i_lower, 0], -np.inf),
+                           np.where(weight > 0, q_sli_range_cal[i_upper, 0], -np.inf))
+    q_sli_max = np.minimum(np.where(weight < 1, q_sli_range_cal[i_lower, 1], np.inf),
+                           np.where(weight > 0, q_sli_range_cal[i_upper, 1], np.inf))
+    code_range = np.clip(np.column_stack((np.ceil(q_sli_min/resolution-1e-9), np.floor(q_sli_max/resolution+1e-9))),
+                         -code_offset, code_offset).astype(np.int16)
+
+    #inverse table, code of the sensor at which the corrected flow rate is each target (target = index*resolution)
+    if np.any(np.diff(forward, axis=1) <= 0):
+        raise ValueError('corrected flow rate is not increasing with the sensor code, inverse table is not defined')
+    inverse = np.empty(forward.shape, dtype=np.int16)
+    for v in range(len(viscosity)):
+        inverse[v] = np.clip(np.rint(np.interp(q_sli, forward[v], codes)), -code_offset, code_offset)
+
+    return {'bits': bits, 'flow_meter': flow_meter, 'resolution': resolution, 'code_offset': code_offset,
+            'viscosity': viscosity, 'interpolated': interpolated, 'code_range': code_range, 'q_sli': q_sli,
+            'forward': forward, 'bound': bound, 'inverse': inverse}
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: quantize_values(values, scale=None)
+
+Summary:
+Function outputs the values of a table as float32 (scale None) or as int16 fixed point values, round(values/scale), with
+a scale [uL/min per bit]. Raises a ValueError if the values do not fit in int16 with the given scale.
+
+"""
+
+def quantize_values(values, scale=None):
+    if scale is None:
+        return values.astype(np.float32)
+    fixed = np.rint(values/scale)
+    if np.max(np.abs(fixed)) > 32767:
+        raise ValueError('values do not fit in int16 with scale ' + str(scale) + ' uL/min, increase the scale')
+    return fixed.astype(np.int16)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: quantize_bound(bound, scale=None)
+
+Summary:
+Function outputs an error bound table as float32 (scale None) or as int16 fixed point values of the given scale
+[uL/min per bit] (see quantize_values fn), with the rounding error of the fixed point flow rates (scale/2) added and
+rounded up, so that the written bound still covers the written flow rates.
+
+"""
+
+def quantize_bound(bound, scale=None):
+    if scale is None:
+        return bound.astype(np.float32)
+    return quantize_values(scale*np.ceil(bound/scale + 0.5), scale)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: write_lut_binary(lut, path, scale=None)
+
+Summary:
+Function writes the tables of a LUT (see build_lut fn) to a little endian binary file (see summary for the layout), with
+float32 values (scale None) or int16 fixed point values of the given scale [uL/min per bit].
+
+"""
+
+def write_lut_binary(lut, path, scale=None):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    num_visc, num_codes = lut['forward'].shape
+    with open(path, 'wb') as f:
+        f.write(lut_magic)
+        f.write(struct.pack('<4i', lut['bits'], num_visc, num_codes, 0 if scale is None else 1))
+        f.write(struct.pack('<d', 0.0 if scale is None else scale))
+        f.write(lut['viscosity'].astype('<f4').tobytes())
+        f.write(lut['code_range'].astype('<i2').tobytes())
+        f.write(quantize_values(lut['forward'], scale).astype('<f4' if scale is None else '<i2').tobytes())
+        f.write(quantize_bound(lut['bound'], scale).astype('<f4' if scale is None else '<i2').tobytes())
+        f.write(lut['inverse'].astype('<i2').tobytes())
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: read_lut_binary(path)
+
+Summary:
+Function reads a binary LUT file written by write_lut_binary and outputs a dictionary of the form {'bits', 'viscosity',
+'code_range', 'forward', 'bound', 'inverse', 'scale'} (forward and bound in uL/min).
+
+"""
+
+def read_lut_binary(path):
+    with open(path, 'rb') as f:
+        if f.read(len(lut_magic)) != lut_magic:
+            raise ValueError(str(path) + ' is not a LUT file')
+        bits, num_visc, num_codes, value_type = struct.unpack('<4i', f.read(16))
+        scale = struct.unpack('<d', f.read(8))[0]
+        viscosity = np.frombuffer(f.read(4*num_visc), dtype='<f4').astype(float)
+        code_range = np.frombuffer(f.read(4*num_visc), dtype='<i2').reshape(num_visc, 2)
+        value_dtype = '<f4' if value_type == 0 else '<i2'
+        value_size = np.dtype(value_dtype).itemsize*num_visc*num_codes
+        forward = np.frombuffer(f.read(value_size), dtype=value_dtype).reshape(num_visc, num_codes).astype(float)
+        bound = np.frombuffer(f.read(value_size), dtype=value_dtype).reshape(num_visc, num_codes).astype(float)
+        inverse = np.frombuffer(f.read(2*num_visc*num_codes), dtype='<i2').reshape(num_visc, num_codes)
+    if value_type == 1:
+        forward = forward*scale
+        bound = bound*scale
+    return {'bits': bits, 'viscosity': viscosity, 'code_range': code_range, 'forward': forward, 'bound': bound,
+            'inverse': inverse, 'scale': scale if value_type == 1 else None}
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: write_lut_c_header(lut, path, scale=None, name='sli_lut')
+
+Summary:
+Function writes the tables of a LUT (see build_lut fn) to a C header file as const arrays (float or int16_t fixed point
+values of the given scale [uL/min per bit]), with the number of viscosities and codes, the code offset, the scale and
+the calibrated code range of each viscosity.
+
+"""
+
+def write_lut_c_header(lut, path, scale=None, name='sli_lut'):
+    num_visc, num_codes = lut['forward'].shape
+    upper = name.upper()
+    c_type = 'float' if scale is None else 'int16_t'
+
+    def c_rows(table, fmt):
+        return ',\n'.join('    {' + ', '.join(fmt % value for value in row) + '}' for row in table)
+
+    value_fmt = '%.8ef' if scale is None else '%d'
+    lines = ['/* correction lookup tables of the SLI flow sensor, generated by lut_export.py */',
+             '#ifndef ' + upper + '_H', '#define ' + upper + '_H', '', '#include <stdint.h>', '',
+             '#define ' + upper + '_BITS ' + str(lut['bits']),
+             '#define ' + upper + '_NUM_VISC ' + str(num_visc),
+             '#define ' + upper + '_NUM_CODES ' + str(num_codes),
+             '/* index of raw code c is c + CODE_OFFSET, target flow rate of inverse index i is */',
+             '/* (i - CODE_OFFSET)*RESOLUTION [uL/min] */',
+             '#define ' + upper + '_CODE_OFFSET ' + str(lut['code_offset']),
+             '#define ' + upper + '_RESOLUTION ' + ('%.8ef' % lut['resolution'])]
+    if scale is not None:
+        lines.append('/* value [uL/min] = table value * SCALE */')
+        lines.append('#define ' + upper + '_SCALE ' + ('%.8ef' % scale))
+    lines += ['', 'static const float ' + name + '_viscosity[' + upper + '_NUM_VISC] = {' +
+              ', '.join('%.8ef' % v for v in lut['viscosity']) + '};', '',
+              '/* calibrated raw code range {min, max} of each viscosity, flow rates outside of it are extrapolated */',
+              'static const int16_t ' + name + '_code_range[' + upper + '_NUM_VISC][2] = {',
+              c_rows(lut['code_range'], '%d'), '};', '',
+              '/* corrected flow rate of each raw code */',
+              'static const ' + c_type + ' ' + name + '_forward[' + upper + '_NUM_VISC][' + upper + '_NUM_CODES] = {',
+              c_rows(quantize_values(lut['forward'], scale), value_fmt), '};', '',
+              '/* error bound (95% confidence half width, with interpolation and rounding error) of each raw code */',
+              'static const ' + c_type + ' ' + name + '_bound[' + upper + '_NUM_VISC][' + upper + '_NUM_CODES] = {',
+              c_rows(quantize_bound(lut['bound'], scale), value_fmt), '};', '',
+              '/* raw code of each target flow rate */',
+              'static const int16_t ' + name + '_inverse[' + upper + '_NUM_VISC][' + upper + '_NUM_CODES] = {',
+              c_rows(lut['inverse'], '%d'), '};', '', '#endif', '']
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    Path(path).write_text('\n'.join(lines))
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: lut_to_df(lut)
+
+Summary:
+Function outputs the tables of a LUT (see build_lut fn) as a dataframe with one row per viscosity and code of the form
+
+[Viscosity [cSt], code, calibrated, Q_sli [uL/min], Q_actual [uL/min], u_Q_actual [uL/min], target [uL/min],
+ inverse_code]
+
+where calibrated is True for codes within the calibrated code range of the viscosity.
+
+"""
+
+def lut_to_df(lut):
+    num_visc, num_codes = lut['forward'].shape
+    codes = np.arange(-lut['code_offset'], lut['code_offset']+1)
+    calibrated = (codes >= lut['code_range'][:, :1]) & (codes <= lut['code_range'][:, 1:])
+    return pd.DataFrame({'Viscosity [cSt]': np.repeat(lut['viscosity'], num_codes), 'code': np.tile(codes, num_visc),
+                         'calibrated': calibrated.ravel(),
+                         'Q_sli [uL/min]': np.tile(lut['q_sli'], num_visc), 'Q_actual [uL/min]': lut['forward'].ravel(),
+                         'u_Q_actual [uL/min]': lut['bound'].ravel(),
+                         'target [uL/min]': np.tile(lut['q_sli'], num_visc),
+                         'inverse_code': lut['inverse'].ravel()})
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: verify_lut(lut, fits, scale=None, num_samples=1000000, seed=0)
+
+Summary:
+Function checks a LUT against the analytic correction of the fits (see fit_for_lut fn) and times the lookup. Random raw
+codes are drawn for every calibrated viscosity in the LUT and the corrected flow rate is taken from the table (with the
+float32 or fixed point values actually written) and computed with the analytic formula. The interpolation is checked by
+leaving out each inner calibrated viscosity, building its table from the other fits and comparing it to its own fit
+within its calibrated code range (needs at least 4 calibrated viscosities). Outputs a dictionary of the form
+
+{'max_error [uL/min]': largest |LUT - analytic| of the forward tables, 'min_bound [uL/min]': smallest error bound of the
+ tables, 'error_below_bound': True if every error is below the error bound of its code, 'max_interpolation_error
+ [uL/min]': largest |interpolated table - fit| of the left out viscosities, 'interpolation_error_below_bound': True if
+ every interpolation error is below the error bound of the interpolated table plus the bound of the fit of the left out
+ viscosity (None if not checked),
+ 'max_inverse_error [codes]': largest difference between the code of a target in the inverse table and the exact
+ (fractional) code, 'lut_ns_per_sample', 'analytic_ns_per_sample': time of vectorized lookup and of the analytic
+ formula, 'lut_scalar_ns', 'analytic_scalar_ns': time per sample of a scalar loop (as on a controller)}
+
+Notes:
+1. the scalar analytic loop evaluates a polynomial in Q_sli, the times of other model kinds are only approximate
+
+"""
+
+def verify_lut(lut, fits, scale=None, num_samples=1000000, seed=0):
+    rng = np.random.default_rng(seed)
+    table = quantize_values(lut['forward'], scale)
+    table = table.astype(float)*(1.0 if scale is None else scale)
+    bound = quantize_bound(lut['bound'], scale).astype(float)*(1.0 if scale is None else scale)
+
+    max_error = 0.0
+    below_bound = True
+    max_inverse_error = 0.0
+    for g, visc in enumerate(fits['viscosity']):
+        v = np.nonzero(np.isclose(lut['viscosity'], visc))[0]
+        if len(v) == 0:
+            continue
+        v = v[0]
+        codes = rng.integers(-lut['code_offset'], lut['code_offset']+1, num_samples)
+        index = codes + lut['code_offset']
+        analytic = model_matrix(codes*lut['resolution'], fits['spec']) @ fits['beta_hat'][g]
+        error = np.abs(table[v, index] - analytic)
+        max_error = max(max_error, np.max(error))
+        below_bound = below_bound and bool(np.all(error < bound[v, index]))
+
+        #exact fractional code of each target within the range of the forward table
+        in_range = (lut['q_sli'] >= lut['forward'][v, 0]) & (lut['q_sli'] <= lut['forward'][v, -1])
+        exact_code = np.interp(lut['q_sli'], lut['forward'][v], np.arange(-lut['code_offset'], lut['code_offset']+1))
+        max_inverse_error = max(max_inverse_error, np.max(np.abs(lut['inverse'][v][in_range] - exact_code[in_range])))
+
+    #leave-one-viscosity-out check of the interpolation, within the calibrated code range of the left out viscosity
+    max_interpolation_error = np.nan
+    interpolation_below_bound = None
+    order = np.argsort(fits['viscosity'])
+    if len(order) >= 4:
+        max_interpolation_error = 0.0
+        interpolation_below_bound = True
+        codes = np.arange(-lut['code_offset'], lut['code_offset']+1)
+        for g in order[1:-1]:
+            keep = np.arange(len(order)) != g
+            fits_out = {key: (fits[key] if key == 'spec' else fits[key][keep]) for key in fits}
+            lut_out = build_lut(fits_out, [fits['viscosity'][g]], flow_meter=lut['flow_meter'], bits=lut['bits'])
+            calibrated = (codes >= lut_out['code_range'][0, 0]) & (codes <= lut_out['code_range'][0, 1])
+            table_out = quantize_values(lut_out['forward'][0], scale).astype(float)*(1.0 if scale is None else scale)
+            bound_out = quantize_bound(lut_out['bound'][0], scale).astype(float)*(1.0 if scale is None else scale)
+            analytic = model_matrix(lut['q_sli'], fits['spec']) @ fits['beta_hat'][g]
+            #the fit of the left out viscosity is an estimate too, its own bound is added
+            bound_g = build_lut(fits, [fits['viscosity'][g]], flow_meter=lut['flow_meter'],
+                                bits=lut['bits'])['bound'][0]
+            error = np.abs(table_out - analytic)[calibrated]
+            if len(error) > 0:
+                max_interpolation_error = max(max_interpolation_error, np.max(error))
+                interpolation_below_bound = interpolation_below_bound and \
+                    bool(np.all(error < (bound_out + bound_g)[calibrated]))
+
+    #timing of vectorized lookup vs analytic formula (first calibrated viscosity in the LUT)
+    beta_hat = fits['beta_hat'][0]
+    codes = rng.integers(-lut['code_offset'], lut['code_offset']+1, num_samples)
+    row = table[0]
+    start = time.perf_counter()
+    row[codes + lut['code_offset']]
+    lut_ns = (time.perf_counter()-start)/num_samples*1e9
+    start = time.perf_counter()
+    model_matrix(codes*lut['resolution'], fits['spec']) @ beta_hat
+    analytic_ns = (time.perf_counter()-start)/num_samples*1e9
+
+    #scalar loop of one sample at a time
+    list_of_codes = codes[:100000].tolist()
+    list_of_row = row.tolist()
+    offset = lut['code_offset']
+    resolution = lut['resolution']
+    start = time.perf_counter()
+    for code in list_of_codes:
+        list_of_row[code + offset]
+    lut_scalar_ns = (time.perf_counter()-start)/len(list_of_codes)*1e9
+    beta_list = beta_hat.tolist()
+    start = time.perf_counter()
+    for code in list_of_codes:
+        q = code*resolution
+        sum(b*q**i for i, b in enumerate(beta_list))
+    analytic_scalar_ns = (time.perf_counter()-start)/len(list_of_codes)*1e9
+
+    return {'max_error [uL/min]': max_error, 'min_bound [uL/min]': float(np.min(bound)),
+            'error_below_bound': below_bound, 'max_interpolation_error [uL/min]': max_interpolation_error,
+            'interpolation_error_below_bound': interpolation_below_bound,
+            'max_inverse_error [codes]': max_inverse_error,
+            'lut_ns_per_sample': lut_ns, 'analytic_ns_per_sample': analytic_ns, 'lut_scalar_ns': lut_scalar_ns,
+            'analytic_scalar_ns': analytic_scalar_ns}
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+if __name__ == '__main__':
+    #extra viscosities [cSt] to interpolate tables for (within calibrated range), fixed point scale [uL/min per bit]
+    #(None for float32 tables)
+    extra_viscosities = []
+    scale = None
+    flow_meter = 'SLI-0430'
+    bits = 11
+
+    # specify path of data used for correction fitting and of output folder
+    p = Path('./outputs/combined_pos_neg_q/')
+    out_dir = Path('./outputs/lut/')
+
+    dict_of_combined_data = read_correction_data(p)
+    fits = fit_for_lut(dict_of_combined_data)
+    viscosities = np.unique(np.concatenate((fits['viscosity'], extra_viscosities)))
+    lut = build_lut(fits, viscosities, flow_meter=flow_meter, bits=bits)
+
+    verification = verify_lut(lut, fits, scale=scale)
+    for key in verification:
+        print(key + ': ' + str(verification[key]))
+
+    question = input('Output lookup tables to ' + str(out_dir) + '? (y/n): ')
+    while question != 'y' and question !='n':
+        question = input("please input 'y' or 'n': ")
+    if question == 'y':
+        write_lut_binary(lut, out_dir / 'sli_lut.bin', scale=scale)
+        write_lut_c_header(lut, out_dir / 'sli_lut.h', scale=scale)
+        lut_to_df(lut).to_csv(out_dir / 'sli_lut.csv', index=False)
+    elif question =='n':
+        print('lookup tables not output')
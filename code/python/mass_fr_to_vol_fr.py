@@ -29,11 +29,16 @@ Q [m^3/s] = m_dot[kg/s]/density[kg/m^3]
 Q [uL/min] = Q[m^3/s]*{1000L/1m^3]*[60s/1min]*[10^6 uL/1L]
 density = [913, 930,950, 960, 960] for 5, 10, 20, 50, 100 cSt Si oil respectivley (from sigma aldrich)
 
+If the average flow rate file of the same flow case and viscosity (output of flow_rate_meas_to_avg.py) has the average
+temperature of each run, T [C], the density is instead taken at the temperature of the run of the same pressure (see
+run_density fn in pipeline_stages.py) and T [C] and rho [kg/m^3] are added to the output.
+
 Output of code is to be used in program to calculate correction factor for output flow rate from SLI 0430 flow sensor.
 
 Dependencies:
 1. Path from pathlib
 2. pandas
+3. run_density from pipeline_stages.py
 
 Notes:
     1. must change flow_case for positive_q or negative_q measurements (see line 57)
@@ -52,6 +57,7 @@ Notes:
 
 from pathlib import Path
 import pandas as pd
+from pipeline_stages import run_density
 
 #specify flow case (negative_q or positive_q) (change on each run)
 flow_case = 'negative_q'
@@ -109,6 +115,16 @@ if end_of_csv !='retry':
 
         print(key + ', density: '+ str(rho))
 
+        #density at temperature of sensor run of each pressure if available (see run_density fn in pipeline_stages.py)
+        rho_run = rho
+        temp_run = None
+        avg_path = Path('./outputs/avg_flow_rate_from_meas/'+flow_case+'/'+key+'.csv')
+        if avg_path.exists():
+            df_meas = pd.read_csv(avg_path, index_col=0)
+            if 'T [C]' in df_meas.columns:
+                rho_run, temp_run = run_density(key, df['P [mbar]'], df_meas)
+                print(key + ', density at run temperatures: ' + str(rho_run))
+
         #calculating mass difference
         df['M_diff [kg]'] = (df['M_f [g]'] - df['M_i [g]'])*(1/1000)
 
@@ -120,10 +136,10 @@ if end_of_csv !='retry':
 
         #print(df)
         #calculating volume flow rate [m^3/s] (Q =m_dot/rho)
-        q_m_cubed_per_s = df['m_dot [kg/s]']/rho
+        q_m_cubed_per_s = df['m_dot [kg/s]']/rho_run
 
         #calculating uncertainty in volume flow rate
-        u_q_vl = (1/rho)*df['u_m_dot [kg/s]']
+        u_q_vl = (1/rho_run)*df['u_m_dot [kg/s]']
 
         #converting vol fr to [uL/min] (Q [uL/min] = Q[m^3/s]*{1000L/1m^3]*[60s/1min]*[10^6 uL/1L])
         q_ul_per_min = q_m_cubed_per_s*(60000*10**6)
@@ -134,6 +150,9 @@ if end_of_csv !='retry':
         output_df['u_m_dot [kg/s]'] = df['u_m_dot [kg/s]']
         output_df['Q [uL/min]'] = q_ul_per_min
         output_df['u_q_vl [uL/min]'] = u_q_ul_per_min
+        if temp_run is not None:
+            output_df['T [C]'] = temp_run
+            output_df['rho [kg/m^3]'] = rho_run
         #print(output_df)
 
         #add output df to dictionary
@@ -0,0 +1,77 @@
+"""
+Title: model_selection_combined_df.py
+
+Summary:
+Code intakes .csv files created by neg_and_pos_q_combined_file.py (in ./outputs/combined_pos_neg_q) of form:
+
+[P [mbar] Q_sli [uL/min] u_q_sli [uL/min], u_q_sli_rel [%],Q_mass_meas [uL/min] ,u_q_m [uL/min], u_q_m_rel [%]]
+
+and fits the candidate correction models of correction_models.py (polynomials in Q_sli, piecewise linear split at zero
+flow) for every viscosity at once, as well as a single global model where the coefficients of the correction are smooth
+functions of viscosity. Program prints a table of the AIC, BIC and k-fold cross-validation error of every model for each
+viscosity (with the best model for each criterion flagged), and the coefficients and leave-one-viscosity-out error of the
+global model. Program outputs the tables as .csv files to ./outputs/model_selection/.
+
+Dependencies:
+1. Path from pathlib
+2. numpy
+3. pandas
+4. correction_models.py
+
+Notes:
+1. the global model can be used to correct a fluid of any viscosity (within the range tested) without recalibration, see
+    global_model_coefficients fn in correction_models.py
+2. change max_degree, k_folds, global_degree and global_visc_degree to change the models considered
+
+"""
+
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from correction_models import read_correction_data, default_candidate_models, fit_candidate_models,\
+    fit_global_viscosity_model, global_model_coefficients, viscosity_from_key
+
+#maximum degree of polynomial correction models
+max_degree = 3
+
+#number of folds for cross-validation
+k_folds = 5
+
+#degree of global model in Q_sli and in ln(viscosity)
+global_degree = 1
+global_visc_degree = 2
+
+# specify path of data to use for correction fitting
+p = Path('./outputs/combined_pos_neg_q/')
+
+#creating dictionary of dataframes for each set of correction data with key value pair {visc_cSt: df}
+dict_of_combined_data = read_correction_data(p)
+
+#fitting all candidate models for all viscosities
+df_models, dict_of_fits = fit_candidate_models(dict_of_combined_data, default_candidate_models(max_degree), k=k_folds)
+print(df_models.to_string())
+
+#fitting global viscosity model
+global_fit = fit_global_viscosity_model(dict_of_combined_data, degree=global_degree, visc_degree=global_visc_degree)
+print(global_fit['spec']['name'] + ': R^2 = ' + str(round(global_fit['r_squared'], 5)) + ', AIC = ' +
+      str(round(global_fit['aic'], 3)) + ', BIC = ' + str(round(global_fit['bic'], 3)))
+
+#creating dataframe of form [Viscosity [cSt], beta_0_hat [uL/min], beta_1_hat, ..., lovo_rmse [uL/min]] of the global
+#model coefficients evaluated at each tested viscosity
+viscosity = np.array([viscosity_from_key(key) for key in dict_of_combined_data])
+coeffs = global_model_coefficients(global_fit, viscosity)
+col_names = ['beta_0_hat [uL/min]'] + ['beta_'+str(i)+'_hat' for i in range(1, coeffs.shape[1])]
+df_global = pd.DataFrame(coeffs, columns=col_names)
+df_global.insert(0, 'Viscosity [cSt]', viscosity)
+df_global['lovo_rmse [uL/min]'] = [global_fit['lovo_rmse'].get(key, np.nan) for key in dict_of_combined_data]
+print(df_global.to_string())
+
+#outputting tables as .csv in ./outputs/model_selection
+question = input('Output model selection tables as .csv files? (y/n): ')
+while question != 'y' and question !='n':
+    question = input("please input 'y' or 'n': ")
+if question == 'y':
+    df_models.to_csv('./outputs/model_selection/candidate_models.csv')
+    df_global.to_csv('./outputs/model_selection/' + global_fit['spec']['name'] + '_coefficients.csv')
+elif question =='n':
+    print('results not output to .csv')
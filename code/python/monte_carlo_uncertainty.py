@@ -0,0 +1,231 @@
+"""
+Title: monte_carlo_uncertainty.py
+
+Summary:
+Monte Carlo propagation of the uncertainty of every input of the calibration chain (GUM Supplement 1 style) up to the
+estimated correction parameters beta_0 and beta_1 of Q_actual = B_1*Q_sli + B_o. The first order formulas used in
+mass_fr_to_vol_fr.py (u_m_dot with a fixed 0.005), functions.py (u_sli_o, u_sli_1) and
+flow_meter_fr_and_meas_fr_to_csv.py (relative uncertainties) leave out the uncertainty of the density and of the
+measurement time, and do not propagate to the parameters. Here, for each draw, every input is sampled from its
+probability distribution:
+
+1. balance readings M_i, M_f [g], rectangular over +/- balance_resolution/2 plus normal repeatability u_balance [g]
+2. measurement time [s], normal with standard uncertainty u_time [s]
+3. density [kg/m^3], normal with relative standard uncertainty u_rho_rel
+4. sensor accuracy [uL/min], rectangular over +/- max(|Q_sli|*mv_acc_percent, fs_acc) (manufacturer accuracy bounds),
+    systematic (as in calibration_design.py), one value in [-1, 1] is drawn per draw and scales the bound of every point
+5. sensor resolution [uL/min], rectangular over +/- precision (half of the resolution at the sampled bits)
+6. random error of the average sensor flow rate [uL/min], normal with standard deviation std_dev/sqrt(# of Samples)
+
+and pushed through the chain
+
+Q_actual = (M_f - M_i)/1000/Measurement Time/density*(60000*10^6)   (sign of negative_q flipped)
+Q_sli = Avg. Flow + accuracy error + resolution error + random error
+[beta_0, beta_1] = OLS estimate of Q_actual vs Q_sli (closed form simple linear regression of every draw)
+
+Draws are processed in chunks of chunk_size (arrays of chunk_size x N calibration points) with numpy, so memory is
+bounded while 10^6 draws take a few seconds. The output is the mean, standard uncertainty and 95% probabilistically
+symmetric coverage interval of each parameter and the standard uncertainty of each Q_actual and Q_sli.
+
+Dependencies:
+1. Path from pathlib
+2. numpy
+3. pandas
+4. functions.py
+5. pipeline_stages.py
+
+Notes:
+1. the default input uncertainties (balance_resolution = 0.005 g, u_balance = 0, u_time = 0.1 s, u_rho_rel = 0.005) are
+    assumptions, change them to the values of the equipment used
+2. the std_dev of the sensor flow rate of each point is recovered from the u_sli_o and u_sli_1 columns of the average flow
+    rate files, u_sli_1^2 - u_sli_o^2 = (2*std_dev)^2/# of Samples (see sensiron_first_order_uncertainty fn)
+
+"""
+
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from functions import sensiron_specs
+
+
+"""
+Function: mc_inputs(df_avg, df_mass, rho, flow_case)
+
+Summary:
+Function creates the dictionary of input arrays (one value per calibration point) of the Monte Carlo simulation from the
+average sensor flow rate dataframe of a viscosity and flow case, of the form [Pressure [mbar], # Samples,
+Avg. Flow [uL/min], u_sli_o [uL/min], u_sli_1 [uL/min]] (flow_rate_meas_to_avg.py), and the mass balance dataframe, of the
+form [P [mbar], Measurement Time [s], M_i [g], M_f [g]] (rows matched by position as in flow_meter_fr_and_meas_fr_to_csv.py).
+
+"""
+
+def mc_inputs(df_avg, df_mass, rho, flow_case):
+    num_samples = df_avg['# Samples'].values.astype(float)
+    u_sli_t_sq = np.maximum(df_avg['u_sli_1 [uL/min]'].values**2 - df_avg['u_sli_o [uL/min]'].values**2, 0.0)
+    n = len(df_avg)
+    return {'P [mbar]': df_avg['Pressure [mbar]'].values, 'q_sli': df_avg['Avg. Flow [uL/min]'].values,
+            'std_dev': np.sqrt(u_sli_t_sq*num_samples)/2, 'num_samples': num_samples,
+            'm_i': df_mass['M_i [g]'].values[:n], 'm_f': df_mass['M_f [g]'].values[:n],
+            't_meas': df_mass['Measurement Time [s]'].values[:n], 'rho': np.full(n, float(rho)),
+            'sign': np.full(n, -1.0 if flow_case == 'negative_q' else 1.0)}
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: concat_mc_inputs(list_of_inputs)
+
+Summary:
+Function concatenates the input dictionaries of several flow cases (e.g. negative_q and positive_q of one viscosity) into
+one input dictionary.
+
+"""
+
+def concat_mc_inputs(list_of_inputs):
+    return {key: np.concatenate([inputs[key] for inputs in list_of_inputs]) for key in list_of_inputs[0]}
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: mc_calibration(inputs, num_draws=10**6, chunk_size=50000, balance_resolution=0.005, u_balance=0.0,
+                         u_time=0.1, u_rho_rel=0.005, flow_meter='SLI-0430', bits=11, seed=0, return_draws=False)
+
+Summary:
+Function performs the Monte Carlo simulation of the calibration chain of one viscosity (see summary) and outputs a
+dictionary of the form
+
+{'beta_0': {'mean', 'u', 'low_95', 'high_95'}, 'beta_1': {...}, 'u_q_actual': (N), 'u_q_sli': (N),
+ 'corr_beta_0_beta_1': correlation of the parameters, 'num_draws': int}
+
+(and the draws of beta_0 and beta_1 under 'draws' if return_draws is True).
+
+Inputs:
+1. inputs, dictionary of input arrays (see mc_inputs fn)
+2. num_draws, number of Monte Carlo draws
+3. chunk_size, number of draws calculated at once (memory ~ 10*chunk_size*N*8 bytes)
+4. balance_resolution, resolution of the mass balance [g]
+5. u_balance, standard uncertainty of repeatability of each balance reading [g]
+6. u_time, standard uncertainty of the measurement time [s]
+7. u_rho_rel, relative standard uncertainty of the density
+8. flow_meter, bits, see sensiron_specs fn in functions.py
+9. seed, seed of random number generator
+10. return_draws, whether to output the draws of the parameters
+
+"""
+
+def mc_calibration(inputs, num_draws=10**6, chunk_size=50000, balance_resolution=0.005, u_balance=0.0, u_time=0.1,
+                   u_rho_rel=0.005, flow_meter='SLI-0430', bits=11, seed=0, return_draws=False):
+    rng = np.random.default_rng(seed)
+    specs = sensiron_specs(flow_meter, bits)
+    q_sli = inputs['q_sli']
+    n = len(q_sli)
+    acc_bound = np.maximum(np.abs(q_sli)*specs['mv_acc_percent'], specs['fs_acc'])
+    u_random = inputs['std_dev']/np.sqrt(inputs['num_samples'])
+    to_ul_per_min = 60000*10**6/1000
+
+    beta_0 = np.empty(num_draws)
+    beta_1 = np.empty(num_draws)
+    #running sums for standard uncertainty of each point
+    sum_q_act = np.zeros(n)
+    sum_sq_q_act = np.zeros(n)
+    sum_q_sli = np.zeros(n)
+    sum_sq_q_sli = np.zeros(n)
+
+    for start in range(0, num_draws, chunk_size):
+        m = min(chunk_size, num_draws-start)
+        shape = (m, n)
+
+        #mass flow rate chain
+        m_i = inputs['m_i'] + rng.uniform(-0.5, 0.5, shape)*balance_resolution
+        m_f = inputs['m_f'] + rng.uniform(-0.5, 0.5, shape)*balance_resolution
+        if u_balance > 0:
+            m_i += rng.normal(0.0, u_balance, shape)
+            m_f += rng.normal(0.0, u_balance, shape)
+        t_meas = inputs['t_meas'] + rng.normal(0.0, u_time, shape)
+        rho = inputs['rho']*(1 + rng.normal(0.0, u_rho_rel, shape))
+        q_act = inputs['sign']*(m_f-m_i)/(t_meas*rho)*to_ul_per_min
+
+        #sensor chain (accuracy error shared by every point of a draw)
+        x = q_sli + rng.uniform(-1.0, 1.0, (m, 1))*acc_bound + rng.uniform(-1.0, 1.0, shape)*specs['precision'] \
+            + rng.normal(0.0, 1.0, shape)*u_random
+
+        #closed form OLS of every draw
+        x_c = x - x.mean(axis=1, keepdims=True)
+        y_bar = q_act.mean(axis=1)
+        b_1 = np.einsum('ij,ij->i', x_c, q_act)/np.einsum('ij,ij->i', x_c, x_c)
+        beta_1[start:start+m] = b_1
+        beta_0[start:start+m] = y_bar - b_1*x.mean(axis=1)
+
+        sum_q_act += q_act.sum(axis=0)
+        sum_sq_q_act += np.square(q_act).sum(axis=0)
+        sum_q_sli += x.sum(axis=0)
+        sum_sq_q_sli += np.square(x).sum(axis=0)
+
+    def summary(draws):
+        low, high = np.percentile(draws, [2.5, 97.5])
+        return {'mean': draws.mean(), 'u': draws.std(ddof=1), 'low_95': low, 'high_95': high}
+
+    output = {'beta_0': summary(beta_0), 'beta_1': summary(beta_1),
+              'u_q_actual': np.sqrt(np.maximum(sum_sq_q_act/num_draws - (sum_q_act/num_draws)**2, 0.0)),
+              'u_q_sli': np.sqrt(np.maximum(sum_sq_q_sli/num_draws - (sum_q_sli/num_draws)**2, 0.0)),
+              'corr_beta_0_beta_1': np.corrcoef(beta_0, beta_1)[0, 1], 'num_draws': num_draws}
+    if return_draws:
+        output['draws'] = {'beta_0': beta_0, 'beta_1': beta_1}
+    return output
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+if __name__ == '__main__':
+    import time
+    from pipeline_stages import si_oil_density
+
+    #number of draws and input uncertainties (see mc_calibration fn)
+    num_draws = 10**6
+    u_time = 0.1
+    u_rho_rel = 0.005
+
+    #input paths of average sensor flow rates and mass balance measurements
+    p_avg = Path('./outputs/avg_flow_rate_from_meas/')
+    p_mass = Path('../../data/si_oil/mass_balance_measurements/')
+
+    dict_of_mc_params = {}
+    for visc in si_oil_density:
+        list_of_inputs = []
+        for flow_case, end_of_csv in [('negative_q', '_mass_n_q.csv'), ('positive_q', '_mass_p_q.csv')]:
+            path_avg = p_avg / flow_case / (visc + '.csv')
+            path_mass = p_mass / flow_case / ('visc_' + visc + end_of_csv)
+            if path_avg.exists() and path_mass.exists():
+                list_of_inputs.append(mc_inputs(pd.read_csv(path_avg, index_col=0), pd.read_csv(path_mass),
+                                                si_oil_density[visc], flow_case))
+        if not list_of_inputs:
+            continue
+
+        t_start = time.perf_counter()
+        mc = mc_calibration(concat_mc_inputs(list_of_inputs), num_draws=num_draws, u_time=u_time, u_rho_rel=u_rho_rel)
+        print(visc + ': ' + str(num_draws) + ' draws in ' + str(round(time.perf_counter()-t_start, 2)) + ' s')
+        dict_of_mc_params[visc] = [int(visc.replace('_cSt', '')), mc['beta_0']['mean'], mc['beta_0']['u'],
+                                   mc['beta_0']['low_95'], mc['beta_0']['high_95'], mc['beta_1']['mean'],
+                                   mc['beta_1']['u'], mc['beta_1']['low_95'], mc['beta_1']['high_95'],
+                                   mc['corr_beta_0_beta_1']]
+
+    #creating dataframe of form [Viscosity [cSt], beta_0_hat [uL/min], u_beta_0_hat [uL/min], beta_0 95% interval,
+    #beta_1_hat, u_beta_1_hat, beta_1 95% interval, correlation]
+    df_mc = pd.DataFrame.from_dict(dict_of_mc_params, orient='index',
+                                   columns=['Viscosity [cSt]', 'beta_0_hat [uL/min]', 'u_beta_0_hat [uL/min]',
+                                            'beta_0_low_95 [uL/min]', 'beta_0_high_95 [uL/min]', 'beta_1_hat',
+                                            'u_beta_1_hat', 'beta_1_low_95', 'beta_1_high_95', 'corr_beta_0_beta_1'])
+    df_mc = df_mc.sort_values(by=['Viscosity [cSt]']).reset_index(drop=True)
+    print(df_mc)
+
+    question = input('Output Monte Carlo parameters and uncertainties as .csv file? (y/n): ')
+    while question != 'y' and question !='n':
+        question = input("please input 'y' or 'n': ")
+    if question == 'y':
+        df_mc.to_csv('./outputs/est_params_and_uncert/mc_params_and_uncert.csv')
+    elif question =='n':
+        print('results not output to .csv')
@@ -0,0 +1,381 @@
+"""
+Title: multi_sensor_ingest.py
+
+Summary:
+Ingest service for concurrent acquisition of the flow rate measurements of several sensiron flow sensors (e.g. SLI-0430)
+running at once, instead of one sensor exported as a finished .csv file by the sensiron flow viewer software. Each sensor
+stream is read by its own asyncio task through a pluggable transport:
+
+1. SimulatedSensorTransport, local simulator generating samples of a sensor at a given rate (no hardware needed)
+2. SocketSensorTransport, reads lines of the form "sample_number,relative_time_s,flow_ul_per_min" from a TCP socket
+    (e.g. a serial-to-network bridge or a simulator running as a separate process, see serve_simulated_sensor fn)
+
+Samples are read in blocks and passed through a bounded asyncio.Queue per sensor to a consumer task that writes them into
+a ring buffer per sensor (fixed size numpy arrays holding the most recent samples). The queue provides backpressure, when it
+is full either the reader waits (policy 'block', which slows the transport) or the oldest block is dropped (policy
+'drop_oldest', which keeps the stream real time, the number of dropped samples is counted). Rolling statistics of each
+stream are calculated over the ring buffer contents, equivalent to sensiron_first_order_uncertainty in functions.py:
+
+[# of Samples, Avg. Flow [uL/min], u_sli_o [uL/min], u_sli_1 [uL/min], dropped samples]
+
+benchmark_ingest measures the throughput of the service for many simulated sensors at kHz sample rates.
+
+Dependencies:
+1. asyncio
+2. time
+3. numpy
+4. pandas
+5. functions.py
+
+Notes:
+1. run this file to run the benchmark (change num_sensors, rate_hz and duration_s below)
+2. a new transport only needs an async read_block() method returning (sample_number, relative_time, flow) arrays (or None
+    at the end of the stream) and an async close() method
+
+"""
+
+import asyncio
+import time
+import numpy as np
+import pandas as pd
+from functions import sensiron_first_order_uncertainty
+
+
+"""
+Class: RingBuffer(capacity)
+
+Summary:
+Fixed size buffer of the most recent capacity samples of a sensor stream (Sample #, Relative Time[s] and Flow [ul/min]
+numpy arrays). Blocks of samples are written with vectorized copies, when full the oldest samples are overwritten.
+
+"""
+
+class RingBuffer:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.sample = np.zeros(capacity, dtype=np.int64)
+        self.time = np.zeros(capacity)
+        self.flow = np.zeros(capacity)
+        self.head = 0
+        self.size = 0
+        self.total = 0
+
+    def extend(self, sample, rel_time, flow):
+        n = len(flow)
+        if n >= self.capacity:
+            sample, rel_time, flow = sample[-self.capacity:], rel_time[-self.capacity:], flow[-self.capacity:]
+            n_total = n
+            n = self.capacity
+        else:
+            n_total = n
+        idx = (self.head + np.arange(n)) % self.capacity
+        self.sample[idx] = sample
+        self.time[idx] = rel_time
+        self.flow[idx] = flow
+        self.head = (self.head + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+        self.total += n_total
+
+    def view(self):
+        #samples in order oldest to newest
+        idx = (self.head - self.size + np.arange(self.size)) % self.capacity
+        return pd.DataFrame({'Sample #': self.sample[idx], 'Relative Time[s]': self.time[idx],
+                             'Flow [ul/min]': self.flow[idx]})
+
+'''
+********************************************END OF CLASS***************************************************************
+'''
+
+"""
+Class: SimulatedSensorTransport(sensor_id, rate_hz=1000, block_size=100, mean_flow=300, noise=5, num_samples=None,
+                                realtime=True, seed=None)
+
+Summary:
+Local simulator of a sensiron flow sensor stream producing blocks of block_size samples at rate_hz samples/s (flow rate
+[uL/min] normally distributed around mean_flow with standard deviation noise, quantized to the resolution of an 11 bit
+SLI-0430 reading). If realtime is False blocks are produced as fast as they are read (for throughput benchmarks). The
+stream ends after num_samples samples (never if None).
+
+"""
+
+class SimulatedSensorTransport:
+    def __init__(self, sensor_id, rate_hz=1000, block_size=100, mean_flow=300, noise=5, num_samples=None, realtime=True,
+                 seed=None):
+        self.sensor_id = sensor_id
+        self.rate_hz = rate_hz
+        self.block_size = block_size
+        self.mean_flow = mean_flow
+        self.noise = noise
+        self.num_samples = num_samples
+        self.realtime = realtime
+        self.rng = np.random.default_rng(seed)
+        self.resolution = 1200/(2**11-1)
+        self.next_sample = 0
+        self.t_start = None
+
+    async def read_block(self):
+        if self.num_samples is not None and self.next_sample >= self.num_samples:
+            return None
+        if self.t_start is None:
+            self.t_start = time.perf_counter()
+        n = self.block_size
+        if self.num_samples is not None:
+            n = min(n, self.num_samples - self.next_sample)
+        sample = np.arange(self.next_sample, self.next_sample + n)
+        rel_time = sample/self.rate_hz
+        if self.realtime:
+            #wait until the last sample of the block would have been measured
+            delay = self.t_start + rel_time[-1] - time.perf_counter()
+            await asyncio.sleep(max(delay, 0))
+        else:
+            await asyncio.sleep(0)
+        flow = np.round(self.rng.normal(self.mean_flow, self.noise, n)/self.resolution)*self.resolution
+        self.next_sample += n
+        return sample, rel_time, flow
+
+    async def close(self):
+        pass
+
+'''
+********************************************END OF CLASS***************************************************************
+'''
+
+"""
+Class: SocketSensorTransport(sensor_id, host, port, chunk_bytes=65536)
+
+Summary:
+Transport reading a sensor stream from a TCP socket, one sample per line of the form
+"sample_number,relative_time_s,flow_ul_per_min". Each read_block parses every complete line of the data received (up to
+chunk_bytes), an incomplete last line is kept for the next block.
+
+"""
+
+class SocketSensorTransport:
+    def __init__(self, sensor_id, host, port, chunk_bytes=65536):
+        self.sensor_id = sensor_id
+        self.host = host
+        self.port = port
+        self.chunk_bytes = chunk_bytes
+        self.reader = None
+        self.writer = None
+        self.remainder = b''
+
+    async def read_block(self):
+        if self.reader is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        while True:
+            chunk = await self.reader.read(self.chunk_bytes)
+            if not chunk:
+                return None
+            data = self.remainder + chunk
+            end = data.rfind(b'\n') + 1
+            self.remainder = data[end:]
+            if end > 0:
+                break
+        values = np.array(data[:end].decode().replace('\n', ',').split(',')[:-1], dtype=float).reshape(-1, 3)
+        return values[:, 0].astype(np.int64), values[:, 1], values[:, 2]
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
+
+'''
+********************************************END OF CLASS***************************************************************
+'''
+
+"""
+Function: serve_simulated_sensor(port, host='127.0.0.1', **simulator_kwargs)
+
+Summary:
+Coroutine serving a simulated sensor stream (see SimulatedSensorTransport) over TCP, one sample per line, to every client
+that connects. Outputs the asyncio server (close it with server.close()).
+
+"""
+
+async def serve_simulated_sensor(port, host='127.0.0.1', **simulator_kwargs):
+    async def handle_client(reader, writer):
+        simulator = SimulatedSensorTransport('socket', **simulator_kwargs)
+        try:
+            while True:
+                block = await simulator.read_block()
+                if block is None:
+                    break
+                sample, rel_time, flow = block
+                writer.write(''.join('%d,%.6f,%.6f\n' % row for row in zip(sample, rel_time, flow)).encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle_client, host, port)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: ingest_sensors(transports, buffer_capacity=100000, queue_blocks=64, policy='block', duration_s=None,
+                         on_stats=None, stats_interval_s=1.0, flow_meter='SLI-0430', bits=11)
+
+Summary:
+Coroutine reading every transport concurrently (one reader task and one consumer task per sensor) into a ring buffer per
+sensor until every stream ends or duration_s [s] has elapsed. Outputs a dictionary of the form
+{sensor_id: {'buffer': RingBuffer, 'dropped': number of dropped samples, 'blocks': number of blocks read}}.
+
+Inputs:
+1. transports, list of transports (see SimulatedSensorTransport and SocketSensorTransport)
+2. buffer_capacity, number of samples kept in the ring buffer of each sensor
+3. queue_blocks, maximum number of blocks waiting in the queue of each sensor
+4. policy, backpressure policy when a queue is full, 'block' (reader waits) or 'drop_oldest'
+5. duration_s, time after which reading is stopped (until end of every stream if None)
+6. on_stats, function called every stats_interval_s [s] with the dataframe output by rolling_stats
+7. stats_interval_s, period of on_stats calls [s]
+8. flow_meter, bits, see sensiron_specs fn in functions.py
+
+Notes:
+1. on shutdown (duration_s elapsed, error or cancellation) the readers are stopped and their transports closed before
+    the consumers, so that no reader waits on a full queue that is no longer consumed, blocks already read but not yet
+    consumed are then written to the ring buffers
+
+"""
+
+async def ingest_sensors(transports, buffer_capacity=100000, queue_blocks=64, policy='block', duration_s=None,
+                         on_stats=None, stats_interval_s=1.0, flow_meter='SLI-0430', bits=11):
+    if policy not in ('block', 'drop_oldest'):
+        raise ValueError("policy must be 'block' or 'drop_oldest'")
+    streams = {t.sensor_id: {'buffer': RingBuffer(buffer_capacity), 'dropped': 0, 'blocks': 0,
+                             'queue': asyncio.Queue(maxsize=queue_blocks)} for t in transports}
+
+    async def reader(transport):
+        stream = streams[transport.sensor_id]
+        queue = stream['queue']
+        try:
+            while True:
+                block = await transport.read_block()
+                if block is None:
+                    break
+                stream['blocks'] += 1
+                if policy == 'drop_oldest' and queue.full():
+                    dropped = queue.get_nowait()
+                    queue.task_done()
+                    stream['dropped'] += len(dropped[2])
+                await queue.put(block)
+        finally:
+            await transport.close()
+        #end of stream marker (not sent when the reader is cancelled)
+        await queue.put(None)
+
+    async def consumer(sensor_id):
+        stream = streams[sensor_id]
+        while True:
+            block = await stream['queue'].get()
+            stream['queue'].task_done()
+            if block is None:
+                break
+            stream['buffer'].extend(*block)
+
+    async def reporter():
+        while True:
+            await asyncio.sleep(stats_interval_s)
+            on_stats(rolling_stats(streams, flow_meter, bits))
+
+    readers = [asyncio.ensure_future(reader(t)) for t in transports]
+    consumers = [asyncio.ensure_future(consumer(t.sensor_id)) for t in transports]
+    reporter_task = asyncio.ensure_future(reporter()) if on_stats is not None else None
+    try:
+        if duration_s is None:
+            await asyncio.gather(*readers, *consumers)
+        else:
+            await asyncio.wait(readers + consumers, timeout=duration_s)
+    finally:
+        #readers are stopped before the consumers (finished tasks are not affected by cancel)
+        for tasks in [readers, consumers]:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        if reporter_task is not None:
+            reporter_task.cancel()
+
+    #blocks read but not yet consumed
+    for stream in streams.values():
+        queue = stream.pop('queue')
+        while not queue.empty():
+            block = queue.get_nowait()
+            if block is not None:
+                stream['buffer'].extend(*block)
+    return streams
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: rolling_stats(streams, flow_meter='SLI-0430', bits=11)
+
+Summary:
+Function calculates the statistics of the samples currently in the ring buffer of each sensor stream (see
+sensiron_first_order_uncertainty fn in functions.py) and outputs a dataframe of the form
+
+[sensor_id, # of Samples, Avg. Flow [uL/min], u_sli_o [uL/min], u_sli_1 [uL/min], total samples, dropped samples]
+
+"""
+
+def rolling_stats(streams, flow_meter='SLI-0430', bits=11):
+    rows = []
+    for sensor_id, stream in streams.items():
+        buffer = stream['buffer']
+        if buffer.size < 2:
+            continue
+        df = pd.DataFrame({'Flow [ul/min]': buffer.flow[:buffer.size]})
+        stats = sensiron_first_order_uncertainty({'0': df}, flow_meter=flow_meter, bits=bits)['0']
+        rows.append([sensor_id] + stats[1:] + [buffer.total, stream['dropped']])
+    return pd.DataFrame(rows, columns=['sensor_id', '# of Samples', 'Avg. Flow [uL/min]', 'u_sli_o [uL/min]',
+                                       'u_sli_1 [uL/min]', 'total samples', 'dropped samples'])
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: benchmark_ingest(num_sensors=16, rate_hz=1000, duration_s=5.0, block_size=100, realtime=True,
+                           policy='drop_oldest')
+
+Summary:
+Function runs the ingest service with num_sensors simulated sensors at rate_hz samples/s each for duration_s [s] and
+outputs a dictionary of the form {'samples', 'dropped', 'elapsed_s', 'samples_per_s', 'required_samples_per_s',
+'stats'} where required_samples_per_s = num_sensors*rate_hz is the throughput needed to keep up in real time. With
+realtime=False the simulators produce samples as fast as possible, giving the maximum throughput of the service.
+
+"""
+
+def benchmark_ingest(num_sensors=16, rate_hz=1000, duration_s=5.0, block_size=100, realtime=True,
+                     policy='drop_oldest'):
+    transports = [SimulatedSensorTransport('sensor_' + str(i), rate_hz=rate_hz, block_size=block_size,
+                                           mean_flow=50*(i+1), realtime=realtime, seed=i) for i in range(num_sensors)]
+    t_start = time.perf_counter()
+    streams = asyncio.run(ingest_sensors(transports, buffer_capacity=int(rate_hz*duration_s), policy=policy,
+                                         duration_s=duration_s))
+    elapsed = time.perf_counter() - t_start
+    samples = sum(stream['buffer'].total for stream in streams.values())
+    return {'samples': samples, 'dropped': sum(stream['dropped'] for stream in streams.values()), 'elapsed_s': elapsed,
+            'samples_per_s': samples/elapsed, 'required_samples_per_s': num_sensors*rate_hz,
+            'stats': rolling_stats(streams)}
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+if __name__ == '__main__':
+    #number of simulated sensors, sample rate of each sensor [Hz] and duration of benchmark [s]
+    num_sensors = 32
+    rate_hz = 2000
+    duration_s = 5.0
+
+    for realtime in [True, False]:
+        result = benchmark_ingest(num_sensors, rate_hz, duration_s, realtime=realtime)
+        print(('real time' if realtime else 'maximum') + ' throughput: ' + str(round(result['samples_per_s'])) +
+              ' samples/s (required ' + str(result['required_samples_per_s']) + ' samples/s), dropped samples: ' +
+              str(result['dropped']))
+    print(result['stats'])
@@ -0,0 +1,64 @@
+"""
+Title: outlier_diagnostics_combined_df.py
+
+Summary:
+Code intakes .csv files created by neg_and_pos_q_combined_file.py (in ./outputs/combined_pos_neg_q) of form:
+
+[P [mbar] Q_sli [uL/min] u_q_sli [uL/min], u_q_sli_rel [%],Q_mass_meas [uL/min] ,u_q_m [uL/min], u_q_m_rel [%]]
+
+and fits the correction model Q_actual = B_1*Q_sli + B_o for each viscosity by OLS, Tukey bisquare IRLS and RANSAC (see
+robust_fitting.py). Program prints the leave-one-out and k-fold cross-validation error and the parameters of each fit for
+every viscosity, as well as the calibration points flagged as high leverage or high residual (a bad mass balance point
+e.g. evaporation or mistimed Measurement Time [s]). Program outputs both tables as .csv files to
+./outputs/outlier_diagnostics/.
+
+Dependencies:
+1. Path from pathlib
+2. pandas
+3. correction_models.py
+4. robust_fitting.py
+
+Notes:
+1. flagged points should be checked (and remeasured if necessary) before using plotting_combined_df.py output
+2. points are flagged with the same multiplicity corrected thresholds as residual_diagnostics_combined_df.py, set
+    t_threshold to a number to use a fixed threshold on the absolute externally studentized residual instead
+
+"""
+
+from pathlib import Path
+import pandas as pd
+from correction_models import read_correction_data
+from robust_fitting import point_diagnostics
+
+#threshold on absolute externally studentized residual for flagging points (Bonferroni corrected if None)
+t_threshold = None
+
+#number of folds for k-fold cross-validation
+k_folds = 5
+
+# specify path of data to use for correction fitting
+p = Path('./outputs/combined_pos_neg_q/')
+
+#creating dictionary of dataframes for each set of correction data with key value pair {visc_cSt: df}
+dict_of_combined_data = read_correction_data(p)
+
+#calculating diagnostics of each calibration point and summary of each viscosity
+df_points, df_summary = point_diagnostics(dict_of_combined_data, t_threshold=t_threshold, k=k_folds)
+print(df_summary.to_string())
+
+df_flagged = df_points[df_points['flagged']]
+if len(df_flagged) > 0:
+    print('flagged calibration points:')
+    print(df_flagged.to_string())
+else:
+    print('no calibration points flagged')
+
+#outputting tables as .csv in ./outputs/outlier_diagnostics
+question = input('Output diagnostics tables as .csv files? (y/n): ')
+while question != 'y' and question !='n':
+    question = input("please input 'y' or 'n': ")
+if question == 'y':
+    df_points.to_csv('./outputs/outlier_diagnostics/point_diagnostics.csv')
+    df_summary.to_csv('./outputs/outlier_diagnostics/summary.csv')
+elif question =='n':
+    print('results not output to .csv')
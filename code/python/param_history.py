@@ -0,0 +1,328 @@
+"""
+Title: param_history.py
+
+Summary:
+Functions for keeping an append-only history of the estimated correction parameters of every calibration (output of
+plotting_combined_df.py, estimated_params_and_uncert.csv, which is overwritten on every run) and tracking the drift and
+stability of the parameters of each viscosity over time. The history is stored in the folder history_dir as:
+
+1. history.csv, one row per viscosity per calibration of the form
+    [run_id, timestamp, campaign, flow_case, Viscosity [cSt], beta_0_hat [uL/min], u_beta_0_hat [uL/min],
+     u_beta_0_hat_rel [%], beta_1_hat, u_beta_1_hat, u_beta_1_hat_rel [%], r_squared, metadata]
+    rows are only ever appended, never modified
+2. history_index.json, index of the history of the form {'flow_case/visc_cSt': {'offsets': [byte offset of each row in
+    history.csv], 'sources': [source hash of each row], 'beta_0_hat [uL/min]': control chart state,
+    'beta_1_hat': control chart state}}, so the history of a single viscosity can be read without reading the whole file
+    and the control chart statistics are updated incrementally (O(1) per new calibration)
+
+Each row is keyed on its viscosity and the hash of the source of its fit (see fit_source_hash fn), a fit that is already
+in the history (e.g. the same fit appended twice) is skipped so that repeated runs do not distort the control charts.
+
+Control chart statistics of each parameter, x, are calculated relative to the running mean and standard deviation of all
+previous calibrations of that viscosity (Welford's algorithm), z_t = (x_t - mean_(t-1))/std_(t-1):
+
+EWMA: e_t = lambda*z_t + (1-lambda)*e_(t-1), alarm if |e_t| > L*sqrt(lambda/(2-lambda))
+CUSUM: C+_t = max(0, C+_(t-1) + z_t - k), C-_t = max(0, C-_(t-1) - z_t - k), alarm if C+_t > h or C-_t > h
+
+A new fit is compared to the history by
+
+z = (x_new - mean)/sqrt((u_new/1.96)^2 + std^2)
+
+where u_new is the uncertainty of the new fit at 95% confidence, if |z| < z_crit for both parameters the last calibration
+can be reused, otherwise the full calibration should be rerun.
+
+Dependencies:
+1. Path from pathlib
+2. csv
+3. json
+4. os
+5. hashlib
+6. datetime
+7. numpy
+8. pandas
+
+Notes:
+1. control chart statistics start once a viscosity has at least 2 previous calibrations (std needed)
+
+"""
+
+from pathlib import Path
+import csv
+import json
+import os
+import hashlib
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+#columns of estimated_params_and_uncert.csv (see plotting_combined_df.py)
+param_columns = ['Viscosity [cSt]', 'beta_0_hat [uL/min]', 'u_beta_0_hat [uL/min]', 'u_beta_0_hat_rel [%]', 'beta_1_hat',
+                 'u_beta_1_hat', 'u_beta_1_hat_rel [%]', 'r_squared']
+history_columns = ['run_id', 'timestamp', 'campaign', 'flow_case'] + param_columns + ['metadata']
+
+#tracked parameters and the column of their uncertainty
+tracked_params = {'beta_0_hat [uL/min]': 'u_beta_0_hat [uL/min]', 'beta_1_hat': 'u_beta_1_hat'}
+
+
+"""
+Function: new_control_state()
+
+Summary:
+Function outputs the initial control chart state of a parameter, of the form
+
+{'n': 0, 'mean': 0.0, 'm2': 0.0, 'ewma': 0.0, 'cusum_pos': 0.0, 'cusum_neg': 0.0}
+
+where n, mean and m2 are the running count, mean and sum of squared deviations (Welford's algorithm).
+
+"""
+
+def new_control_state():
+    return {'n': 0, 'mean': 0.0, 'm2': 0.0, 'ewma': 0.0, 'cusum_pos': 0.0, 'cusum_neg': 0.0}
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: update_control_state(state, x, lam=0.2, L=3.0, k=0.5, h=5.0)
+
+Summary:
+Function updates the control chart state of a parameter with a new value x and outputs the tuple (new_state, stats), where
+stats is a dictionary of the form {'z', 'ewma', 'ewma_limit', 'ewma_alarm', 'cusum_pos', 'cusum_neg', 'cusum_alarm'}
+(z, ewma and cusum are nan and alarms False while there are fewer than 2 previous values).
+
+Inputs:
+1. state, control chart state (see new_control_state fn)
+2. x, new value of the parameter
+3. lam, L, weight and width of control limits (in standard deviations) of the EWMA chart
+4. k, h, allowance and decision interval (in standard deviations) of the CUSUM chart
+
+"""
+
+def update_control_state(state, x, lam=0.2, L=3.0, k=0.5, h=5.0):
+    state = dict(state)
+    ewma_limit = L*np.sqrt(lam/(2-lam))
+    stats = {'z': np.nan, 'ewma': np.nan, 'ewma_limit': ewma_limit, 'ewma_alarm': False, 'cusum_pos': np.nan,
+             'cusum_neg': np.nan, 'cusum_alarm': False}
+    if state['n'] >= 2:
+        std = np.sqrt(state['m2']/(state['n']-1))
+        z = (x-state['mean'])/std if std > 0 else 0.0
+        state['ewma'] = lam*z + (1-lam)*state['ewma']
+        state['cusum_pos'] = max(0.0, state['cusum_pos'] + z - k)
+        state['cusum_neg'] = max(0.0, state['cusum_neg'] - z - k)
+        stats.update({'z': z, 'ewma': state['ewma'], 'ewma_alarm': bool(abs(state['ewma']) > ewma_limit),
+                      'cusum_pos': state['cusum_pos'], 'cusum_neg': state['cusum_neg'],
+                      'cusum_alarm': bool(state['cusum_pos'] > h or state['cusum_neg'] > h)})
+
+    #updating running mean and sum of squared deviations
+    state['n'] += 1
+    delta = x - state['mean']
+    state['mean'] += delta/state['n']
+    state['m2'] += delta*(x-state['mean'])
+    return state, stats
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: read_history_index(history_dir) / write_history_index(history_dir, index)
+
+Summary:
+Functions read and write the index of the history (history_index.json), the index is written to a temporary file first and
+then renamed so that it is never left partially written.
+
+"""
+
+def read_history_index(history_dir):
+    path = Path(history_dir) / 'history_index.json'
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_history_index(history_dir, index):
+    path = Path(history_dir) / 'history_index.json'
+    tmp_path = path.with_suffix('.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp_path, path)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: fit_source_hash(df)
+
+Summary:
+Function outputs the sha1 hash (hex) of a dataframe (values and column names), used as the source hash of a fit in the
+history, either of the data of the fit (e.g. the combined data of a viscosity) or of its row of estimated parameters.
+
+"""
+
+def fit_source_hash(df):
+    h = hashlib.sha1()
+    h.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    h.update(','.join(str(col) for col in df.columns).encode('utf-8'))
+    return h.hexdigest()
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: append_fit_history(df_params, history_dir, campaign, flow_case='combined', metadata=None, timestamp=None,
+                             source_hashes=None)
+
+Summary:
+Function appends the estimated parameters of a calibration (dataframe of the form of estimated_params_and_uncert.csv, see
+plotting_combined_df.py) to the history in history_dir, updates the index and control chart state of each viscosity, and
+outputs a dataframe of the control chart statistics of the appended rows of the form
+
+[Viscosity [cSt], parameter, value, z, ewma, ewma_limit, ewma_alarm, cusum_pos, cusum_neg, cusum_alarm]
+
+Inputs:
+1. df_params, dataframe of estimated parameters and uncertainties for each viscosity
+2. history_dir, path of folder of the history
+3. campaign, name of the calibration campaign
+4. flow_case, flow case of the parameters (combined, negative_q or positive_q)
+5. metadata, dictionary of additional information of the calibration (sensor serial number, operator, etc.)
+6. timestamp, time of the calibration (now if None)
+7. source_hashes, dictionary of the form {viscosity: source hash of the fit} (see fit_source_hash fn), viscosities that
+    are not in it are keyed on the hash of their row of estimated parameters
+
+Notes:
+1. rows whose viscosity and source hash are already in the history are skipped (not appended and not in the output)
+
+"""
+
+def append_fit_history(df_params, history_dir, campaign, flow_case='combined', metadata=None, timestamp=None,
+                       source_hashes=None):
+    history_dir = Path(history_dir)
+    history_dir.mkdir(parents=True, exist_ok=True)
+    history_path = history_dir / 'history.csv'
+    if timestamp is None:
+        timestamp = datetime.now()
+    run_id = timestamp.strftime('%Y%m%dT%H%M%S') + '_' + str(campaign)
+    index = read_history_index(history_dir)
+
+    list_of_stats = []
+    with open(history_path, 'a', newline='') as f:
+        writer = csv.writer(f)
+        if f.tell() == 0:
+            writer.writerow(history_columns)
+        for i, row in df_params.iterrows():
+            key = flow_case + '/' + str(int(row['Viscosity [cSt]'])) + '_cSt'
+            entry = index.setdefault(key, {'offsets': []})
+            source = (source_hashes or {}).get(row['Viscosity [cSt]'])
+            if source is None:
+                source = fit_source_hash(df_params.loc[[i], param_columns])
+            #skipping fits that are already in the history
+            if source in entry.setdefault('sources', []):
+                continue
+            entry['sources'].append(source)
+            f.flush()
+            entry['offsets'].append(f.tell())
+            writer.writerow([run_id, timestamp.isoformat(), campaign, flow_case] + [row[col] for col in param_columns]
+                            + [json.dumps(metadata or {})])
+
+            for param in tracked_params:
+                entry[param], stats = update_control_state(entry.get(param, new_control_state()), float(row[param]))
+                stats.update({'Viscosity [cSt]': row['Viscosity [cSt]'], 'parameter': param, 'value': row[param]})
+                list_of_stats.append(stats)
+
+    write_history_index(history_dir, index)
+    col_order = ['Viscosity [cSt]', 'parameter', 'value', 'z', 'ewma', 'ewma_limit', 'ewma_alarm', 'cusum_pos',
+                 'cusum_neg', 'cusum_alarm']
+    return pd.DataFrame(list_of_stats, columns=col_order)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: read_fit_history(history_dir, viscosity=None, flow_case='combined')
+
+Summary:
+Function reads the history of estimated parameters from history_dir and outputs it as a dataframe (see history.csv
+columns). If viscosity [cSt] is given, only the rows of that viscosity and flow case are read using the byte offsets in the
+index.
+
+"""
+
+def read_fit_history(history_dir, viscosity=None, flow_case='combined'):
+    history_path = Path(history_dir) / 'history.csv'
+    if not history_path.exists():
+        return pd.DataFrame(columns=history_columns)
+    if viscosity is None:
+        return pd.read_csv(history_path)
+
+    index = read_history_index(history_dir)
+    offsets = index.get(flow_case + '/' + str(int(viscosity)) + '_cSt', {'offsets': []})['offsets']
+    list_of_rows = []
+    with open(history_path, newline='') as f:
+        for offset in offsets:
+            f.seek(offset)
+            list_of_rows.append(next(csv.reader(f)))
+    df = pd.DataFrame(list_of_rows, columns=history_columns)
+    for col in param_columns:
+        df[col] = df[col].astype(float)
+    return df
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: compare_fit_to_history(df_params, history_dir, flow_case='combined', z_crit=1.96)
+
+Summary:
+Function compares the estimated parameters of a new calibration (dataframe of the form of estimated_params_and_uncert.csv)
+to the history of each viscosity using the running mean and standard deviation in the index (no need to read the history)
+and outputs a dataframe of the form
+
+[Viscosity [cSt], num_previous, z_beta_0, z_beta_1, significant_change, decision]
+
+where decision is 'reuse' (no significant change of either parameter, the last calibration can be reused), 'recalibrate'
+or 'insufficient history' (fewer than 2 previous calibrations).
+
+Inputs:
+1. df_params, dataframe of estimated parameters and uncertainties (95% CI) for each viscosity
+2. history_dir, path of folder of the history
+3. flow_case, flow case of the parameters
+4. z_crit, critical value of |z| for a significant change
+
+"""
+
+def compare_fit_to_history(df_params, history_dir, flow_case='combined', z_crit=1.96):
+    index = read_history_index(history_dir)
+    list_of_rows = []
+    for i, row in df_params.iterrows():
+        entry = index.get(flow_case + '/' + str(int(row['Viscosity [cSt]'])) + '_cSt', {})
+        out_row = {'Viscosity [cSt]': row['Viscosity [cSt]'], 'num_previous': len(entry.get('offsets', []))}
+        significant = False
+        for param, u_param in tracked_params.items():
+            name = 'z_' + param.split('_hat')[0]
+            state = entry.get(param, new_control_state())
+            if state['n'] < 2:
+                out_row[name] = np.nan
+                continue
+            var_hist = state['m2']/(state['n']-1)
+            z = (row[param]-state['mean'])/np.sqrt((row[u_param]/1.96)**2 + var_hist)
+            out_row[name] = z
+            significant = significant or abs(z) > z_crit
+        out_row['significant_change'] = significant
+        if out_row['num_previous'] < 2:
+            out_row['decision'] = 'insufficient history'
+        elif significant:
+            out_row['decision'] = 'recalibrate'
+        else:
+            out_row['decision'] = 'reuse'
+        list_of_rows.append(out_row)
+    return pd.DataFrame(list_of_rows)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
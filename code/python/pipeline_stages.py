@@ -0,0 +1,317 @@
+"""
+Title: pipeline_stages.py
+
+Summary:
+Functions performing each stage of the calibration pipeline on a single viscosity/flow case, equivalent to the
+calculations of the programs (which are run by hand for one flow case and viscosity at a time and ask for user input):
+
+1. average_run (flow_rate_meas_to_avg.py), average flow rate and first order uncertainty of one pressure_mbar.csv file
+   (or average_archived_run of one run of a run archive, see run_archive.py)
+2. mass_to_volume_flow_rate (mass_fr_to_vol_fr.py), mass and volume flow rate from the mass balance measurements
+3. combine_sensor_and_mass (flow_meter_fr_and_meas_fr_to_csv.py), sensor and mass balance flow rates in one dataframe
+4. combine_pos_neg (neg_and_pos_q_combined_file.py), negative and positive flow rate data in ascending order
+5. fit_linear_correction (plotting_combined_df.py), OLS estimate of Q_actual = B_1*Q_sli + B_o and uncertainty (95% CI)
+6. plot_correction_fit (plotting_combined_df.py), plot of data and fit saved to file
+
+so that the stages can be called from other code (e.g. watch_pipeline.py) without user input.
+
+Dependencies:
+1. Path from pathlib
+2. matplotlib.pyplot
+3. numpy
+4. pandas
+5. scipy.stats
+6. functions.py
+7. correction_models.py
+8. run_archive.py
+9. fluid_properties.py
+
+Notes:
+1. density of si oil is taken from si_oil_density (from sigma aldrich) as in mass_fr_to_vol_fr.py, or at the temperature
+    of each measurement from fluid_properties.py (see mass_to_volume_flow_rate_t and run_density fns)
+
+"""
+
+from pathlib import Path
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from scipy import stats
+from functions import read_sensirion_csv, sensiron_first_order_uncertainty, find_temperature_column
+from run_archive import read_archive_run
+from fluid_properties import density
+from correction_models import model_matrix, batched_ols
+
+#density [kg/m^3] of si oil for each viscosity (on bottle and sigma_aldrich website)
+si_oil_density = {'5_cSt': 913, '10_cSt': 930, '20_cSt': 950, '50_cSt': 960, '100_cSt': 960}
+
+#balance resolution [g] used for uncertainty of mass flow rate
+balance_resolution = 0.005
+
+avg_columns = ['Pressure [mbar]', '# Samples', 'Avg. Flow [uL/min]', 'u_sli_o [uL/min]', 'u_sli_1 [uL/min]']
+#average temperature of a run, appended to avg_columns when the sensor export has a temperature column
+temperature_column = 'T [C]'
+param_columns = ['Viscosity [cSt]', 'beta_0_hat [uL/min]', 'u_beta_0_hat [uL/min]', 'u_beta_0_hat_rel [%]', 'beta_1_hat',
+                 'u_beta_1_hat', 'u_beta_1_hat_rel [%]', 'r_squared']
+
+
+"""
+Function: average_run(csv_path, flow_meter='SLI-0430', bits=11, quantized=False, temperature=False)
+
+Summary:
+Function intakes the path of a .csv file output by the sensiron flow viewer software for one test pressure (named
+pressure_mbar.csv) and outputs the list [Pressure [mbar], # Samples, Avg. Flow [uL/min], u_sli_o [uL/min],
+u_sli_1 [uL/min]] (see sensiron_first_order_uncertainty fn in functions.py, quantized=True for integer statistics of
+the int16 codes stored at read time, a ValueError is raised if the flow rates are not on the code grid).
+If temperature is True the average temperature [C] of the run is appended to the list (nan if the export has no
+temperature column, see find_temperature_column fn in functions.py).
+
+"""
+
+def average_run(csv_path, flow_meter='SLI-0430', bits=11, quantized=False, temperature=False):
+    key = Path(csv_path).stem.replace('_mbar', '')
+    df, header_lines = read_sensirion_csv(csv_path, codes=quantized, flow_meter=flow_meter, bits=bits)
+    avg = sensiron_first_order_uncertainty({key: df}, flow_meter=flow_meter, bits=bits, quantized=quantized)[key]
+    if temperature:
+        temp_column = find_temperature_column(df)
+        avg.append(pd.to_numeric(df[temp_column], errors='coerce').mean() if temp_column is not None else np.nan)
+    return avg
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: average_archived_run(archive_path, run_name, flow_meter='SLI-0430', bits=11, quantized=False, index=None)
+
+Summary:
+Function is average_run for a run stored in a run archive (see run_archive.py), where run_name is the path of the
+original .csv file relative to the data folder without .csv (e.g. flow_rate_measurements/positive_q/visc_5_cSt/100_mbar).
+
+"""
+
+def average_archived_run(archive_path, run_name, flow_meter='SLI-0430', bits=11, quantized=False, index=None):
+    key = Path(run_name).name.replace('_mbar', '')
+    df, header_lines = read_archive_run(archive_path, run_name, columns=['Flow [ul/min]'], index=index)
+    return sensiron_first_order_uncertainty({key: df}, flow_meter=flow_meter, bits=bits, quantized=quantized)[key]
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: average_runs_to_df(list_of_avg)
+
+Summary:
+Function creates the dataframe of the form [Pressure [mbar], # Samples, Avg. Flow [uL/min], u_sli_o [uL/min],
+u_sli_1 [uL/min]] (and T [C] for average_run with temperature=True) sorted in ascending order of pressure from a list of
+outputs of average_run (as output by flow_rate_meas_to_avg.py). T [C] is left out if no run has a temperature.
+
+"""
+
+def average_runs_to_df(list_of_avg):
+    columns = avg_columns + [temperature_column] if len(list_of_avg[0]) > len(avg_columns) else avg_columns
+    df = pd.DataFrame(list_of_avg, columns=columns)
+    if temperature_column in df.columns and df[temperature_column].isna().all():
+        df = df.drop(columns=[temperature_column])
+    return df.sort_values('Pressure [mbar]').reset_index(drop=True)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: mass_to_volume_flow_rate(df, rho)
+
+Summary:
+Function intakes a dataframe of mass balance measurements of the form [P [mbar], Measurement Time [s], M_i [g], M_f [g]]
+and the density of the fluid [kg/m^3] (scalar, or array with the density of each row) and outputs a dataframe of the
+form
+
+[P [mbar], m_dot [kg/s], u_m_dot [kg/s], Q [uL/min], u_q_vl [uL/min]]
+
+(see mass_fr_to_vol_fr.py).
+
+"""
+
+def mass_to_volume_flow_rate(df, rho):
+    m_diff = (df['M_f [g]'] - df['M_i [g]'])*(1/1000)
+    m_dot = m_diff/df['Measurement Time [s]']
+    u_m_dot = m_diff/(df['Measurement Time [s]']*df['Measurement Time [s]'])*balance_resolution
+    output_df = pd.DataFrame(df['P [mbar]'])
+    output_df['m_dot [kg/s]'] = m_dot
+    output_df['u_m_dot [kg/s]'] = u_m_dot
+    output_df['Q [uL/min]'] = m_dot/rho*(60000*10**6)
+    output_df['u_q_vl [uL/min]'] = u_m_dot/rho*(60000*10**6)
+    return output_df
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: mass_to_volume_flow_rate_t(df, fluid_key, temperature, table=None)
+
+Summary:
+Function is mass_to_volume_flow_rate with the density of the fluid (e.g. '5_cSt') at the temperature [C] of each row
+(array of the same length as df, e.g. T [C] of the average flow rate dataframe of the same pressures), see density fn in
+fluid_properties.py (table of measured properties, generated table if None).
+
+"""
+
+def mass_to_volume_flow_rate_t(df, fluid_key, temperature, table=None):
+    rho = density(fluid_key, np.asarray(temperature, dtype=float), table)
+    return mass_to_volume_flow_rate(df, rho)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: run_density(fluid_key, pressures, df_meas=None, table=None)
+
+Summary:
+Function outputs the tuple (rho, temperature) of arrays of the density [kg/m^3] of a fluid (e.g. '5_cSt') and of the
+temperature [C] at the given test pressures [mbar] (P [mbar] of a mass balance dataframe). The temperature of a pressure
+is the average temperature of the sensor run of the same pressure (T [C] of df_meas, see average_runs_to_df fn) and the
+density is taken at that temperature (see density fn in fluid_properties.py). Pressures without a temperature (no
+df_meas, no T [C] column or no run of that pressure) use the fixed density of si_oil_density (temperature nan).
+
+"""
+
+def run_density(fluid_key, pressures, df_meas=None, table=None):
+    pressures = np.asarray(pressures, dtype=float)
+    temperature = np.full(len(pressures), np.nan)
+    if df_meas is not None and temperature_column in df_meas.columns:
+        run_temperatures = dict(zip(df_meas['Pressure [mbar]'].astype(float),
+                                    df_meas[temperature_column].astype(float)))
+        temperature = np.array([run_temperatures.get(pressure, np.nan) for pressure in pressures])
+    has_temperature = np.isfinite(temperature)
+    rho = np.full(len(pressures), float(si_oil_density.get(fluid_key, np.nan)))
+    if np.any(has_temperature):
+        rho[has_temperature] = density(fluid_key, temperature[has_temperature], table)
+    return rho, temperature
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: combine_sensor_and_mass(df_meas, df_v_fr, flow_case)
+
+Summary:
+Function intakes the average sensor flow rate dataframe (see average_runs_to_df fn) and the volume flow rate dataframe
+(see mass_to_volume_flow_rate fn) of a viscosity and flow case and outputs a dataframe of the form
+
+[P [mbar], Q_sli [uL/min], u_q_sli [uL/min], u_q_sli_rel [%], Q_mass_meas [uL/min], u_q_m [uL/min], u_q_m_rel [%]]
+
+(see flow_meter_fr_and_meas_fr_to_csv.py), with T [C] added if df_meas has a temperature column. Rows are matched by
+position as in flow_meter_fr_and_meas_fr_to_csv.py.
+
+"""
+
+def combine_sensor_and_mass(df_meas, df_v_fr, flow_case):
+    df_v_fr = df_v_fr.reset_index(drop=True)
+    df_combined = pd.DataFrame({'P [mbar]': df_meas['Pressure [mbar]'], 'Q_sli [uL/min]': df_meas['Avg. Flow [uL/min]'],
+                                'u_q_sli [uL/min]': df_meas['u_sli_1 [uL/min]'],
+                                'u_q_sli_rel [%]': (df_meas['u_sli_1 [uL/min]']/abs(df_meas['Avg. Flow [uL/min]']))*100})
+    if flow_case == 'negative_q':
+        df_combined['Q_mass_meas [uL/min]'] = -1*df_v_fr['Q [uL/min]']
+    else:
+        df_combined['Q_mass_meas [uL/min]'] = df_v_fr['Q [uL/min]']
+    df_combined['u_q_m [uL/min]'] = df_v_fr['u_q_vl [uL/min]']
+    df_combined['u_q_m_rel [%]'] = df_v_fr['u_q_vl [uL/min]']/abs(df_v_fr['Q [uL/min]'])*100
+    if temperature_column in df_meas.columns:
+        df_combined[temperature_column] = df_meas[temperature_column]
+    return df_combined
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: combine_pos_neg(df_pos, df_neg)
+
+Summary:
+Function combines the combined dataframes (see combine_sensor_and_mass fn) of the positive and negative flow case of a
+viscosity into one dataframe in ascending order of flow rate, i.e. -Q_max to +Q_max (see neg_and_pos_q_combined_file.py).
+
+"""
+
+def combine_pos_neg(df_pos, df_neg):
+    df_neg_flipped = df_neg.iloc[::-1].reset_index(drop=True)
+    return pd.concat([df_neg_flipped, df_pos])
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: fit_linear_correction(df, viscosity, confidence=0.95)
+
+Summary:
+Function performs OLS estimation of Q_actual = B_1*Q_sli + B_o for the combined dataframe of a viscosity and outputs the
+tuple (row, beta_hat) where row is the list [viscosity, beta_0_hat, u_beta_0_hat, u_beta_0_hat_rel, beta_1_hat,
+u_beta_1_hat, u_beta_1_hat_rel, r_squared] of estimated_params_and_uncert.csv (uncertainty is the half width of the
+confidence interval of each parameter, as in plotting_combined_df.py).
+
+"""
+
+def fit_linear_correction(df, viscosity, confidence=0.95):
+    spec = {'name': 'poly_1', 'kind': 'polynomial', 'degree': 1}
+    x_mat = model_matrix(df['Q_sli [uL/min]'].values, spec)
+    y = df['Q_mass_meas [uL/min]'].values
+    results = batched_ols(x_mat[None], y[None], np.ones((1, len(y))))
+    beta_hat = results['beta_hat'][0]
+    t_crit = stats.t.ppf(0.5+confidence/2, results['dof'][0])
+    u_beta_hat = t_crit*np.sqrt(np.diag(results['cov_beta_hat'][0]))
+    row = [viscosity, beta_hat[0], u_beta_hat[0], abs(u_beta_hat[0]/beta_hat[0])*100, beta_hat[1], u_beta_hat[1],
+           abs(u_beta_hat[1]/beta_hat[1])*100, results['r_squared'][0]]
+    return row, beta_hat
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: plot_correction_fit(df, beta_hat, r_squared, output_path)
+
+Summary:
+Function plots the measured flow rates (with uncertainties) of a combined dataframe and the estimated correction line with
+its equation and R^2 (as in plotting_combined_df.py) and saves the figure to output_path instead of showing it.
+
+"""
+
+def plot_correction_fit(df, beta_hat, r_squared, output_path):
+    q_sli_exp_data = df['Q_sli [uL/min]']
+    E_y_hat = beta_hat[0] + beta_hat[1]*q_sli_exp_data
+
+    plt.rc('font', family='Times New Roman')
+    plt.rcParams.update({'font.size': 12})
+    fig, ax = plt.subplots()
+    ax.errorbar(q_sli_exp_data, df['Q_mass_meas [uL/min]'], yerr=df['u_q_m [uL/min]'], xerr=df['u_q_sli [uL/min]'],
+                marker="o", fillstyle='none', fmt=' ', capsize=3, ecolor='blue', color='blue')
+    ax.plot(q_sli_exp_data, E_y_hat, "--", color="black")
+
+    eqn = r'$\mathdefault{Q_{actual}}$' + r'[$\frac{\mathdefault{\mu L}}{\mathdefault{min}}$] ' + ' = ' + '(' + \
+        str(round(beta_hat[1], 4)) + ')' + r'$\mathdefault{Q_{measured}}$' + \
+        r'[$\frac{\mathdefault{\mu L}}{\mathdefault{min}}$] ' + ' + ' + '(' + str(round(beta_hat[0], 4)) + ')' + \
+        r'[$\frac{\mathdefault{\mu L}}{\mathdefault{min}}$]'
+    ax.text(0.02, .96, eqn + '\n' + r'$\mathdefault{R^2}$' + ' = ' + str(round(r_squared, 5)),
+            horizontalalignment='left', verticalalignment='top', fontsize=12, bbox=dict(facecolor='white'),
+            transform=ax.transAxes)
+    plt.legend(['Fit', 'Measurements'], loc='lower right', framealpha=1, edgecolor='black', fancybox=False)
+    plt.ylabel(r'$\mathdefault{Q_{actual}}$' + r'[$\frac{\mathdefault{\mu L}}{\mathdefault{min}}$]', fontsize=12)
+    plt.xlabel(r'$\mathdefault{Q_{measured}}$' + r'[$\frac{\mathdefault{\mu L}}{\mathdefault{min}}$]', fontsize=12)
+
+    fig.set_size_inches(8, 6)
+    plt.grid()
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    fig.savefig(output_path, dpi=150)
+    plt.close(fig)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
@@ -0,0 +1,52 @@
+"""
+Title: plot_raw_traces.py
+
+Summary:
+Program intakes the .csv files output by the sensiron flow viewer software for each test pressure of a given flow case and
+viscosity (named pressure_mbar.csv, see flow_rate_meas_to_avg.py) and plots the raw flow rate measurements (Flow [ul/min]
+vs Relative Time[s]) of each run, decimated for fast plotting of long runs (see raw_trace_viewer.py), with the steady state
+window, average flow rate and +/- u_sli_1 band overlaid. Figures are saved (not shown) to
+
+./outputs/raw_traces/flow_case/visc_cSt/pressure_mbar.png
+
+and the min/max pyramid of each run is stored next to its figure (pressure_mbar_pyramid.npz) with the steady state
+window and statistics of the run, so that replotting a run, or a zoomed in time range of it, does not read or decimate
+its .csv file again (minmax method, lttb needs the samples).
+
+Dependencies:
+1. Path from pathlib
+2. raw_trace_viewer.py
+
+Notes:
+1. must specify flow case and viscosity on each run
+2. set t_min and t_max to zoom in on a time range [s] of every run (None for whole run)
+3. method = 'minmax' (envelope, keeps every spike) or 'lttb' (shape preserving subset of samples)
+
+"""
+
+from pathlib import Path
+from raw_trace_viewer import run_pyramid, plot_raw_trace
+
+#specify flow case (negative_q or positive_q) (change on each run)
+flow_case = 'positive_q'
+
+#specify viscosity of Si oil (5,10,20,50,100 cSt) (change on each run)
+viscosity = 5
+
+#time range to plot [s] (None for whole run) and decimation method ('minmax' or 'lttb')
+t_min = None
+t_max = None
+method = 'minmax'
+
+#input path of folder where csv files are stored
+p = Path('../../data/si_oil/flow_rate_measurements/' + flow_case +'/visc_' + str(viscosity)+'_cSt/')
+
+#output path of figures and pyramids
+p_out = Path('./outputs/raw_traces/' + flow_case + '/' + str(viscosity) + '_cSt/')
+
+for path in sorted(p.glob('./*.csv')):
+    df, pyramid = run_pyramid(path, p_out / (path.stem + '_pyramid.npz'), read_data=(method == 'lttb'))
+    steady = plot_raw_trace(df, p_out / (path.stem + '.png'), pyramid=pyramid, t_min=t_min, t_max=t_max, method=method,
+                            title=flow_case + ' ' + str(viscosity) + ' cSt, ' + path.stem.replace('_', ' '))
+    print(path.stem + ': steady state from sample ' + str(steady['i_start']) + ', avg. flow = ' +
+          str(round(steady['avg_flow'], 3)) + ' +/- ' + str(round(steady['u_sli_1'], 3)) + ' uL/min')
@@ -56,6 +56,7 @@ Dependencies:
 3. Path from pathlib
 4. numpy
 5. statsmodels.api
+6. param_history.py (appending estimated parameters to history of calibrations and drift check)
 
 Notes:
 
@@ -67,6 +68,10 @@ import pandas as pd
 from pathlib import Path
 import numpy as np
 import statsmodels.api as sm
+from param_history import append_fit_history, compare_fit_to_history, fit_source_hash
+
+#name of calibration campaign (used for history of estimated parameters in ./outputs/est_params_and_uncert/history/)
+campaign = 'si_oil'
 
 
 # specify path of data to use for correction fitting
@@ -230,4 +235,17 @@ while question != 'y' and question !='n':
 if question == 'y':
     df_sort.to_csv('./outputs/est_params_and_uncert/estimated_params_and_uncert.csv')
 elif question =='n':
-    print('results not output to .csv')
\ No newline at end of file
+    print('results not output to .csv')
+
+#comparing estimated parameters to history of previous calibrations (drift check) and appending them to the history
+history_dir = Path('./outputs/est_params_and_uncert/history/')
+print(compare_fit_to_history(df_sort, history_dir))
+question = input('Append parameters to calibration history? (y/n): ')
+while question != 'y' and question !='n':
+    question = input("please input 'y' or 'n': ")
+if question == 'y':
+    #fits are keyed on the hash of their data, so appending the same fit again is skipped
+    source_hashes = {int(key.replace('_cSt', '')): fit_source_hash(df) for key, df in dict_of_combined_data.items()}
+    print(append_fit_history(df_sort, history_dir, campaign, source_hashes=source_hashes))
+elif question =='n':
+    print('results not appended to history')
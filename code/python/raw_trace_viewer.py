@@ -0,0 +1,368 @@
+"""
+Title: raw_trace_viewer.py
+
+Summary:
+Functions for fast plotting of the raw flow rate measurements (Flow [ul/min] vs Relative Time[s]) of a run at constant
+pressure output by the sensiron flow viewer software, which can have millions of samples. Plotting every sample with
+matplotlib is unusably slow, so the trace is decimated before plotting by one of:
+
+1. min/max decimation, where the samples are divided into bins and the minimum and maximum of each bin are plotted (the
+    envelope of the trace, no spike is lost). The bin minima/maxima are precomputed once per run as a multi-resolution
+    pyramid (level L has bins of factor^L samples, each level computed from the one below it) which is stored as a .npz
+    file, so plotting any time range at any zoom only reads the level whose number of bins in the range is closest to the
+    number of points to be plotted.
+2. largest triangle three buckets (LTTB), which selects the samples that best preserve the visual shape of the trace.
+
+The plot of the decimated trace is overlaid with the steady state window (see steady_state_window fn in functions.py), the
+average flow rate of the steady state window and its first order uncertainty band (+/- u_sli_1) and saved to file (no
+plt.show(), so plots can be made headless).
+
+Dependencies:
+1. Path from pathlib
+2. matplotlib.pyplot
+3. numpy
+4. pandas
+5. functions.py
+
+Notes:
+1. the pyramid file of a run also stores the modification time and size of the .csv file it was built from and the
+    steady state window and statistics of the run, so a run with a valid pyramid is plotted (minmax) without reading
+    its .csv file, pyramid files are rebuilt automatically if the .csv file has changed
+
+"""
+
+from pathlib import Path
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from functions import read_sensirion_csv, steady_state_window, sensiron_first_order_uncertainty
+
+
+"""
+Function: build_minmax_pyramid(time, flow, factor=4, min_bins=256)
+
+Summary:
+Function precomputes the min/max decimation pyramid of a run and outputs a dictionary of the form
+
+{'factor': int, 'levels': [{'t_start': (B), 't_end': (B), 'min': (B), 'max': (B), 'sum': (B), 'count': (B)}, ...]}
+
+(run_pyramid fn adds the entries 'source' and 'steady', see steady_state_summary fn).
+
+where level 0 has bins of factor samples and each level above it combines factor bins of the level below, down to a level
+with fewer than min_bins bins. All operations are vectorized reshapes of the arrays (the last incomplete bin of each level is
+kept with its count).
+
+Inputs:
+1. time, Relative Time[s] of each sample
+2. flow, Flow [ul/min] of each sample
+3. factor, number of bins (samples for level 0) combined into one bin of the next level
+4. min_bins, levels are added until the number of bins is smaller than min_bins
+
+"""
+
+def build_minmax_pyramid(time, flow, factor=4, min_bins=256):
+    time = np.asarray(time, dtype=float)
+    flow = np.asarray(flow, dtype=float)
+    level = {'t_start': time, 't_end': time, 'min': flow, 'max': flow, 'sum': flow, 'count': np.ones(len(flow))}
+    levels = []
+    while True:
+        level = _combine_bins(level, factor)
+        levels.append(level)
+        if len(level['min']) < min_bins or len(level['min']) == 1:
+            break
+    return {'factor': factor, 'levels': levels}
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: _combine_bins(level, factor)
+
+Summary:
+Function combines each factor consecutive bins of a pyramid level into one bin (helper of build_minmax_pyramid).
+
+"""
+
+def _combine_bins(level, factor):
+    n = len(level['min'])
+    num_bins = -(-n//factor)
+    pad = num_bins*factor - n
+
+    def padded(values, fill):
+        return np.concatenate((values, np.full(pad, fill))).reshape(num_bins, factor)
+
+    t_end = level['t_end']
+    return {'t_start': level['t_start'][::factor],
+            't_end': np.concatenate((t_end[factor-1::factor], t_end[-1:])) if pad else t_end[factor-1::factor],
+            'min': padded(level['min'], np.inf).min(axis=1), 'max': padded(level['max'], -np.inf).max(axis=1),
+            'sum': padded(level['sum'], 0.0).sum(axis=1), 'count': padded(level['count'], 0.0).sum(axis=1)}
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: steady_state_summary(time, flow, flow_meter='SLI-0430', bits=11)
+
+Summary:
+Function outputs the steady state window of a run (see steady_state_window fn in functions.py) and the average flow rate
+and uncertainties of the window as a dictionary of the form
+
+{'i_start', 'i_end', 't_start' [s], 't_end' [s] (time of the last sample of the window), 'num_samples',
+ 'avg_flow' [uL/min], 'u_sli_o' [uL/min], 'u_sli_1' [uL/min]}
+
+"""
+
+def steady_state_summary(time, flow, flow_meter='SLI-0430', bits=11):
+    i_start, i_end = steady_state_window(flow, flow_meter=flow_meter, bits=bits)
+    df_steady = pd.DataFrame({'Flow [ul/min]': flow[i_start:i_end]})
+    pressure, num_samples, avg_flow, u_sli_o, u_sli_1 = \
+        sensiron_first_order_uncertainty({'0': df_steady}, flow_meter=flow_meter, bits=bits)['0']
+    return {'i_start': int(i_start), 'i_end': int(i_end), 't_start': float(time[i_start]),
+            't_end': float(time[i_end-1]), 'num_samples': int(num_samples), 'avg_flow': float(avg_flow),
+            'u_sli_o': float(u_sli_o), 'u_sli_1': float(u_sli_1)}
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: save_pyramid(pyramid, path) / load_pyramid(path)
+
+Summary:
+Functions save a min/max pyramid (with its 'source' and 'steady' entries if present, see run_pyramid fn) to a .npz file
+and load it back.
+
+"""
+
+def save_pyramid(pyramid, path):
+    arrays = {'factor': np.array(pyramid['factor'])}
+    for i, level in enumerate(pyramid['levels']):
+        for name in level:
+            arrays['level_'+str(i)+'_'+name] = level[name]
+    for entry in ['source', 'steady']:
+        for name, value in pyramid.get(entry, {}).items():
+            arrays[entry+'_'+name] = np.array(value)
+    np.savez(path, **arrays)
+
+
+def load_pyramid(path):
+    with np.load(path) as arrays:
+        num_levels = len([name for name in arrays.files if name.startswith('level_') and name.endswith('_min')])
+        levels = []
+        for i in range(num_levels):
+            levels.append({name: arrays['level_'+str(i)+'_'+name]
+                           for name in ['t_start', 't_end', 'min', 'max', 'sum', 'count']})
+        pyramid = {'factor': int(arrays['factor']), 'levels': levels}
+        for entry in ['source', 'steady']:
+            names = [name for name in arrays.files if name.startswith(entry+'_')]
+            if names:
+                pyramid[entry] = {name[len(entry)+1:]: arrays[name].item() for name in names}
+        return pyramid
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: minmax_decimate(pyramid, t_min=None, t_max=None, num_points=2000)
+
+Summary:
+Function outputs the min/max envelope of a run between times t_min and t_max [s] from its pyramid as a tuple of arrays
+(t_start, t_end, flow_min, flow_max), using the finest level with at most num_points bins in the time range.
+
+"""
+
+def minmax_decimate(pyramid, t_min=None, t_max=None, num_points=2000):
+    levels = pyramid['levels']
+    for level in levels:
+        i_0 = 0 if t_min is None else np.searchsorted(level['t_end'], t_min, side='left')
+        i_1 = len(level['min']) if t_max is None else np.searchsorted(level['t_start'], t_max, side='right')
+        if i_1 - i_0 <= num_points:
+            break
+    return level['t_start'][i_0:i_1], level['t_end'][i_0:i_1], level['min'][i_0:i_1], level['max'][i_0:i_1]
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: lttb_decimate(time, flow, num_points=2000)
+
+Summary:
+Function decimates a trace to num_points samples using the largest triangle three buckets algorithm (Steinarsson, 2013).
+The first and last samples are kept and the remaining samples are divided into num_points-2 buckets, from each bucket the
+sample forming the largest triangle with the previously selected sample and the average of the next bucket is selected.
+Outputs the tuple (time, flow) of the selected samples.
+
+"""
+
+def lttb_decimate(time, flow, num_points=2000):
+    time = np.asarray(time, dtype=float)
+    flow = np.asarray(flow, dtype=float)
+    n = len(flow)
+    if num_points >= n or num_points < 3:
+        return time, flow
+
+    edges = np.linspace(1, n-1, num_points-1).astype(int)
+    #averages of every bucket (used as third point of the triangle of the previous bucket)
+    cumsum_t = np.concatenate(([0.0], np.cumsum(time)))
+    cumsum_f = np.concatenate(([0.0], np.cumsum(flow)))
+    next_edges = np.append(edges[1:], n)
+    avg_t = (cumsum_t[next_edges]-cumsum_t[edges])/(next_edges-edges)
+    avg_f = (cumsum_f[next_edges]-cumsum_f[edges])/(next_edges-edges)
+    #the last bucket uses the last sample as its third point
+    avg_t = np.append(avg_t[1:-1], time[-1])
+    avg_f = np.append(avg_f[1:-1], flow[-1])
+
+    selected = np.empty(num_points, dtype=int)
+    selected[0] = 0
+    selected[-1] = n-1
+    a = 0
+    for b in range(num_points-2):
+        t_b = time[edges[b]:edges[b+1]]
+        f_b = flow[edges[b]:edges[b+1]]
+        area = np.abs((time[a]-avg_t[b])*(f_b-flow[a]) - (time[a]-t_b)*(avg_f[b]-flow[a]))
+        a = edges[b] + int(np.argmax(area))
+        selected[b+1] = a
+    return time[selected], flow[selected]
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: run_pyramid(csv_path, pyramid_path, factor=4, flow_meter='SLI-0430', bits=11, read_data=False)
+
+Summary:
+Function outputs the tuple (df, pyramid) for the .csv file of a run. The pyramid is loaded from pyramid_path if it was
+built from the current .csv file (same modification time and size, stored in pyramid['source'] with the factor,
+flow_meter and bits) without reading the .csv file, df is then None unless read_data is True. Otherwise the .csv file is
+read and the pyramid and the steady state summary of the run (pyramid['steady'], see steady_state_summary fn) are built
+and saved to pyramid_path.
+
+Inputs:
+1. csv_path, path of the .csv file of the run
+2. pyramid_path, path of the .npz file of the pyramid
+3. factor, see build_minmax_pyramid fn
+4. flow_meter, bits, see sensiron_specs fn in functions.py
+5. read_data, if True the dataframe of the run is always output (e.g. for lttb decimation)
+
+"""
+
+def run_pyramid(csv_path, pyramid_path, factor=4, flow_meter='SLI-0430', bits=11, read_data=False):
+    csv_path = Path(csv_path)
+    pyramid_path = Path(pyramid_path)
+    st = csv_path.stat()
+    source = {'mtime_ns': st.st_mtime_ns, 'size': st.st_size, 'factor': factor, 'flow_meter': flow_meter, 'bits': bits}
+
+    pyramid = None
+    if pyramid_path.exists():
+        pyramid = load_pyramid(pyramid_path)
+        if pyramid.get('source') != source or 'steady' not in pyramid:
+            pyramid = None
+    if pyramid is not None and not read_data:
+        return None, pyramid
+
+    df, header_lines = read_sensirion_csv(csv_path)
+    if pyramid is None:
+        time = df['Relative Time[s]'].values
+        flow = df['Flow [ul/min]'].values
+        pyramid = build_minmax_pyramid(time, flow, factor=factor)
+        pyramid['source'] = source
+        pyramid['steady'] = steady_state_summary(time, flow, flow_meter=flow_meter, bits=bits)
+        pyramid_path.parent.mkdir(parents=True, exist_ok=True)
+        save_pyramid(pyramid, pyramid_path)
+    return df, pyramid
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: plot_raw_trace(df, output_path, pyramid=None, t_min=None, t_max=None, method='minmax', num_points=2000,
+                         title=None, flow_meter='SLI-0430', bits=11)
+
+Summary:
+Function plots the decimated raw trace of a run (dataframe of the form [Sample # Relative Time[s] Flow [ul/min]]) between
+times t_min and t_max [s], overlaid with the steady state window, the average flow rate of the steady state window and its
++/- u_sli_1 band, and saves the figure to output_path. The steady state window and statistics are taken from the pyramid
+if it has them (see run_pyramid fn), so the minmax plot of a run with a cached pyramid does not use the samples of the
+run at all (df can be None).
+
+Inputs:
+1. df, dataframe of the run (may be None for method 'minmax' with a pyramid of run_pyramid fn)
+2. output_path, path of the figure file (.png, .pdf, etc.)
+3. pyramid, min/max pyramid of the run (built if None and method is 'minmax')
+4. t_min, t_max, time range to plot [s] (whole run if None)
+5. method, 'minmax' or 'lttb'
+6. num_points, maximum number of points (bins for minmax) to plot
+7. title, title of the plot
+8. flow_meter, bits, see sensiron_specs fn in functions.py
+
+"""
+
+def plot_raw_trace(df, output_path, pyramid=None, t_min=None, t_max=None, method='minmax', num_points=2000,
+                   title=None, flow_meter='SLI-0430', bits=11):
+    if df is None and (method != 'minmax' or pyramid is None):
+        raise ValueError("the data of the run is required unless method is 'minmax' and the pyramid is given")
+    if df is not None:
+        time = df['Relative Time[s]'].values
+        flow = df['Flow [ul/min]'].values
+
+    #steady state window and its average flow rate and first order uncertainty (stored in pyramids of run_pyramid fn)
+    if pyramid is not None and 'steady' in pyramid and \
+            (pyramid['source']['flow_meter'], pyramid['source']['bits']) == (flow_meter, bits):
+        steady = pyramid['steady']
+    else:
+        steady = steady_state_summary(time, flow, flow_meter=flow_meter, bits=bits)
+
+    plt.rc('font', family='Times New Roman')
+    plt.rcParams.update({'font.size': 12})
+    fig, ax = plt.subplots()
+
+    if method == 'minmax':
+        if pyramid is None:
+            pyramid = build_minmax_pyramid(time, flow)
+        t_start, t_end, flow_min, flow_max = minmax_decimate(pyramid, t_min, t_max, num_points)
+        t_mid = 0.5*(t_start+t_end)
+        ax.fill_between(t_mid, flow_min, flow_max, color='blue', linewidth=0.5, step='mid')
+    elif method == 'lttb':
+        in_range = np.ones(len(time), dtype=bool)
+        if t_min is not None:
+            in_range &= time >= t_min
+        if t_max is not None:
+            in_range &= time <= t_max
+        t_dec, flow_dec = lttb_decimate(time[in_range], flow[in_range], num_points)
+        ax.plot(t_dec, flow_dec, '-', color='blue', linewidth=0.5)
+    else:
+        raise ValueError("method must be 'minmax' or 'lttb'")
+
+    avg_flow = steady['avg_flow']
+    u_sli_1 = steady['u_sli_1']
+    ax.axvspan(steady['t_start'], steady['t_end'], color='green', alpha=0.1)
+    ax.axhspan(avg_flow-u_sli_1, avg_flow+u_sli_1, color='red', alpha=0.15)
+    ax.axhline(avg_flow, linestyle='--', color='black')
+    if t_min is not None or t_max is not None:
+        ax.set_xlim(t_min, t_max)
+
+    plt.legend(['Measurements', 'Steady state', r'$\pm\mathdefault{u_{sli,1}}$', 'Average'], loc='lower right',
+               framealpha=1, edgecolor='black', fancybox=False)
+    plt.ylabel('Flow ' + r'[$\frac{\mathdefault{\mu L}}{\mathdefault{min}}$]', fontsize=12)
+    plt.xlabel('Relative Time [s]', fontsize=12)
+    if title is not None:
+        plt.title(title)
+
+    fig.set_size_inches(8, 6)
+    plt.grid()
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    fig.savefig(output_path, dpi=150)
+    plt.close(fig)
+    return {'i_start': steady['i_start'], 'i_end': steady['i_end'], 'avg_flow': avg_flow, 'u_sli_1': u_sli_1}
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
@@ -0,0 +1,381 @@
+"""
+Title: report_generator.py
+
+Summary:
+Generates the calibration report of a campaign in one pass: for every viscosity of the combined data (see
+neg_and_pos_q_combined_file.py) and of each flow case (see flow_meter_fr_and_meas_fr_to_csv.py) the linear correction
+Q_actual = B_1*Q_sli + B_o is fitted (as in plotting_combined_df.py), the point diagnostics are calculated (see
+robust_fitting.py) and a fit figure and a residual figure are rendered. The figures are rendered concurrently in a
+process pool and are cached: the hash of the inputs of each figure is stored in figure_cache.json, and a figure whose
+inputs have not changed since the last report is not rendered again. The report is written as report.md and report.html
+(and report.pdf if make_pdf = True) with
+
+1. the table of estimated parameters and uncertainties of each flow case (as estimated_params_and_uncert.csv)
+2. the table of diagnostics of each flow case (rmse, loo/k-fold rmse, number of flagged points)
+3. the table of residual tests of each flow case (see residual_diagnostics.py) with the status of each fit
+4. the flagged calibration points (high leverage or high residual)
+5. the fit and residual figures of each viscosity and flow case
+
+Dependencies:
+1. Path from pathlib
+2. concurrent.futures
+3. hashlib
+4. html
+5. json
+6. os
+7. matplotlib.pyplot
+8. numpy
+9. pandas
+10. correction_models.py
+11. robust_fitting.py
+12. pipeline_stages.py
+13. residual_diagnostics.py
+
+Notes:
+1. change out_dir for different data (outputs of the other programs are read from it), the report is written to
+    out_dir/report/
+2. increase figure_version when the plotting code changes, so that every cached figure is rendered again
+
+"""
+
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import html
+import json
+import os
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from correction_models import read_correction_data, viscosity_from_key
+from robust_fitting import point_diagnostics
+from pipeline_stages import param_columns, fit_linear_correction, plot_correction_fit
+from residual_diagnostics import residual_diagnostics
+
+#version of the plotting code, part of the hash of every figure
+figure_version = 1
+
+flow_cases = ['combined', 'negative_q', 'positive_q']
+
+
+"""
+Function: read_fit_groups(out_dir)
+
+Summary:
+Function reads the correction data of every flow case from the outputs folder and outputs a dictionary of the form
+{flow_case: {'visc_cSt': dataframe}} with flow_case = combined (out_dir/combined_pos_neg_q/), negative_q or positive_q
+(out_dir/correction_data_for_fitting/flow_case/). Flow cases without data are left out.
+
+"""
+
+def read_fit_groups(out_dir):
+    out_dir = Path(out_dir)
+    folders = {'combined': out_dir / 'combined_pos_neg_q',
+               'negative_q': out_dir / 'correction_data_for_fitting' / 'negative_q',
+               'positive_q': out_dir / 'correction_data_for_fitting' / 'positive_q'}
+    dict_of_groups = {}
+    for flow_case in flow_cases:
+        if folders[flow_case].is_dir():
+            dict_of_data = read_correction_data(folders[flow_case])
+            if len(dict_of_data) > 0:
+                dict_of_groups[flow_case] = dict_of_data
+    return dict_of_groups
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: plot_residuals(df_points, output_path)
+
+Summary:
+Function plots the residuals [uL/min] of the fit of one viscosity vs Q_sli [uL/min] (with the leave-one-out residuals
+and the flagged points marked) and the externally studentized residuals vs leverage, and saves the figure to
+output_path.
+df_points is the dataframe of point diagnostics of the viscosity (see point_diagnostics fn in robust_fitting.py).
+
+"""
+
+def plot_residuals(df_points, output_path):
+    flagged = df_points['flagged']
+
+    plt.rc('font', family='Times New Roman')
+    plt.rcParams.update({'font.size': 12})
+    fig, (ax_res, ax_lev) = plt.subplots(1, 2)
+    ax_res.axhline(0, color='black', linewidth=1)
+    ax_res.plot(df_points['Q_sli [uL/min]'], df_points['residual [uL/min]'], 'o', fillstyle='none', color='blue',
+                label='Residual')
+    ax_res.plot(df_points['Q_sli [uL/min]'], df_points['loo_residual [uL/min]'], 'x', color='gray',
+                label='Leave-one-out residual')
+    ax_res.plot(df_points['Q_sli [uL/min]'][flagged], df_points['residual [uL/min]'][flagged], 'o', color='red',
+                label='Flagged')
+    ax_res.set_xlabel(r'$\mathdefault{Q_{measured}}$' + r'[$\frac{\mathdefault{\mu L}}{\mathdefault{min}}$]')
+    ax_res.set_ylabel('Residual ' + r'[$\frac{\mathdefault{\mu L}}{\mathdefault{min}}$]')
+    ax_res.legend(loc='best', framealpha=1, edgecolor='black', fancybox=False)
+    ax_res.grid()
+
+    ax_lev.plot(df_points['leverage'], df_points['ext_studentized_residual'], 'o', fillstyle='none', color='blue')
+    ax_lev.plot(df_points['leverage'][flagged], df_points['ext_studentized_residual'][flagged], 'o', color='red')
+    ax_lev.set_xlabel('Leverage')
+    ax_lev.set_ylabel('Ext. studentized residual')
+    ax_lev.grid()
+
+    fig.set_size_inches(12, 5)
+    fig.tight_layout()
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    fig.savefig(output_path, dpi=150)
+    plt.close(fig)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: render_figure(task)
+
+Summary:
+Function renders one figure of the report in a worker process. task is a dictionary of the form {'kind': 'fit' or
+'residuals', 'output_path', 'df', 'beta_hat', 'r_squared'} (see plot_correction_fit fn in pipeline_stages.py and
+plot_residuals fn). Outputs the output path.
+
+"""
+
+def render_figure(task):
+    if task['kind'] == 'fit':
+        plot_correction_fit(task['df'], task['beta_hat'], task['r_squared'], task['output_path'])
+    else:
+        plot_residuals(task['df'], task['output_path'])
+    return task['output_path']
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: figure_hash(task)
+
+Summary:
+Function outputs the sha1 hash (hex) of the inputs of a figure task (see render_figure fn), i.e. of the kind of figure,
+its data, fitted parameters and figure_version.
+
+"""
+
+def figure_hash(task):
+    h = hashlib.sha1()
+    h.update((task['kind'] + str(figure_version)).encode('utf-8'))
+    h.update(pd.util.hash_pandas_object(task['df'], index=False).values.tobytes())
+    h.update(','.join(task['df'].columns).encode('utf-8'))
+    if task['kind'] == 'fit':
+        h.update(np.asarray(task['beta_hat'], dtype=float).tobytes())
+        h.update(np.float64(task['r_squared']).tobytes())
+    return h.hexdigest()
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: render_figures(tasks, cache_path, max_workers=None)
+
+Summary:
+Function renders the figure tasks (see render_figure fn) whose inputs changed since the last call (or whose file is
+missing) in a process pool and updates the cache file (json of the form {output_path: hash}). Outputs the tuple
+(num_rendered, num_cached).
+
+"""
+
+def render_figures(tasks, cache_path, max_workers=None):
+    cache_path = Path(cache_path)
+    cache = json.loads(cache_path.read_text()) if cache_path.exists() else {}
+
+    hashes = {str(task['output_path']): figure_hash(task) for task in tasks}
+    to_render = [task for task in tasks if cache.get(str(task['output_path'])) != hashes[str(task['output_path'])]
+                 or not Path(task['output_path']).exists()]
+
+    if len(to_render) > 0:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for output_path in executor.map(render_figure, to_render):
+                cache[str(output_path)] = hashes[str(output_path)]
+
+    #writing cache atomically
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_suffix('.json.tmp')
+    tmp_path.write_text(json.dumps(cache, indent=1))
+    os.replace(tmp_path, cache_path)
+    return len(to_render), len(tasks)-len(to_render)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: df_to_markdown(df, float_format='%.5g')
+
+Summary:
+Function outputs a dataframe as a markdown table (string).
+
+"""
+
+def df_to_markdown(df, float_format='%.5g'):
+    def fmt(value):
+        if isinstance(value, (float, np.floating)):
+            return float_format % value
+        return str(value)
+    lines = ['| ' + ' | '.join(str(column) for column in df.columns) + ' |',
+             '|' + '---|'*len(df.columns)]
+    for row in df.itertuples(index=False):
+        lines.append('| ' + ' | '.join(fmt(value) for value in row) + ' |')
+    return '\n'.join(lines)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: build_report(out_dir, campaign='si_oil', max_workers=None, make_pdf=False)
+
+Summary:
+Function fits, diagnoses and plots every viscosity of every flow case of the outputs folder (see read_fit_groups fn),
+renders the figures concurrently (see render_figures fn) and writes report.md and report.html (and report.pdf if
+make_pdf) to out_dir/report/. Outputs a dictionary of the form {'report_dir', 'num_rendered', 'num_cached', 'df_params':
+parameters of every flow case and viscosity, 'df_diagnostics': diagnostics of every flow case and viscosity}.
+
+Inputs:
+1. out_dir, outputs folder of the other programs
+2. campaign, name of the campaign used as title of the report
+3. max_workers, number of processes rendering figures (number of cpus if None)
+4. make_pdf, if True a pdf of the tables and figures is also written (with matplotlib)
+
+"""
+
+def build_report(out_dir, campaign='si_oil', max_workers=None, make_pdf=False):
+    report_dir = Path(out_dir) / 'report'
+    figure_dir = report_dir / 'figures'
+    dict_of_groups = read_fit_groups(out_dir)
+
+    list_of_params = []
+    list_of_diagnostics = []
+    list_of_tests = []
+    list_of_flagged = []
+    tasks = []
+    for flow_case in dict_of_groups:
+        dict_of_data = dict_of_groups[flow_case]
+        df_points, df_summary = point_diagnostics(dict_of_data)
+        #viscosities in numerical order (keys of the form 'visc_cSt')
+        for key in sorted(dict_of_data, key=viscosity_from_key):
+            df = dict_of_data[key]
+            visc = viscosity_from_key(key)
+            row, beta_hat = fit_linear_correction(df, visc)
+            list_of_params.append([flow_case] + row)
+
+            df_points_visc = df_points[df_points['Viscosity [cSt]'] == visc].reset_index(drop=True)
+            tasks.append({'kind': 'fit', 'output_path': figure_dir / (flow_case + '_' + key + '_fit.png'), 'df': df,
+                          'beta_hat': beta_hat, 'r_squared': row[-1]})
+            tasks.append({'kind': 'residuals', 'output_path': figure_dir / (flow_case + '_' + key + '_residuals.png'),
+                          'df': df_points_visc})
+            flagged = df_points_visc[df_points_visc['flagged']]
+            if len(flagged) > 0:
+                list_of_flagged.append(flagged.assign(flow_case=flow_case))
+        list_of_diagnostics.append(df_summary.assign(flow_case=flow_case))
+        df_residual_points, df_tests = residual_diagnostics(dict_of_data)
+        list_of_tests.append(df_tests.assign(flow_case=flow_case))
+
+    num_rendered, num_cached = render_figures(tasks, report_dir / 'figure_cache.json', max_workers=max_workers)
+
+    df_params = pd.DataFrame(list_of_params, columns=['flow_case'] + param_columns)
+    df_diagnostics = pd.concat(list_of_diagnostics, ignore_index=True) if len(list_of_diagnostics) > 0 else \
+        pd.DataFrame()
+    diagnostic_columns = ['flow_case', 'Viscosity [cSt]', 'n', 'rmse [uL/min]', 'loo_rmse [uL/min]',
+                          'kfold_rmse [uL/min]', 'num_flagged']
+    df_diagnostics = df_diagnostics[[column for column in diagnostic_columns if column in df_diagnostics.columns]]
+    test_columns = ['flow_case', 'Viscosity [cSt]', 'max_cooks_d', 'bp_p', 'shapiro_p', 'ad_p', 'durbin_watson',
+                    'status']
+    df_tests = pd.concat(list_of_tests, ignore_index=True)[test_columns] if len(list_of_tests) > 0 else \
+        pd.DataFrame(columns=test_columns)
+    if len(df_diagnostics) > 0:
+        df_diagnostics = df_diagnostics.sort_values(['flow_case', 'Viscosity [cSt]'], kind='stable', ignore_index=True)
+    df_tests = df_tests.sort_values(['flow_case', 'Viscosity [cSt]'], kind='stable', ignore_index=True)
+    flagged_columns = ['flow_case', 'Viscosity [cSt]', 'P [mbar]', 'Q_sli [uL/min]', 'residual [uL/min]', 'leverage',
+                       'ext_studentized_residual', 'cooks_distance', 'high_residual', 'influential']
+    df_flagged = pd.concat(list_of_flagged, ignore_index=True)[flagged_columns] if len(list_of_flagged) > 0 else \
+        pd.DataFrame(columns=flagged_columns)
+
+    #markdown and html report from the same sections
+    sections = [('Estimated parameters and uncertainties (95% confidence)', df_params),
+                ('Fit diagnostics', df_diagnostics), ('Residual tests', df_tests),
+                ('Flagged calibration points', df_flagged)]
+    md = ['# Calibration report: ' + campaign, '']
+    body = ['<h1>Calibration report: ' + html.escape(campaign) + '</h1>']
+    for title, df in sections:
+        md += ['## ' + title, '', df_to_markdown(df) if len(df) > 0 else 'None', '']
+        body += ['<h2>' + html.escape(title) + '</h2>',
+                 df.to_html(index=False, float_format=lambda value: '%.5g' % value) if len(df) > 0 else '<p>None</p>']
+    md += ['## Figures', '']
+    body += ['<h2>Figures</h2>']
+    for task in tasks:
+        relative_path = Path(task['output_path']).relative_to(report_dir).as_posix()
+        md += ['![' + relative_path + '](' + relative_path + ')', '']
+        body += ['<p><img src="' + html.escape(relative_path) + '" style="max-width:100%"></p>']
+
+    (report_dir / 'report.md').write_text('\n'.join(md))
+    (report_dir / 'report.html').write_text('<!DOCTYPE html>\n<html>\n<head><meta charset="utf-8"><title>' +
+                                            html.escape(campaign) + '</title></head>\n<body>\n' + '\n'.join(body) +
+                                            '\n</body>\n</html>\n')
+    if make_pdf:
+        write_pdf_report(report_dir / 'report.pdf', campaign, sections, [task['output_path'] for task in tasks])
+
+    return {'report_dir': report_dir, 'num_rendered': num_rendered, 'num_cached': num_cached, 'df_params': df_params,
+            'df_diagnostics': df_diagnostics}
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: write_pdf_report(pdf_path, campaign, sections, figure_paths)
+
+Summary:
+Function writes the tables (list of tuples (title, dataframe)) and the rendered figures of the report to a pdf, one page
+per table and per figure (with matplotlib, no other pdf package is needed).
+
+"""
+
+def write_pdf_report(pdf_path, campaign, sections, figure_paths):
+    from matplotlib.backends.backend_pdf import PdfPages
+    with PdfPages(pdf_path) as pdf:
+        for title, df in sections:
+            fig, ax = plt.subplots()
+            fig.set_size_inches(11.7, 8.3)
+            ax.axis('off')
+            ax.set_title('Calibration report: ' + campaign + '\n' + title)
+            if len(df) > 0:
+                cells = [[('%.5g' % value) if isinstance(value, (float, np.floating)) else str(value) for value in row]
+                         for row in df.itertuples(index=False)]
+                table = ax.table(cellText=cells, colLabels=[str(column) for column in df.columns], loc='upper center')
+                table.auto_set_font_size(False)
+                table.set_fontsize(7)
+            pdf.savefig(fig)
+            plt.close(fig)
+        for figure_path in figure_paths:
+            fig, ax = plt.subplots()
+            fig.set_size_inches(11.7, 8.3)
+            ax.axis('off')
+            ax.imshow(plt.imread(figure_path))
+            pdf.savefig(fig)
+            plt.close(fig)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+if __name__ == '__main__':
+    # specify outputs folder of the other programs and name of the campaign
+    out_dir = Path('./outputs/')
+    campaign = 'si_oil'
+    make_pdf = False
+
+    report = build_report(out_dir, campaign=campaign, make_pdf=make_pdf)
+    print('report written to ' + str(report['report_dir']) + ' (' + str(report['num_rendered']) +
+          ' figures rendered, ' + str(report['num_cached']) + ' cached)')
@@ -0,0 +1,333 @@
+"""
+Title: residual_diagnostics.py
+
+Summary:
+Residual analysis of the correction fits of every viscosity at once, to detect a bad calibration automatically instead
+of reading the results.summary() output of plotting_combined_df.py for every fit. For every viscosity (group of the
+stacked arrays of correction_models.py) the following are calculated in batched form (arrays of shape G x N_max):
+
+1. residuals, leverage (diagonal of the hat matrix), internally and externally studentized residuals
+2. Cook's distance, D_i = r_i^2/M*h_ii/(1-h_ii), influence of each point on the fitted parameters
+3. Breusch-Pagan test (Koenker's studentized form) of heteroscedasticity, LM = n*R^2 of the OLS fit of the squared
+    residuals on the model matrix, LM ~ chi^2(M-1) under constant variance
+4. Anderson-Darling test of normality of the residuals (mean and variance estimated, modified statistic
+    A*^2 = A^2*(1+0.75/n+2.25/n^2) and p-value of D'Agostino and Stephens)
+5. Durbin-Watson statistic of the residuals in ascending order of Q_sli (values far below 2 indicate that the residuals
+    follow a trend in Q_sli, i.e. the model is missing a term)
+
+and the Shapiro-Wilk test of normality (scipy, one call per viscosity). The output is a compact table with one row per
+viscosity and a status of 'ok' or the list of problems found, and optionally a headless figure per viscosity (residuals
+vs fitted values, normal Q-Q plot, scale-location and Cook's distance).
+
+Dependencies:
+1. Path from pathlib
+2. matplotlib.pyplot
+3. numpy
+4. pandas
+5. scipy.stats and scipy.special
+6. correction_models.py
+
+Notes:
+1. with the few calibration points of each viscosity (5-10 per flow case) the tests have little power, a status of 'ok'
+    does not prove the model is correct
+2. thresholds: |t_ext| > t_(1-alpha/(2n), n-M-1) (outlier, Bonferroni corrected for the n points of the fit, or a fixed
+    t_threshold), D_i > max(F_(0.5; M, n-M), 1) (influential, median of the F distribution, at least 1), p < alpha
+    (heteroscedastic, non-normal), Durbin-Watson < dw_threshold (trend in residuals)
+3. the 4/n line of Cook's distance in the figures is only a guide to compare the points of a fit, with the few points
+    of each viscosity most clean fits have a point above it
+4. the status combines several tests at level alpha, so a fraction of a few alpha of clean fits is still reported
+
+"""
+
+from pathlib import Path
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from scipy import stats, special
+from correction_models import model_matrix, stack_groups, batched_ols, hat_matrix, viscosity_from_key
+
+
+"""
+Function: studentized_residuals(results, leverage)
+
+Summary:
+Function calculates the internally studentized residuals, r_i = e_i/(s*sqrt(1-h_ii)), and externally studentized
+residuals, t_i = r_i*sqrt((n-M-1)/(n-M-r_i^2)), of every group from the output of batched_ols (see correction_models.py)
+and the leverage of each observation. Outputs the tuple (r_int, t_ext) of arrays of shape (G x N_max).
+
+"""
+
+def studentized_residuals(results, leverage):
+    dof = results['dof']
+    s = np.sqrt(results['sigma_hat_sq'])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r_int = results['residuals']/(s[:, None]*np.sqrt(1-leverage))
+        t_ext = r_int*np.sqrt((dof[:, None]-1)/(dof[:, None]-r_int**2))
+    return r_int, t_ext
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: cooks_distance(r_int, leverage, num_params)
+
+Summary:
+Function calculates Cook's distance of every observation, D_i = r_i^2/M*h_ii/(1-h_ii), from the internally studentized
+residuals and leverage (arrays of shape G x N_max).
+
+"""
+
+def cooks_distance(r_int, leverage, num_params):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return r_int**2/num_params*leverage/(1-leverage)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: outlier_thresholds(n, num_params, alpha=0.05, t_threshold=None)
+
+Summary:
+Function outputs the tuple (t_threshold, cooks_threshold) of the thresholds of a fit of n points and num_params
+parameters, corrected for testing every point of the fit. A point is an outlier if |t_ext| > t_(1-alpha/(2n), n-M-1)
+(Bonferroni, or the fixed t_threshold if given) and influential if D_i > max(F_(0.5; M, n-M), 1). Used by
+residual_diagnostics and by point_diagnostics in robust_fitting.py so that both give the same verdict for each point.
+
+"""
+
+def outlier_thresholds(n, num_params, alpha=0.05, t_threshold=None):
+    if t_threshold is None:
+        t_threshold = stats.t.ppf(1-alpha/(2*n), n-num_params-1)
+    return t_threshold, max(stats.f.ppf(0.5, num_params, n-num_params), 1.0)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: breusch_pagan(x_stack, residuals, w)
+
+Summary:
+Function performs the Breusch-Pagan test (Koenker's studentized form) for every group by fitting the squared residuals
+on the model matrix of the group (batched OLS) and outputs the tuple (lm, p_value) of arrays (G), LM = n*R^2.
+
+"""
+
+def breusch_pagan(x_stack, residuals, w):
+    aux = batched_ols(x_stack, residuals**2*w, w)
+    lm = aux['n']*aux['r_squared']
+    p_value = stats.chi2.sf(lm, x_stack.shape[2]-1)
+    return lm, p_value
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: anderson_darling_normal(residuals, w)
+
+Summary:
+Function performs the Anderson-Darling test of normality (mean and variance estimated from the data) for every group
+and outputs the tuple (a_star, p_value) of arrays (G), where a_star is the modified statistic A*^2. The residuals of
+each group are standardized and sorted at once (padding is sorted to the end), and
+
+A^2 = -n - 1/n*sum_i (2i-1)*[ln(F(z_i)) + ln(1-F(z_(n+1-i)))]
+
+is evaluated with the log of the normal cdf for all groups in one expression.
+
+"""
+
+def anderson_darling_normal(residuals, w):
+    valid = w > 0
+    n = valid.sum(axis=1)
+    mean = np.sum(residuals*w, axis=1)/n
+    std = np.sqrt(np.sum(((residuals-mean[:, None])*w)**2, axis=1)/(n-1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.where(valid, (residuals-mean[:, None])/std[:, None], np.inf)
+    z = np.sort(z, axis=1)
+
+    i = np.arange(1, z.shape[1]+1)[None, :]
+    in_group = i <= n[:, None]
+    #index of z_(n+1-i) of each position i of each group
+    i_rev = np.clip(n[:, None]-i, 0, z.shape[1]-1)
+    z_rev = np.take_along_axis(z, i_rev, axis=1)
+    with np.errstate(invalid='ignore'):
+        terms = np.where(in_group, (2*i-1)*(special.log_ndtr(z) + special.log_ndtr(-z_rev)), 0.0)
+    a_sq = -n - np.sum(terms, axis=1)/n
+    a_star = a_sq*(1 + 0.75/n + 2.25/n**2)
+
+    p_value = np.select([a_star >= 0.6, a_star >= 0.34, a_star >= 0.2],
+                        [np.exp(1.2937 - 5.709*a_star + 0.0186*a_star**2),
+                         np.exp(0.9177 - 4.279*a_star - 1.38*a_star**2),
+                         1 - np.exp(-8.318 + 42.796*a_star - 59.938*a_star**2)],
+                        1 - np.exp(-13.436 + 101.14*a_star - 223.73*a_star**2))
+    return a_star, np.clip(p_value, 0.0, 1.0)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: durbin_watson(residuals, w)
+
+Summary:
+Function calculates the Durbin-Watson statistic, DW = sum (e_i - e_(i-1))^2/sum e_i^2, of the residuals of every group
+in the order of the observations (ascending order of Q_sli for the combined data) and outputs an array (G).
+
+"""
+
+def durbin_watson(residuals, w):
+    e = residuals*w
+    both_valid = w[:, 1:]*w[:, :-1]
+    return np.sum(np.diff(e, axis=1)**2*both_valid, axis=1)/np.sum(e**2, axis=1)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: residual_diagnostics(dict_of_data, spec=None, alpha=0.05, t_threshold=None, dw_threshold=1.0)
+
+Summary:
+Function intakes a dictionary of dataframes of the form {'visc_cSt': df} (see read_correction_data fn in
+correction_models.py), fits the model spec to every viscosity and outputs a dataframe with one row per calibration point
+of the form
+
+[Viscosity [cSt], P [mbar], Q_sli [uL/min], fitted [uL/min], residual [uL/min], leverage, studentized_residual,
+ ext_studentized_residual, cooks_distance]
+
+and a compact dataframe with one row per viscosity of the form
+
+[Viscosity [cSt], n, rmse [uL/min], max_abs_t_ext, t_threshold, max_cooks_d, cooks_threshold, num_influential, bp_lm,
+ bp_p, shapiro_w, shapiro_p, ad_stat, ad_p, durbin_watson, status]
+
+Inputs:
+1. dict_of_data, dictionary of dataframes with columns 'P [mbar]', 'Q_sli [uL/min]' and 'Q_mass_meas [uL/min]'
+2. spec, model spec (linear model of plotting_combined_df.py if None)
+3. alpha, significance level of the Breusch-Pagan, Shapiro-Wilk and Anderson-Darling tests and family-wise level of
+    the outlier test
+4. t_threshold, threshold on the absolute externally studentized residual of an outlier (Bonferroni corrected
+    t_(1-alpha/(2n), n-M-1) of each fit if None)
+5. dw_threshold, Durbin-Watson statistic below which the residuals are considered to follow a trend
+
+"""
+
+def residual_diagnostics(dict_of_data, spec=None, alpha=0.05, t_threshold=None, dw_threshold=1.0):
+    if spec is None:
+        spec = {'name': 'poly_1', 'kind': 'polynomial', 'degree': 1}
+    keys = list(dict_of_data)
+    list_of_x_mat = [model_matrix(dict_of_data[key]['Q_sli [uL/min]'].values, spec) for key in keys]
+    list_of_y = [dict_of_data[key]['Q_mass_meas [uL/min]'].values for key in keys]
+    x_stack, y_stack, w = stack_groups(list_of_x_mat, list_of_y)
+    num_params = x_stack.shape[2]
+
+    results = batched_ols(x_stack, y_stack, w)
+    leverage = np.diagonal(hat_matrix(x_stack, w, results['xtx_inv']), axis1=1, axis2=2)
+    r_int, t_ext = studentized_residuals(results, leverage)
+    cooks_d = np.where(w > 0, cooks_distance(r_int, leverage, num_params), 0.0)
+    bp_lm, bp_p = breusch_pagan(x_stack, results['residuals'], w)
+    ad_stat, ad_p = anderson_darling_normal(results['residuals'], w)
+    dw = durbin_watson(results['residuals'], w)
+
+    list_of_point_dfs = []
+    list_of_rows = []
+    for g, key in enumerate(keys):
+        n_g = int(results['n'][g])
+        df = dict_of_data[key]
+        e_g = results['residuals'][g, :n_g]
+        list_of_point_dfs.append(pd.DataFrame({'Viscosity [cSt]': viscosity_from_key(key),
+                                               'P [mbar]': df['P [mbar]'].values,
+                                               'Q_sli [uL/min]': df['Q_sli [uL/min]'].values,
+                                               'fitted [uL/min]': results['y_hat'][g, :n_g], 'residual [uL/min]': e_g,
+                                               'leverage': leverage[g, :n_g], 'studentized_residual': r_int[g, :n_g],
+                                               'ext_studentized_residual': t_ext[g, :n_g],
+                                               'cooks_distance': cooks_d[g, :n_g]}))
+        shapiro_w, shapiro_p = stats.shapiro(e_g) if n_g >= 3 else (np.nan, np.nan)
+
+        #thresholds corrected for testing every point of the fit
+        t_threshold_g, cooks_threshold_g = outlier_thresholds(n_g, num_params, alpha, t_threshold)
+
+        row = {'Viscosity [cSt]': viscosity_from_key(key), 'n': n_g, 'rmse [uL/min]': np.sqrt(results['sse'][g]/n_g),
+               'max_abs_t_ext': np.nanmax(np.abs(t_ext[g, :n_g])), 't_threshold': t_threshold_g,
+               'max_cooks_d': np.max(cooks_d[g, :n_g]), 'cooks_threshold': cooks_threshold_g,
+               'num_influential': int(np.sum(cooks_d[g, :n_g] > cooks_threshold_g)), 'bp_lm': bp_lm[g],
+               'bp_p': bp_p[g], 'shapiro_w': shapiro_w, 'shapiro_p': shapiro_p, 'ad_stat': ad_stat[g], 'ad_p': ad_p[g],
+               'durbin_watson': dw[g]}
+        problems = []
+        if row['max_abs_t_ext'] > t_threshold_g:
+            problems.append('outlier')
+        if row['num_influential'] > 0:
+            problems.append('influential')
+        if row['bp_p'] < alpha:
+            problems.append('heteroscedastic')
+        if row['shapiro_p'] < alpha or row['ad_p'] < alpha:
+            problems.append('non-normal')
+        if row['durbin_watson'] < dw_threshold:
+            problems.append('trend')
+        row['status'] = 'ok' if len(problems) == 0 else ','.join(problems)
+        list_of_rows.append(row)
+
+    return pd.concat(list_of_point_dfs, ignore_index=True), pd.DataFrame(list_of_rows)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: plot_residual_diagnostics(df_points, output_path, title=None, cooks_threshold=None)
+
+Summary:
+Function plots the residual diagnostics of one viscosity (rows of df_points of residual_diagnostics fn), residuals vs
+fitted values, normal Q-Q plot of the studentized residuals, scale-location (sqrt(|r_i|) vs fitted values) and Cook's
+distance of each point (with the 4/n guide line and the cooks_threshold of the status, see residual_diagnostics fn, if
+given), and saves the figure to output_path without showing it.
+
+"""
+
+def plot_residual_diagnostics(df_points, output_path, title=None, cooks_threshold=None):
+    n = len(df_points)
+    fitted = df_points['fitted [uL/min]']
+    r_int = df_points['studentized_residual']
+
+    plt.rc('font', family='Times New Roman')
+    plt.rcParams.update({'font.size': 12})
+    fig, axs = plt.subplots(2, 2)
+    axs[0, 0].axhline(0, color='black', linewidth=1)
+    axs[0, 0].plot(fitted, df_points['residual [uL/min]'], 'o', fillstyle='none', color='blue')
+    axs[0, 0].set_xlabel('Fitted ' + r'[$\frac{\mathdefault{\mu L}}{\mathdefault{min}}$]')
+    axs[0, 0].set_ylabel('Residual ' + r'[$\frac{\mathdefault{\mu L}}{\mathdefault{min}}$]')
+
+    (theoretical, ordered), (slope, intercept, r) = stats.probplot(r_int, dist='norm')
+    axs[0, 1].plot(theoretical, ordered, 'o', fillstyle='none', color='blue')
+    axs[0, 1].plot(theoretical, intercept + slope*theoretical, '--', color='black')
+    axs[0, 1].set_xlabel('Theoretical quantiles')
+    axs[0, 1].set_ylabel('Studentized residual')
+
+    axs[1, 0].plot(fitted, np.sqrt(np.abs(r_int)), 'o', fillstyle='none', color='blue')
+    axs[1, 0].set_xlabel('Fitted ' + r'[$\frac{\mathdefault{\mu L}}{\mathdefault{min}}$]')
+    axs[1, 0].set_ylabel(r'$\sqrt{|\mathdefault{Studentized\ residual}|}$')
+
+    axs[1, 1].stem(df_points['P [mbar]'].values, df_points['cooks_distance'].values)
+    axs[1, 1].axhline(4/n, color='gray', linestyle=':', linewidth=1)
+    if cooks_threshold is not None:
+        axs[1, 1].axhline(cooks_threshold, color='red', linestyle='--', linewidth=1)
+    axs[1, 1].set_xlabel('P [mbar]')
+    axs[1, 1].set_ylabel("Cook's distance")
+
+    for ax in axs.ravel():
+        ax.grid()
+    if title is not None:
+        fig.suptitle(title)
+    fig.set_size_inches(12, 9)
+    fig.tight_layout()
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    fig.savefig(output_path, dpi=150)
+    plt.close(fig)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
@@ -0,0 +1,67 @@
+"""
+Title: residual_diagnostics_combined_df.py
+
+Summary:
+Code intakes .csv files created by neg_and_pos_q_combined_file.py (in ./outputs/combined_pos_neg_q) of form:
+
+[P [mbar] Q_sli [uL/min] u_q_sli [uL/min], u_q_sli_rel [%],Q_mass_meas [uL/min] ,u_q_m [uL/min], u_q_m_rel [%]]
+
+and performs the residual analysis of the correction model Q_actual = B_1*Q_sli + B_o of every viscosity at once (see
+residual_diagnostics.py): studentized residuals, Cook's distance, Breusch-Pagan test of heteroscedasticity,
+Shapiro-Wilk and Anderson-Darling tests of normality and Durbin-Watson statistic. Program prints a compact table with
+one row per viscosity and the status of each fit ('ok' or the problems found), and outputs the table and the diagnostics
+of each calibration point as .csv files to ./outputs/residual_diagnostics/ (and a figure per viscosity if make_plots).
+
+Dependencies:
+1. Path from pathlib
+2. correction_models.py
+3. residual_diagnostics.py
+
+Notes:
+1. fits with a status other than 'ok' should be checked before using the plotting_combined_df.py output
+2. change alpha, t_threshold and dw_threshold to change when a problem is reported
+
+"""
+
+from pathlib import Path
+from correction_models import read_correction_data, viscosity_from_key
+from residual_diagnostics import residual_diagnostics, plot_residual_diagnostics
+
+#significance level of tests, threshold on |ext. studentized residual| (None for the Bonferroni corrected threshold of
+#each fit) and on Durbin-Watson statistic
+alpha = 0.05
+t_threshold = None
+dw_threshold = 1.0
+
+#save a figure of the residual diagnostics of each viscosity
+make_plots = True
+
+# specify path of data to use for correction fitting
+p = Path('./outputs/combined_pos_neg_q/')
+
+#creating dictionary of dataframes for each set of correction data with key value pair {visc_cSt: df}
+dict_of_combined_data = read_correction_data(p)
+
+#calculating residual diagnostics of every viscosity
+df_points, df_table = residual_diagnostics(dict_of_combined_data, alpha=alpha, t_threshold=t_threshold,
+                                           dw_threshold=dw_threshold)
+print(df_table.to_string())
+
+#outputting tables as .csv (and figures as .png) in ./outputs/residual_diagnostics
+question = input('Output residual diagnostics as .csv files? (y/n): ')
+while question != 'y' and question !='n':
+    question = input("please input 'y' or 'n': ")
+if question == 'y':
+    out_dir = Path('./outputs/residual_diagnostics/')
+    out_dir.mkdir(parents=True, exist_ok=True)
+    df_points.to_csv(out_dir / 'point_residuals.csv')
+    df_table.to_csv(out_dir / 'summary.csv')
+    if make_plots:
+        for key in dict_of_combined_data:
+            df_points_visc = df_points[df_points['Viscosity [cSt]'] == viscosity_from_key(key)]
+            cooks_threshold = df_table.loc[df_table['Viscosity [cSt]'] == viscosity_from_key(key),
+                                           'cooks_threshold'].iloc[0]
+            plot_residual_diagnostics(df_points_visc, out_dir / (key + '.png'), title=key.replace('_', ' '),
+                                      cooks_threshold=cooks_threshold)
+elif question =='n':
+    print('results not output to .csv')
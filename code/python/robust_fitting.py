@@ -0,0 +1,270 @@
+"""
+Title: robust_fitting.py
+
+Summary:
+Functions for outlier-robust fitting of the correction models of correction_models.py and for detecting bad calibration
+points (e.g. evaporation during a mass balance measurement or a mistimed Measurement Time [s]) which can skew the OLS
+estimate of the correction for a given viscosity. Includes:
+
+1. iteratively reweighted least squares (IRLS) M-estimation with Huber or Tukey bisquare weights, batched over all
+    viscosities (groups), where the weights of observation i are calculated from the scaled residual u_i = e_i/(c*s),
+    s = 1.4826*MAD(e) (robust estimate of the error standard deviation) and c = tuning constant,
+
+    Huber:  w_i = min(1, 1/|u_i|)          (c = 1.345)
+    Tukey:  w_i = (1-u_i^2)^2 for |u_i|<1, 0 otherwise   (c = 4.685)
+
+2. RANSAC, where minimal subsets of M observations are drawn at random, the model is fit exactly to each subset and the
+    subset with the largest number of inliers (|e_i| < threshold) is refit by OLS using only its inliers
+
+3. a diagnostics table of every calibration point with its residual, leverage (h_ii), internally and externally
+    studentized residuals, Cook's distance, closed form leave-one-out residual, robust weight and RANSAC inlier status,
+    flagging high residual (outlier) and influential points with the multiplicity corrected thresholds of
+    residual_diagnostics.py (see outlier_thresholds fn), so both give the same verdict for each point
+
+Dependencies:
+1. numpy
+2. pandas
+3. correction_models.py
+4. residual_diagnostics.py
+
+Notes:
+1. the diagnostics are cheap enough (single fit and closed form loo, see loo_residuals fn in correction_models.py) to be
+    run on every recalibration
+
+"""
+
+import numpy as np
+import pandas as pd
+from correction_models import model_matrix, stack_groups, batched_ols, loo_residuals, kfold_cv_residuals,\
+    viscosity_from_key
+from residual_diagnostics import studentized_residuals, cooks_distance, outlier_thresholds
+
+
+"""
+Function: mad_scale(residuals, w)
+
+Summary:
+Function calculates the robust estimate of the error standard deviation, s = 1.4826*median(|e_i - median(e)|), of every
+group of the stacked residuals (G x N_max) considering only the observations with non-zero weight.
+
+"""
+
+def mad_scale(residuals, w):
+    e = np.where(w > 0, residuals, np.nan)
+    median = np.nanmedian(e, axis=1)
+    return 1.4826*np.nanmedian(np.abs(e-median[:, None]), axis=1)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: irls_fit(x_stack, y_stack, w, norm='huber', c=None, max_iter=50, tol=1e-8)
+
+Summary:
+Function performs robust M-estimation by iteratively reweighted least squares for every group of the stacked arrays at
+once (see stack_groups fn in correction_models.py) starting from the OLS estimate. Outputs a dictionary of the form
+
+{'beta_hat': (G x M), 'robust_weights': (G x N_max), 'scale': (G), 'residuals': (G x N_max), 'iterations': int,
+ 'converged': bool}
+
+Inputs:
+1. x_stack, y_stack, w, stacked arrays
+2. norm, 'huber' or 'tukey'
+3. c, tuning constant (1.345 for huber and 4.685 for tukey if None, 95% efficiency for normal errors)
+4. max_iter, maximum number of iterations
+5. tol, convergence tolerance on the change of the estimated parameters (relative to their magnitude)
+
+"""
+
+def irls_fit(x_stack, y_stack, w, norm='huber', c=None, max_iter=50, tol=1e-8):
+    if c is None:
+        if norm == 'huber':
+            c = 1.345
+        elif norm == 'tukey':
+            c = 4.685
+        else:
+            raise ValueError("norm must be 'huber' or 'tukey'")
+
+    results = batched_ols(x_stack, y_stack, w)
+    beta_hat = results['beta_hat']
+    residuals = results['residuals']
+    #scale is fixed from the OLS residuals for the tukey norm (redescending, needs a good initial scale)
+    scale = mad_scale(residuals, w)
+    robust_weights = np.ones(w.shape)
+    converged = False
+    for iteration in range(1, max_iter+1):
+        if norm == 'huber':
+            scale = mad_scale(residuals, w)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            u = np.abs(residuals/(c*scale[:, None]))
+            if norm == 'huber':
+                robust_weights = np.where(u > 1, 1/u, 1.0)
+            else:
+                robust_weights = np.where(u < 1, (1-u**2)**2, 0.0)
+        robust_weights = np.where(np.isfinite(robust_weights), robust_weights, 1.0)
+
+        beta_new = batched_ols(x_stack, y_stack, w*robust_weights)['beta_hat']
+        residuals = y_stack - np.einsum('gnm,gm->gn', x_stack, beta_new)
+        #groups that can not be estimated (NaN, see batched_ols fn) do not prevent convergence of the others
+        change = np.abs(beta_new-beta_hat)/(np.abs(beta_hat)+1e-12)
+        change = np.max(change, initial=0.0, where=np.isfinite(change))
+        beta_hat = beta_new
+        if change < tol:
+            converged = True
+            break
+
+    return {'beta_hat': beta_hat, 'robust_weights': robust_weights*w, 'scale': scale, 'residuals': residuals,
+            'iterations': iteration, 'converged': converged}
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: ransac_fit(x_stack, y_stack, w, threshold=None, num_trials=500, seed=0)
+
+Summary:
+Function performs RANSAC estimation for every group of the stacked arrays. For each group num_trials minimal subsets of M
+observations are drawn and fit exactly (batched solve over the trials), the subset with the most inliers (|e_i| <
+threshold, ties broken by the smallest sum of squared inlier residuals) is kept and the model is refit by OLS using its
+inliers. Outputs a dictionary of the form
+
+{'beta_hat': (G x M), 'inliers': (G x N_max) bool, 'threshold': (G)}
+
+Inputs:
+1. x_stack, y_stack, w, stacked arrays
+2. threshold, inlier threshold [uL/min] (scalar or one per group), 2.5 times the MAD scale of the OLS residuals if None
+3. num_trials, number of random minimal subsets per group
+4. seed, seed of random number generator
+
+"""
+
+def ransac_fit(x_stack, y_stack, w, threshold=None, num_trials=500, seed=0):
+    rng = np.random.default_rng(seed)
+    num_groups, n_max, num_params = x_stack.shape
+    if threshold is None:
+        threshold = 2.5*mad_scale(batched_ols(x_stack, y_stack, w)['residuals'], w)
+    threshold = np.broadcast_to(np.asarray(threshold, dtype=float), (num_groups,))
+
+    inliers = np.zeros(w.shape, dtype=bool)
+    for g in range(num_groups):
+        n = int(np.sum(w[g]))
+        x_mat = x_stack[g, :n]
+        y = y_stack[g, :n]
+        #drawing num_trials subsets of num_params distinct observations
+        subsets = np.argsort(rng.random((num_trials, n)), axis=1)[:, :num_params]
+        x_sub = x_mat[subsets]
+        y_sub = y[subsets]
+        #removing degenerate subsets (e.g. repeated Q_sli values)
+        det = np.linalg.det(x_sub)
+        valid = np.abs(det) > 1e-12*np.max(np.abs(x_sub), axis=(1, 2))**num_params
+        if not np.any(valid):
+            inliers[g, :n] = True
+            continue
+        beta_trials = np.linalg.solve(x_sub[valid], y_sub[valid][:, :, None])[:, :, 0]
+        abs_res = np.abs(y[None, :] - beta_trials @ x_mat.T)
+        is_inlier = abs_res < threshold[g]
+        num_inliers = np.sum(is_inlier, axis=1)
+        sse_inliers = np.sum(np.where(is_inlier, abs_res**2, 0.0), axis=1)
+        best = np.lexsort((sse_inliers, -num_inliers))[0]
+        inliers[g, :n] = is_inlier[best]
+        if num_inliers[best] <= num_params:
+            inliers[g, :n] = True
+
+    beta_hat = batched_ols(x_stack, y_stack, w*inliers)['beta_hat']
+    return {'beta_hat': beta_hat, 'inliers': inliers, 'threshold': threshold}
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: point_diagnostics(dict_of_data, spec=None, alpha=0.05, t_threshold=None, k=5, seed=0)
+
+Summary:
+Function intakes a dictionary of dataframes of the form {'visc_cSt': df} (see read_correction_data fn in
+correction_models.py), fits the model spec to every viscosity and outputs a dataframe with one row per calibration point
+of the form
+
+[Viscosity [cSt], P [mbar], Q_sli [uL/min], Q_mass_meas [uL/min], residual [uL/min], leverage, studentized_residual,
+ ext_studentized_residual, cooks_distance, loo_residual [uL/min], kfold_residual [uL/min], tukey_weight, ransac_inlier,
+ high_leverage, high_residual, influential, flagged]
+
+and a dataframe with one row per viscosity of the form
+
+[Viscosity [cSt], n, rmse [uL/min], loo_rmse [uL/min], kfold_rmse [uL/min], t_threshold, cooks_threshold, ols_beta_*,
+ tukey_beta_*, ransac_beta_*, num_flagged]
+
+A point is flagged if it is an outlier (high_residual) or influential with the thresholds of residual_diagnostics fn in
+residual_diagnostics.py (see outlier_thresholds fn). high_leverage (h_ii > 2M/n) only marks points far from the others
+in Q_sli, it is not a problem of the point by itself and is not flagged.
+
+Inputs:
+1. dict_of_data, dictionary of dataframes with columns 'P [mbar]', 'Q_sli [uL/min]' and 'Q_mass_meas [uL/min]'
+2. spec, model spec (linear model of plotting_combined_df.py if None)
+3. alpha, significance level of the Bonferroni corrected outlier threshold
+4. t_threshold, fixed threshold on the absolute externally studentized residual instead of the Bonferroni threshold
+5. k, number of folds used for the k-fold cross-validation residuals
+6. seed, seed of random number generator used for the folds and RANSAC
+
+"""
+
+def point_diagnostics(dict_of_data, spec=None, alpha=0.05, t_threshold=None, k=5, seed=0):
+    if spec is None:
+        spec = {'name': 'poly_1', 'kind': 'polynomial', 'degree': 1}
+    keys = list(dict_of_data)
+    list_of_x_mat = [model_matrix(dict_of_data[key]['Q_sli [uL/min]'].values, spec) for key in keys]
+    list_of_y = [dict_of_data[key]['Q_mass_meas [uL/min]'].values for key in keys]
+    x_stack, y_stack, w = stack_groups(list_of_x_mat, list_of_y)
+    num_params = x_stack.shape[2]
+
+    results = batched_ols(x_stack, y_stack, w)
+    e_loo, leverage = loo_residuals(x_stack, y_stack, w)
+    e_kfold, folds = kfold_cv_residuals(x_stack, y_stack, w, k=k, seed=seed)
+    tukey = irls_fit(x_stack, y_stack, w, norm='tukey')
+    ransac = ransac_fit(x_stack, y_stack, w, seed=seed)
+
+    #internally and externally studentized residuals (see residual_diagnostics.py)
+    n = results['n']
+    r_int, t_ext = studentized_residuals(results, leverage)
+    cooks_d = cooks_distance(r_int, leverage, num_params)
+
+    list_of_point_dfs = []
+    list_of_group_rows = []
+    for g, key in enumerate(keys):
+        n_g = int(n[g])
+        df = dict_of_data[key]
+        df_points = pd.DataFrame({'Viscosity [cSt]': viscosity_from_key(key), 'P [mbar]': df['P [mbar]'].values,
+                                  'Q_sli [uL/min]': df['Q_sli [uL/min]'].values,
+                                  'Q_mass_meas [uL/min]': df['Q_mass_meas [uL/min]'].values,
+                                  'residual [uL/min]': results['residuals'][g, :n_g], 'leverage': leverage[g, :n_g],
+                                  'studentized_residual': r_int[g, :n_g], 'ext_studentized_residual': t_ext[g, :n_g],
+                                  'cooks_distance': cooks_d[g, :n_g],
+                                  'loo_residual [uL/min]': e_loo[g, :n_g], 'kfold_residual [uL/min]': e_kfold[g, :n_g],
+                                  'tukey_weight': tukey['robust_weights'][g, :n_g],
+                                  'ransac_inlier': ransac['inliers'][g, :n_g]})
+        t_threshold_g, cooks_threshold_g = outlier_thresholds(n_g, num_params, alpha, t_threshold)
+        df_points['high_leverage'] = df_points['leverage'] > 2*num_params/n_g
+        df_points['high_residual'] = np.abs(df_points['ext_studentized_residual']) > t_threshold_g
+        df_points['influential'] = df_points['cooks_distance'] > cooks_threshold_g
+        df_points['flagged'] = df_points['high_residual'] | df_points['influential']
+        list_of_point_dfs.append(df_points)
+
+        row = {'Viscosity [cSt]': viscosity_from_key(key), 'n': n_g,
+               'rmse [uL/min]': np.sqrt(results['sse'][g]/n_g),
+               'loo_rmse [uL/min]': np.sqrt(np.mean(e_loo[g, :n_g]**2)),
+               'kfold_rmse [uL/min]': np.sqrt(np.mean(e_kfold[g, :n_g]**2)), 't_threshold': t_threshold_g,
+               'cooks_threshold': cooks_threshold_g}
+        for i in range(num_params):
+            row['ols_beta_'+str(i)] = results['beta_hat'][g, i]
+            row['tukey_beta_'+str(i)] = tukey['beta_hat'][g, i]
+            row['ransac_beta_'+str(i)] = ransac['beta_hat'][g, i]
+        row['num_flagged'] = int(np.sum(df_points['flagged']))
+        list_of_group_rows.append(row)
+
+    return pd.concat(list_of_point_dfs, ignore_index=True), pd.DataFrame(list_of_group_rows)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
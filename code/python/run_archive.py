@@ -0,0 +1,409 @@
+"""
+Title: run_archive.py
+
+Summary:
+Compressed archive container for the raw .csv files output by the sensiron flow viewer software (one file per test
+pressure, see flow_rate_meas_to_avg.py), so that the raw data of many campaigns can be kept in a fraction of the space
+of the text files and any one run (or any time range of a run) can be read without decompressing the rest of the
+archive.
+
+Each run is stored under its name (path of the .csv file relative to the data folder, without .csv) with its header
+lines (the 14 lines before the column names, sensor information, sampling settings, etc.) and its columns (Sample #,
+Relative Time[s], Flow [ul/min] and any additional columns of the export). The rows of a run are split in blocks of
+block_size rows and each column of each block is
+
+1. delta encoded, difference of consecutive values (of the 64 bit integer pattern of the values, so that the encoding is
+    lossless for floats, and Sample # and Relative Time[s] become near constant)
+2. byte shuffled, the k-th bytes of every value are stored together (the high bytes of the deltas are mostly equal)
+3. compressed with zstd (zstandard package) or lz4 (lz4 package) if installed, otherwise zlib
+
+The archive file is of the form
+
+[magic][compressed column blocks of every run][index (json)][length of index (8 bytes)][magic]
+
+where the index holds, for every run, the header lines, column names and dtypes and, for every block, the first row,
+number of rows, min and max Relative Time[s] and the position and length of each compressed column. A run, a time range
+of a run or a subset of its columns is read by seeking to and decompressing only the blocks needed.
+
+Dependencies:
+1. Path from pathlib
+2. json
+3. os
+4. struct
+5. zlib
+6. numpy
+7. pandas
+8. functions.py
+9. zstandard [optional]
+10. lz4 [optional]
+
+Notes:
+1. runs are appended to an existing archive with append=True, the archive is rewritten to a temporary file (blocks of
+    the kept runs copied as they are) that replaces it once complete, see write_archive fn
+2. runs are read, encoded and written one at a time, so archiving many .csv files only holds one run in memory
+3. the codec of the archive is stored in the index, an archive written with zstd or lz4 can only be read where that
+    package is installed
+4. reading a run returns the same tuple (df, header_lines) as read_sensirion_csv in functions.py, see
+    average_archived_run in pipeline_stages.py for the averaging stage
+
+"""
+
+from pathlib import Path
+import json
+import os
+import struct
+import zlib
+import numpy as np
+import pandas as pd
+from functions import read_sensirion_csv
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+archive_magic = b'SLIARCH1'
+time_column = 'Relative Time[s]'
+
+
+"""
+Function: get_codec(codec=None)
+
+Summary:
+Function outputs the tuple (codec, compress, decompress) of the given codec ('zstd', 'lz4' or 'zlib'), or of the best
+installed codec if codec is None (zstd, then lz4, then zlib).
+
+"""
+
+def get_codec(codec=None):
+    if codec is None:
+        codec = 'zstd' if zstandard is not None else ('lz4' if lz4 is not None else 'zlib')
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ImportError("codec 'zstd' needs the zstandard package")
+        return codec, zstandard.ZstdCompressor(level=3).compress, zstandard.ZstdDecompressor().decompress
+    if codec == 'lz4':
+        if lz4 is None:
+            raise ImportError("codec 'lz4' needs the lz4 package")
+        return codec, lz4.frame.compress, lz4.frame.decompress
+    if codec == 'zlib':
+        return codec, (lambda data: zlib.compress(data, 6)), zlib.decompress
+    raise ValueError("unknown codec '" + str(codec) + "'")
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: encode_column(values, compress)
+
+Summary:
+Function delta encodes, byte shuffles and compresses a column (int or float array) of a block and outputs the bytes.
+
+"""
+
+def encode_column(values, compress):
+    bits = np.ascontiguousarray(values).view(np.int64)
+    #differences wrap around on overflow, so decoding with cumsum is exact
+    delta = np.diff(bits, prepend=np.int64(0))
+    shuffled = delta.view(np.uint8).reshape(-1, 8).T.copy()
+    return compress(shuffled.tobytes())
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: decode_column(data, num_rows, dtype, decompress)
+
+Summary:
+Function reverses encode_column and outputs the column of the block as an array of the given dtype.
+
+"""
+
+def decode_column(data, num_rows, dtype, decompress):
+    shuffled = np.frombuffer(decompress(data), dtype=np.uint8).reshape(8, num_rows)
+    delta = shuffled.T.copy().view(np.int64).ravel()
+    return np.cumsum(delta).view(dtype)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: read_archive_index(path)
+
+Summary:
+Function reads the index of an archive and outputs the tuple (index, index_start), where index is a dictionary of the
+form {'codec': codec, 'runs': {run_name: {'header_lines', 'columns', 'dtypes', 'num_rows', 'blocks'}}} and index_start
+is the position of the index in the file (end of the compressed blocks).
+
+"""
+
+def read_archive_index(path):
+    with open(path, 'rb') as f:
+        if f.read(len(archive_magic)) != archive_magic:
+            raise ValueError(str(path) + ' is not a run archive')
+        f.seek(-(8+len(archive_magic)), os.SEEK_END)
+        index_length = struct.unpack('<Q', f.read(8))[0]
+        if f.read(len(archive_magic)) != archive_magic:
+            raise ValueError(str(path) + ' is incomplete (no index at end of file)')
+        index_start = f.seek(-(8+len(archive_magic)+index_length), os.SEEK_END)
+        index = json.loads(f.read(index_length).decode('utf-8'))
+    return index, index_start
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: list_archive_runs(path)
+
+Summary:
+Function outputs the list of the names of the runs stored in an archive.
+
+"""
+
+def list_archive_runs(path):
+    return list(read_archive_index(path)[0]['runs'])
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: encode_run(run_name, df, header_lines, block_size, compress)
+
+Summary:
+Function checks and encodes the columns of a run block by block (see encode_column fn) and outputs the tuple
+(run, data), where run is the entry of the run in the index (see read_archive_index fn) without the positions of the
+compressed columns and data is the list, for every block, of the list of the compressed columns.
+
+"""
+
+def encode_run(run_name, df, header_lines, block_size, compress):
+    columns = list(df.columns)
+    arrays = []
+    for column in columns:
+        values = df[column].to_numpy()
+        if values.dtype.kind in 'iub':
+            arrays.append(values.astype(np.int64))
+        elif values.dtype.kind == 'f':
+            arrays.append(values.astype(np.float64))
+        else:
+            raise ValueError("column '" + str(column) + "' of run '" + run_name + "' is not numeric")
+
+    blocks = []
+    data = []
+    for row_start in range(0, len(df), block_size):
+        num_rows = min(block_size, len(df)-row_start)
+        block = {'row_start': row_start, 'num_rows': num_rows, 'columns': []}
+        if time_column in columns:
+            time = arrays[columns.index(time_column)][row_start:row_start+num_rows]
+            block['t_min'] = float(np.min(time))
+            block['t_max'] = float(np.max(time))
+        blocks.append(block)
+        data.append([encode_column(values[row_start:row_start+num_rows], compress) for values in arrays])
+
+    run = {'header_lines': list(header_lines), 'columns': columns, 'dtypes': [values.dtype.str for values in arrays],
+           'num_rows': len(df), 'blocks': blocks}
+    return run, data
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: write_archive(path, runs, block_size=65536, codec=None, append=False)
+
+Summary:
+Function writes runs to an archive file. runs is a dictionary of the form {run_name: (df, header_lines)} (see
+read_sensirion_csv fn in functions.py) or an iterable of (run_name, (df, header_lines)) pairs, e.g. a generator reading
+the runs one at a time (see archive_csv_files fn). Outputs the index of the archive (see read_archive_index fn).
+
+Inputs:
+1. path, path of the archive file
+2. runs, dictionary or iterable of runs
+3. block_size, number of rows of each block (smallest unit read for random access)
+4. codec, 'zstd', 'lz4' or 'zlib' (best installed if None, the codec of the archive if append=True)
+5. append, if True the runs are added to an existing archive (runs of the same name are replaced)
+
+Notes:
+1. all columns must be numeric, int columns are stored as int64 and float columns as float64
+2. each run is encoded (and checked) and written to path.tmp before the next run is taken from runs, so only one run is
+    held in memory. path.tmp replaces the file at path only once complete, so an error leaves an existing archive
+    unchanged
+3. with append=True the compressed blocks of the kept runs (runs of the archive not in runs) are copied to the new file
+    after the new runs without decompressing them and the blocks of replaced runs are dropped, so the archive holds no
+    dead blocks
+4. a run name given twice in runs raises a ValueError
+
+"""
+
+def write_archive(path, runs, block_size=65536, codec=None, append=False):
+    path = Path(path)
+    old_index = None
+    if append and path.exists():
+        old_index = read_archive_index(path)[0]
+        codec = old_index['codec']
+    codec, compress, decompress = get_codec(codec)
+    if isinstance(runs, dict):
+        runs = runs.items()
+
+    new_runs = {}
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + '.tmp')
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(archive_magic)
+
+            #encoding and writing one run at a time
+            for run_name, (df, header_lines) in runs:
+                if run_name in new_runs:
+                    raise ValueError("run '" + run_name + "' is given more than once")
+                run, data = encode_run(run_name, df, header_lines, block_size, compress)
+                for block, block_data in zip(run['blocks'], data):
+                    for column_data in block_data:
+                        block['columns'].append([f.tell(), len(column_data)])
+                        f.write(column_data)
+                new_runs[run_name] = run
+                #released before the next run is read
+                del df, data
+
+            #copying the compressed blocks of the runs of the archive that are not replaced
+            index = {'codec': codec, 'runs': {}}
+            if old_index is not None:
+                with open(path, 'rb') as f_old:
+                    for run_name, run in old_index['runs'].items():
+                        if run_name in new_runs:
+                            continue
+                        for block in run['blocks']:
+                            for position in block['columns']:
+                                f_old.seek(position[0])
+                                data = f_old.read(position[1])
+                                position[0] = f.tell()
+                                f.write(data)
+                        index['runs'][run_name] = run
+            index['runs'].update(new_runs)
+
+            index_bytes = json.dumps(index).encode('utf-8')
+            f.write(index_bytes)
+            f.write(struct.pack('<Q', len(index_bytes)))
+            f.write(archive_magic)
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return index
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: read_archive_run(path, run_name, t_min=None, t_max=None, columns=None, index=None)
+
+Summary:
+Function reads a run of an archive and outputs the tuple (df, header_lines) as read_sensirion_csv fn in functions.py.
+If t_min and/or t_max [s] are given only the rows with t_min <= Relative Time[s] <= t_max are output and only the blocks
+overlapping the time range are read. If columns is given only those columns are read.
+
+Inputs:
+1. path, path of the archive file
+2. run_name, name of the run (see list_archive_runs fn)
+3. t_min, t_max, time range [s]
+4. columns, list of column names (all if None)
+5. index, index of the archive (see read_archive_index fn), read from the file if None (pass it when reading many runs)
+
+"""
+
+def read_archive_run(path, run_name, t_min=None, t_max=None, columns=None, index=None):
+    if index is None:
+        index = read_archive_index(path)[0]
+    if run_name not in index['runs']:
+        raise KeyError("run '" + run_name + "' is not in archive " + str(path))
+    run = index['runs'][run_name]
+    codec, compress, decompress = get_codec(index['codec'])
+
+    time_range = t_min is not None or t_max is not None
+    t_min = -np.inf if t_min is None else t_min
+    t_max = np.inf if t_max is None else t_max
+    if columns is None:
+        columns = run['columns']
+    #time column is needed to select the rows of the time range
+    read_columns = columns + [time_column] if time_range and time_column not in columns else columns
+    i_columns = [run['columns'].index(column) for column in read_columns]
+
+    blocks = [block for block in run['blocks']
+              if not time_range or (block['t_max'] >= t_min and block['t_min'] <= t_max)]
+    chunks = {column: [] for column in read_columns}
+    with open(path, 'rb') as f:
+        for block in blocks:
+            for column, i in zip(read_columns, i_columns):
+                offset, length = block['columns'][i]
+                f.seek(offset)
+                chunks[column].append(decode_column(f.read(length), block['num_rows'], np.dtype(run['dtypes'][i]),
+                                                    decompress))
+
+    df = pd.DataFrame({column: (np.concatenate(chunks[column]) if len(chunks[column]) > 0 else
+                                np.empty(0, dtype=np.dtype(run['dtypes'][i])))
+                       for column, i in zip(read_columns, i_columns)})
+    if time_range:
+        df = df[(df[time_column] >= t_min) & (df[time_column] <= t_max)][columns].reset_index(drop=True)
+    return df, list(run['header_lines'])
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: archive_csv_files(data_dir, archive_path, pattern='**/*_mbar.csv', block_size=65536, codec=None,
+                            append=False)
+
+Summary:
+Function reads every .csv file of data_dir matching pattern (see read_sensirion_csv fn in functions.py) and writes them
+to an archive, each under its path relative to data_dir without .csv (e.g. flow_rate_measurements/positive_q/visc_5_cSt/
+100_mbar). The files are read one at a time as they are written (see write_archive fn). Outputs the tuple
+(index, csv_bytes), where csv_bytes is the total size of the .csv files.
+
+"""
+
+def archive_csv_files(data_dir, archive_path, pattern='**/*_mbar.csv', block_size=65536, codec=None, append=False):
+    data_dir = Path(data_dir)
+    csv_paths = sorted(data_dir.glob(pattern))
+    csv_bytes = sum(csv_path.stat().st_size for csv_path in csv_paths)
+    runs = ((csv_path.relative_to(data_dir).with_suffix('').as_posix(), read_sensirion_csv(csv_path))
+            for csv_path in csv_paths)
+    index = write_archive(archive_path, runs, block_size=block_size, codec=codec, append=append)
+    return index, csv_bytes
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+if __name__ == '__main__':
+    # specify path of the raw data and of the archive
+    data_dir = Path('../../data/si_oil/')
+    archive_path = Path('./outputs/archive/si_oil.sliarch')
+
+    save_archive = input('Archive raw flow rate measurements of ' + str(data_dir) + ' to ' + str(archive_path) +
+                         '? (y/n)')
+    if save_archive == 'y':
+        index, csv_bytes = archive_csv_files(data_dir, archive_path, append=True)
+
+        #checking that every run of data_dir is read back identically
+        for run_name in index['runs']:
+            if not (data_dir / (run_name + '.csv')).exists():
+                continue
+            df, header_lines = read_archive_run(archive_path, run_name, index=index)
+            df_csv, header_lines_csv = read_sensirion_csv(data_dir / (run_name + '.csv'))
+            if not (df.equals(df_csv) and header_lines == header_lines_csv):
+                print('run ' + run_name + ' not read back identically')
+
+        print(str(len(index['runs'])) + ' runs, codec ' + index['codec'] + ', ' + str(csv_bytes) +
+              ' bytes of .csv -> ' + str(archive_path.stat().st_size) + ' bytes')
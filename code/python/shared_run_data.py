@@ -0,0 +1,313 @@
+"""
+Title: shared_run_data.py
+
+Summary:
+Shared memory store of parsed runs (multiprocessing.shared_memory) for analyses of the same raw runs in parallel
+processes (averaging, steady state trimming, plotting, bootstrap, ...). Each run is read once (read_sensirion_csv fn in
+functions.py) and its numeric columns are copied into one shared memory segment per run. Worker processes receive only a
+small layout dictionary of the form
+
+{'runs': {run_name: {'segment': name, 'num_rows': n, 'columns': {column: (dtype, offset)}}}}
+
+and attach to the segments, so every worker reads the columns as zero-copy, read-only numpy arrays instead of re-reading
+the .csv files or receiving pickled dataframes.
+
+A function of the form func(run_name, columns, **kwargs), where columns is a dictionary {column: array} of a run, is
+applied to many runs in a process pool with SharedRunStore.map_runs. run_average and run_steady_state_average apply
+sensiron_first_order_uncertainty (and steady_state_window) of functions.py to the shared columns.
+
+Dependencies:
+1. Path from pathlib
+2. weakref
+3. multiprocessing.shared_memory
+4. concurrent.futures
+5. numpy
+6. pandas
+7. functions.py
+
+Notes:
+1. segments are unlinked by SharedRunStore.close (called on leaving a with block, when the store is garbage collected
+    and at exit of the interpreter), use the store as a context manager so segments do not outlive the analysis
+2. functions passed to map_runs must be defined at module level (pickled by name) and must not modify the columns
+3. arrays obtained from SharedRunStore.column must be deleted before closing the store, otherwise the segment is
+    unlinked but stays mapped until the arrays are deleted
+
+"""
+
+from pathlib import Path
+import weakref
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from functions import read_sensirion_csv, sensiron_first_order_uncertainty, steady_state_window
+
+#layout and attached segments of a worker process (see init_worker fn)
+_worker_layout = None
+_worker_segments = {}
+
+#unlinked segments still used by numpy arrays, closed once the arrays are deleted (see release_segments fn)
+_unclosed_segments = []
+
+
+"""
+Function: release_segments(segments)
+
+Summary:
+Function closes and unlinks a dictionary of shared memory segments of the form {name: SharedMemory}. Segments whose
+memory is still used by numpy arrays can not be closed, they are unlinked and kept in _unclosed_segments, and closed by
+a later call once the arrays are deleted.
+
+"""
+
+def release_segments(segments):
+    for shm in list(_unclosed_segments):
+        try:
+            shm.close()
+            _unclosed_segments.remove(shm)
+        except BufferError:
+            pass
+    for name in list(segments):
+        shm = segments.pop(name)
+        try:
+            shm.close()
+        except BufferError:
+            _unclosed_segments.append(shm)
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: column_views(buf, run_layout, columns=None)
+
+Summary:
+Function outputs a dictionary {column: array} of zero-copy, read-only numpy arrays of the columns of a run (all columns
+if columns is None) in the buffer of its shared memory segment, see the layout in the summary.
+
+"""
+
+def column_views(buf, run_layout, columns=None):
+    if columns is None:
+        columns = list(run_layout['columns'])
+    views = {}
+    for column in columns:
+        dtype, offset = run_layout['columns'][column]
+        view = np.frombuffer(buf, dtype=dtype, count=run_layout['num_rows'], offset=offset)
+        view.flags.writeable = False
+        views[column] = view
+    return views
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: init_worker(layout)
+
+Summary:
+Initializer of the worker processes of map_runs, stores the layout of the shared runs. Segments are attached on first
+use of each run and kept attached until the worker exits.
+
+"""
+
+def init_worker(layout):
+    global _worker_layout
+    _worker_layout = layout
+    _worker_segments.clear()
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: attach_run(run_name, columns=None)
+
+Summary:
+Function outputs the dictionary {column: array} of zero-copy, read-only arrays of a shared run in a worker process
+started with init_worker (see column_views fn).
+
+"""
+
+def attach_run(run_name, columns=None):
+    run_layout = _worker_layout['runs'][run_name]
+    name = run_layout['segment']
+    if name not in _worker_segments:
+        _worker_segments[name] = shared_memory.SharedMemory(name=name)
+    return column_views(_worker_segments[name].buf, run_layout, columns)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: run_task(task)
+
+Summary:
+Function applies func to the shared columns of a run in a worker process, task is of the form (func, run_name, kwargs).
+
+"""
+
+def run_task(task):
+    func, run_name, kwargs = task
+    return func(run_name, attach_run(run_name), **kwargs)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Class: SharedRunStore()
+
+Summary:
+Store of the numeric columns of parsed runs in shared memory (one segment per run), see summary. Runs are added with
+add_run (dataframe) or add_csv_files (sensiron flow viewer exports, run_name is the path of the file relative to
+data_dir without .csv as in run_archive.py), read in the current process with column and processed in parallel with
+map_runs.
+
+Notes:
+1. use as a context manager, e.g.
+    with SharedRunStore() as store:
+        store.add_csv_files(data_dir)
+        results = store.map_runs(run_average)
+
+"""
+
+class SharedRunStore:
+    def __init__(self):
+        self.layout = {'runs': {}}
+        self.segments = {}
+        self.header_lines = {}
+        self._finalizer = weakref.finalize(self, release_segments, self.segments)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add_run(self, run_name, df, header_lines=None):
+        if run_name in self.layout['runs']:
+            raise ValueError("run '" + run_name + "' is already in the store")
+        columns = [column for column in df.columns if pd.api.types.is_numeric_dtype(df[column])]
+        list_of_arrays = [np.ascontiguousarray(df[column].values) for column in columns]
+
+        #columns one after the other, each aligned to 8 bytes
+        offsets = []
+        size = 0
+        for array in list_of_arrays:
+            offsets.append(size)
+            size += -(-array.nbytes//8)*8
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self.segments[shm.name] = shm
+        run_layout = {'segment': shm.name, 'num_rows': len(df), 'columns': {}}
+        for column, array, offset in zip(columns, list_of_arrays, offsets):
+            run_layout['columns'][column] = (array.dtype.str, offset)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf, offset=offset)[:] = array
+        self.layout['runs'][run_name] = run_layout
+        self.header_lines[run_name] = header_lines
+
+    def add_csv_files(self, data_dir, pattern='**/*_mbar.csv'):
+        data_dir = Path(data_dir)
+        for csv_path in sorted(data_dir.glob(pattern)):
+            df, header_lines = read_sensirion_csv(csv_path)
+            self.add_run(csv_path.relative_to(data_dir).with_suffix('').as_posix(), df, header_lines)
+
+    def run_names(self):
+        return list(self.layout['runs'])
+
+    def nbytes(self):
+        return sum(shm.size for shm in self.segments.values())
+
+    def column(self, run_name, column):
+        run_layout = self.layout['runs'][run_name]
+        return column_views(self.segments[run_layout['segment']].buf, run_layout, [column])[column]
+
+    def map_runs(self, func, run_names=None, max_workers=None, chunksize=1, **kwargs):
+        if run_names is None:
+            run_names = self.run_names()
+        tasks = [(func, run_name, kwargs) for run_name in run_names]
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker, initargs=(self.layout,)) as executor:
+            results = list(executor.map(run_task, tasks, chunksize=chunksize))
+        return dict(zip(run_names, results))
+
+    def close(self):
+        release_segments(self.segments)
+        self.layout['runs'].clear()
+        self.header_lines.clear()
+
+'''
+********************************************END OF CLASS***************************************************************
+'''
+
+"""
+Function: run_average(run_name, columns, flow_meter='SLI-0430', bits=11, quantized=False)
+
+Summary:
+Function outputs the list [Pressure [mbar], # of Samples, Avg. Flow [uL/min], u_sli_o [uL/min], u_sli_1 [uL/min]] of the
+shared columns of a run (see sensiron_first_order_uncertainty fn in functions.py), for map_runs.
+
+"""
+
+def run_average(run_name, columns, flow_meter='SLI-0430', bits=11, quantized=False):
+    key = Path(run_name).name.replace('_mbar', '')
+    df = pd.DataFrame({'Flow [ul/min]': columns['Flow [ul/min]']}, copy=False)
+    return sensiron_first_order_uncertainty({key: df}, flow_meter=flow_meter, bits=bits, quantized=quantized)[key]
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: run_steady_state_average(run_name, columns, flow_meter='SLI-0430', bits=11)
+
+Summary:
+Function is run_average of the steady state portion of the run only (see steady_state_window fn in functions.py), with
+the relative time [s] at the start of the steady state appended to the list, for map_runs.
+
+"""
+
+def run_steady_state_average(run_name, columns, flow_meter='SLI-0430', bits=11):
+    flow = columns['Flow [ul/min]']
+    i_start, i_end = steady_state_window(flow, flow_meter=flow_meter, bits=bits)
+    steady_columns = {'Flow [ul/min]': flow[i_start:i_end]}
+    avg = run_average(run_name, steady_columns, flow_meter=flow_meter, bits=bits)
+    avg.append(float(columns['Relative Time[s]'][i_start]))
+    return avg
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+if __name__ == '__main__':
+    # specify path of the raw data and number of worker processes (number of cpus if None)
+    data_dir = Path('../../data/si_oil/')
+    max_workers = None
+
+    with SharedRunStore() as store:
+        store.add_csv_files(data_dir / 'flow_rate_measurements')
+        print(str(len(store.run_names())) + ' runs in shared memory, ' + str(store.nbytes()) + ' bytes')
+
+        dict_of_avg = store.map_runs(run_average, max_workers=max_workers)
+        dict_of_steady_avg = store.map_runs(run_steady_state_average, max_workers=max_workers)
+
+    df_summary = pd.DataFrame([[run_name] + dict_of_avg[run_name] + dict_of_steady_avg[run_name][1:]
+                               for run_name in dict_of_avg],
+                              columns=['Run', 'Pressure [mbar]', '# Samples', 'Avg. Flow [uL/min]', 'u_sli_o [uL/min]',
+                                       'u_sli_1 [uL/min]', '# Samples steady', 'Avg. Flow steady [uL/min]',
+                                       'u_sli_o steady [uL/min]', 'u_sli_1 steady [uL/min]', 't_steady [s]'])
+    print(df_summary.to_string())
+
+    question = input('Output run summary as .csv file? (y/n): ')
+    while question != 'y' and question !='n':
+        question = input("please input 'y' or 'n': ")
+    if question == 'y':
+        out_dir = Path('./outputs/shared_run_data/')
+        out_dir.mkdir(parents=True, exist_ok=True)
+        df_summary.to_csv(out_dir / 'run_summary.csv', index=False)
+    elif question =='n':
+        print('results not output to .csv')
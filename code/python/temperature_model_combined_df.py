@@ -0,0 +1,97 @@
+"""
+Title: temperature_model_combined_df.py
+
+Summary:
+Code intakes .csv files created by neg_and_pos_q_combined_file.py (in ./outputs/combined_pos_neg_q) with the average
+temperature of each calibration point (sensor export with a temperature channel, averaged with average_run(...,
+temperature=True) in pipeline_stages.py), of form:
+
+[P [mbar] Q_sli [uL/min] u_q_sli [uL/min], u_q_sli_rel [%],Q_mass_meas [uL/min] ,u_q_m [uL/min], u_q_m_rel [%], T [C]]
+
+and fits the temperature compensated correction (see fit_temperature_model fn in correction_models.py)
+
+Q_actual = (B_00 + B_01*dT) + (B_10 + B_11*dT)*Q_sli,    dT = T - t_ref
+
+for every viscosity at once, so that one calibration covers the range of lab temperatures of the calibration points.
+Viscosities whose calibration points do not span a range of temperatures (e.g. all measured at one lab temperature)
+can not be fit with the temperature terms and use the fit without them (temperature_identifiable is False). Program
+prints the coefficients and the k-fold cross-validation error with and without the temperature terms and outputs
+the coefficients as a .csv file to ./outputs/est_params_and_uncert/temperature_model_params.csv. The correction is
+applied to new measurements with apply_correction (or apply_correction_bulk for many viscosities) in
+correction_models.py.
+
+Program also fits the global viscosity model at the kinematic viscosity of the fluid at the temperature of each point,
+nu(T) (see fit_global_viscosity_model fn in correction_models.py and fluid_properties.py), which shares the temperature
+dependence over every viscosity and only needs a spread of viscosities, and prints its leave-one-viscosity-out error.
+
+Dependencies:
+1. Path from pathlib
+2. numpy
+3. pandas
+4. scipy.stats
+5. correction_models.py
+
+Notes:
+1. change degree, temp_degree and t_ref to change the model (and visc_degree for the shared nu(T) model)
+2. the volume flow rates should be calculated with the density at the temperature of each measurement
+    (mass_to_volume_flow_rate_t fn in pipeline_stages.py, see fluid_properties.py)
+
+"""
+
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from scipy import stats
+from correction_models import read_correction_data, fit_temperature_model, viscosity_from_key, \
+    fit_global_viscosity_model
+
+#degree of model in Q_sli and in T - t_ref, reference temperature [C], degree of shared model in ln(nu(T))
+degree = 1
+temp_degree = 1
+t_ref = 25.0
+visc_degree = 2
+
+# specify path of data to use for correction fitting
+p = Path('./outputs/combined_pos_neg_q/')
+
+#creating dictionary of dataframes for each set of correction data with key value pair {visc_cSt: df}
+dict_of_combined_data = read_correction_data(p)
+
+#fitting temperature model to every viscosity at once
+temp_fit = fit_temperature_model(dict_of_combined_data, degree=degree, temp_degree=temp_degree, t_ref=t_ref)
+
+#creating dataframe of form [Viscosity [cSt], B_00, u_B_00, ..., r_squared, cv_rmse, cv_rmse_no_temp] with the
+#uncertainty of each coefficient at 95% confidence (half width of confidence interval, as plotting_combined_df.py)
+col_names = ['B_' + str(i) + str(j) for i in range(degree+1) for j in range(temp_degree+1)]
+#degrees of freedom of the fit without temperature terms for viscosities that fall back to it
+num_params = np.where(temp_fit['temperature_identifiable'], len(col_names), degree+1)
+t_crit = stats.t.ppf(0.975, temp_fit['n'] - num_params)
+u_beta_hat = t_crit[:, None]*np.sqrt(np.diagonal(temp_fit['cov_beta_hat'], axis1=1, axis2=2))
+df_params = pd.DataFrame({'Viscosity [cSt]': [viscosity_from_key(key) for key in temp_fit['keys']]})
+for m, col in enumerate(col_names):
+    df_params[col] = temp_fit['beta_hat'][:, m]
+    df_params['u_' + col] = u_beta_hat[:, m]
+df_params['t_ref [C]'] = t_ref
+df_params['r_squared'] = temp_fit['r_squared']
+df_params['cv_rmse [uL/min]'] = temp_fit['cv_rmse']
+df_params['cv_rmse_no_temp [uL/min]'] = temp_fit['cv_rmse_no_temp']
+df_params['T spread [C]'] = temp_fit['temp_spread']
+df_params['temperature_identifiable'] = temp_fit['temperature_identifiable']
+print(df_params.to_string())
+
+#temperature dependence shared by every viscosity through nu(T)
+if len(dict_of_combined_data) > visc_degree+1:
+    nu_fit = fit_global_viscosity_model(dict_of_combined_data, degree=degree, visc_degree=visc_degree,
+                                        temperature=True)
+    print('shared nu(T) model, r_squared = ' + str(round(nu_fit['r_squared'], 6)) +
+          ', leave-one-viscosity-out rmse [uL/min]: ' +
+          ', '.join(key + ' ' + str(round(rmse, 4)) for key, rmse in nu_fit['lovo_rmse'].items()))
+
+#outputting coefficients as .csv in ./outputs/est_params_and_uncert
+question = input('Output temperature model parameters as .csv file? (y/n): ')
+while question != 'y' and question !='n':
+    question = input("please input 'y' or 'n': ")
+if question == 'y':
+    df_params.to_csv('./outputs/est_params_and_uncert/temperature_model_params.csv')
+elif question =='n':
+    print('results not output to .csv')
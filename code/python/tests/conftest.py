@@ -0,0 +1,13 @@
+"""
+Title: conftest.py
+
+Summary:
+pytest configuration of the regression tests, puts the scripts of code/python on the import path (the scripts import
+each other by module name, as when run from code/python).
+
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
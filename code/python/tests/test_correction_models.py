@@ -0,0 +1,229 @@
+"""
+Title: test_correction_models.py
+
+Summary:
+Regression tests of correction_models.py, the batched OLS fits of zero padded groups with different numbers of
+observations give the same estimates, covariances and fit statistics as separate statsmodels OLS fits of each group, and
+the closed form leave-one-out and k-fold cross-validation residuals equal the prediction errors of explicit refits.
+Ill-conditioned polynomial fits are accurate, and models that can not be estimated for a group (data of one flow
+direction, fewer points than parameters) are flagged instead of stopping the fit of the other groups. Viscosities
+without a spread of temperatures fall back to the temperature model without temperature terms, and the global model at
+nu(T) recovers a temperature dependence shared by every viscosity from one temperature per viscosity.
+
+"""
+
+from fractions import Fraction
+import numpy as np
+import pandas as pd
+import statsmodels.api as sm
+from correction_models import (model_matrix, stack_groups, batched_ols, information_criteria, loo_residuals,
+                               kfold_cv_residuals, kfold_cv_rmse, fit_candidate_models, fit_temperature_model,
+                               fit_global_viscosity_model, global_model_coefficients, apply_correction_bulk)
+from fluid_properties import kinematic_viscosity
+
+
+def make_groups(sizes=(7, 12, 9), spec=None, seed=0):
+    rng = np.random.default_rng(seed)
+    if spec is None:
+        spec = {'kind': 'polynomial', 'degree': 2}
+    list_of_x_mat = []
+    list_of_y = []
+    for g, n in enumerate(sizes):
+        q_sli = np.sort(rng.uniform(-200, 200, n))
+        list_of_x_mat.append(model_matrix(q_sli, spec))
+        list_of_y.append(0.5 + (1.1 + 0.05*g)*q_sli + 1e-4*q_sli**2 + rng.normal(0, 2, n))
+    return list_of_x_mat, list_of_y
+
+
+def test_batched_ols_matches_statsmodels():
+    for spec in [{'kind': 'polynomial', 'degree': 1}, {'kind': 'polynomial', 'degree': 3},
+                 {'kind': 'piecewise', 'breakpoint': 0.0}]:
+        list_of_x_mat, list_of_y = make_groups(spec=spec)
+        x_stack, y_stack, w = stack_groups(list_of_x_mat, list_of_y)
+        results = batched_ols(x_stack, y_stack, w)
+        for g, (x_mat, y) in enumerate(zip(list_of_x_mat, list_of_y)):
+            fit = sm.OLS(y, x_mat).fit()
+            n = len(y)
+            np.testing.assert_allclose(results['beta_hat'][g], fit.params, rtol=1e-8, atol=1e-10)
+            np.testing.assert_allclose(results['cov_beta_hat'][g], fit.cov_params(), rtol=1e-8, atol=1e-14)
+            np.testing.assert_allclose(results['residuals'][g, :n], fit.resid, atol=1e-8)
+            np.testing.assert_allclose(results['sse'][g], fit.ssr, rtol=1e-10)
+            np.testing.assert_allclose(results['r_squared'][g], fit.rsquared, rtol=1e-10)
+            assert results['n'][g] == n and results['dof'][g] == fit.df_resid
+
+
+def test_information_criteria_match_statsmodels():
+    list_of_x_mat, list_of_y = make_groups()
+    x_stack, y_stack, w = stack_groups(list_of_x_mat, list_of_y)
+    results = batched_ols(x_stack, y_stack, w)
+    aic, bic = information_criteria(results['sse'], results['n'], x_stack.shape[2])
+    for g, (x_mat, y) in enumerate(zip(list_of_x_mat, list_of_y)):
+        fit = sm.OLS(y, x_mat).fit()
+        #statsmodels does not count the error variance as a parameter
+        np.testing.assert_allclose(aic[g], fit.aic + 2, rtol=1e-10)
+        np.testing.assert_allclose(bic[g], fit.bic + np.log(len(y)), rtol=1e-10)
+
+
+def test_loo_residuals_match_refits():
+    list_of_x_mat, list_of_y = make_groups()
+    x_stack, y_stack, w = stack_groups(list_of_x_mat, list_of_y)
+    e_loo, leverage = loo_residuals(x_stack, y_stack, w)
+    for g, (x_mat, y) in enumerate(zip(list_of_x_mat, list_of_y)):
+        n = len(y)
+        for i in range(n):
+            keep = np.arange(n) != i
+            beta_hat = np.linalg.lstsq(x_mat[keep], y[keep], rcond=None)[0]
+            np.testing.assert_allclose(e_loo[g, i], y[i] - x_mat[i] @ beta_hat, rtol=1e-7, atol=1e-9)
+        np.testing.assert_allclose(leverage[g, :n], sm.OLS(y, x_mat).fit().get_influence().hat_matrix_diag,
+                                   rtol=1e-8)
+        assert np.all(e_loo[g, n:] == 0)
+
+
+def test_kfold_cv_residuals_match_refits():
+    list_of_x_mat, list_of_y = make_groups(sizes=(11, 16, 13))
+    x_stack, y_stack, w = stack_groups(list_of_x_mat, list_of_y)
+    for k in [2, 3, 5]:
+        e_cv, folds = kfold_cv_residuals(x_stack, y_stack, w, k=k, seed=1)
+        for g, (x_mat, y) in enumerate(zip(list_of_x_mat, list_of_y)):
+            n = len(y)
+            assert set(folds[g, :n]) == set(range(k)) and np.all(folds[g, n:] == -1)
+            for fold in range(k):
+                held_out = folds[g, :n] == fold
+                beta_hat = np.linalg.lstsq(x_mat[~held_out], y[~held_out], rcond=None)[0]
+                np.testing.assert_allclose(e_cv[g, :n][held_out], y[held_out] - x_mat[held_out] @ beta_hat,
+                                           rtol=1e-7, atol=1e-9)
+        rmse = kfold_cv_rmse(x_stack, y_stack, w, k=k, seed=1)
+        np.testing.assert_allclose(rmse, np.sqrt(np.sum(e_cv**2, axis=1)/np.sum(w, axis=1)))
+
+    #k equal to the number of observations of the smallest group is leave-one-out for that group
+    e_cv, folds = kfold_cv_residuals(x_stack, y_stack, w, k=100)
+    e_loo, leverage = loo_residuals(x_stack, y_stack, w)
+    np.testing.assert_allclose(e_cv[0, :11], e_loo[0, :11], rtol=1e-7, atol=1e-9)
+
+
+def exact_ols(x_mat, y):
+    #normal equations solved in rational arithmetic (reference without rounding errors)
+    num_params = x_mat.shape[1]
+    a_mat = [[sum(Fraction(a)*Fraction(b) for a, b in zip(x_mat[:, i], x_mat[:, j])) for j in range(num_params)]
+             for i in range(num_params)]
+    b_vec = [sum(Fraction(a)*Fraction(b) for a, b in zip(x_mat[:, i], y)) for i in range(num_params)]
+    for i in range(num_params):
+        for j in range(i+1, num_params):
+            factor = a_mat[j][i]/a_mat[i][i]
+            a_mat[j] = [a - factor*b for a, b in zip(a_mat[j], a_mat[i])]
+            b_vec[j] -= factor*b_vec[i]
+    beta = [Fraction(0)]*num_params
+    for i in reversed(range(num_params)):
+        beta[i] = (b_vec[i] - sum(a_mat[i][j]*beta[j] for j in range(i+1, num_params)))/a_mat[i][i]
+    return np.array([float(b) for b in beta])
+
+
+def test_ill_conditioned_polynomial_fit():
+    rng = np.random.default_rng(2)
+    for q_min in [-1000, 100]:
+        q_sli = np.sort(rng.uniform(q_min, 1000, 12))
+        y = 0.5 + 1.1*q_sli + 1e-4*q_sli**2 + 2e-7*q_sli**3 + rng.normal(0, 2, 12)
+        x_mat = model_matrix(q_sli, {'kind': 'polynomial', 'degree': 3})
+        assert np.linalg.cond(x_mat.T @ x_mat) > 1e15
+        results = batched_ols(x_mat[None], y[None], np.ones((1, 12)))
+        np.testing.assert_allclose(results['beta_hat'][0], exact_ols(x_mat, y), rtol=1e-10)
+
+
+def test_single_sign_data_and_small_groups():
+    rng = np.random.default_rng(3)
+    dict_of_data = {}
+    for key, n in [('5_cSt', 10), ('10_cSt', 4), ('20_cSt', 3)]:
+        q_sli = np.linspace(50, 500, n)
+        dict_of_data[key] = pd.DataFrame({'Q_sli [uL/min]': q_sli,
+                                          'Q_mass_meas [uL/min]': 1.05*q_sli + 2 + rng.normal(0, 1, n)})
+    df_models, dict_of_fits = fit_candidate_models(dict_of_data, k=3)
+    estimable = df_models.set_index(['Viscosity [cSt]', 'model'])['estimable']
+    #min(Q_sli,0) is zero for positive flow rates only
+    assert not any(estimable[(visc, 'piecewise_0')] for visc in [5.0, 10.0, 20.0])
+    assert estimable[(5.0, 'poly_3')] and estimable[(10.0, 'poly_3')] and not estimable[(20.0, 'poly_3')]
+    assert estimable[(20.0, 'poly_2')]
+    df_not_estimable = df_models[~df_models['estimable']]
+    assert df_not_estimable[['sse', 'aic', 'bic']].isna().all().all()
+    assert not df_not_estimable[['best_aic', 'best_bic', 'best_cv']].any().any()
+    assert df_models.groupby('Viscosity [cSt]')['best_aic'].sum().tolist() == [1, 1, 1]
+
+    #the fits of the other groups are the same as when fit alone
+    keys, results = dict_of_fits['poly_1']
+    for g, key in enumerate(keys):
+        df = dict_of_data[key]
+        x_mat = model_matrix(df['Q_sli [uL/min]'].values, {'kind': 'polynomial', 'degree': 1})
+        fit = sm.OLS(df['Q_mass_meas [uL/min]'].values, x_mat).fit()
+        np.testing.assert_allclose(results['beta_hat'][g], fit.params, rtol=1e-10)
+
+    #folds without which a group can not be estimated give NaN cross-validation residuals, not an error
+    q_sli = np.linspace(50, 500, 4)
+    x_stack, y_stack, w = stack_groups([model_matrix(q_sli, {'kind': 'polynomial', 'degree': 3})], [q_sli + 1])
+    e_cv, folds = kfold_cv_residuals(x_stack, y_stack, w, k=2)
+    assert np.all(np.isnan(e_cv))
+
+
+def test_temperature_model_falls_back_without_temperature_spread():
+    rng = np.random.default_rng(4)
+    dict_of_data = {}
+    for key, temperature in [('5_cSt', rng.uniform(20, 30, 12)), ('10_cSt', rng.uniform(18, 28, 15)),
+                             ('20_cSt', np.full(12, 22.0)), ('50_cSt', 22.0 + rng.normal(0, 1e-3, 12))]:
+        q_sli = np.linspace(-500, 500, len(temperature))
+        d_temp = temperature - 25.0
+        y = 0.5 + 0.1*d_temp + (1.1 + 0.002*d_temp)*q_sli + rng.normal(0, 0.5, len(q_sli))
+        dict_of_data[key] = pd.DataFrame({'Q_sli [uL/min]': q_sli, 'Q_mass_meas [uL/min]': y, 'T [C]': temperature})
+    temp_fit = fit_temperature_model(dict_of_data, k=3)
+    assert temp_fit['temperature_identifiable'].tolist() == [True, True, False, False]
+
+    for g, key in enumerate(temp_fit['keys']):
+        df = dict_of_data[key]
+        q_sli, y = df['Q_sli [uL/min]'].values, df['Q_mass_meas [uL/min]'].values
+        if temp_fit['temperature_identifiable'][g]:
+            x_mat = model_matrix(q_sli, temp_fit['spec'], temperature=df['T [C]'].values)
+            fit = sm.OLS(y, x_mat).fit()
+            np.testing.assert_allclose(temp_fit['beta_hat'][g], fit.params, rtol=1e-8)
+            u_beta_hat = np.sqrt(np.diag(temp_fit['cov_beta_hat'][g]))
+            assert np.all(np.abs(temp_fit['beta_hat'][g] - [0.5, 0.1, 1.1, 0.002]) < 4*u_beta_hat)
+        else:
+            #coefficients of the fit without temperature, no temperature terms
+            fit = sm.OLS(y, model_matrix(q_sli, {'kind': 'polynomial', 'degree': 1})).fit()
+            np.testing.assert_allclose(temp_fit['beta_hat'][g, [0, 2]], fit.params, rtol=1e-10)
+            assert np.all(temp_fit['beta_hat'][g, [1, 3]] == 0)
+            np.testing.assert_allclose(temp_fit['cov_beta_hat'][g][np.ix_([0, 2], [0, 2])], fit.cov_params(),
+                                       rtol=1e-8, atol=1e-14)
+            np.testing.assert_allclose(temp_fit['sse'][g], fit.ssr, rtol=1e-10)
+            assert temp_fit['cv_rmse'][g] == temp_fit['cv_rmse_no_temp'][g]
+    for name in ['beta_hat', 'cov_beta_hat', 'sse', 'aic', 'cv_rmse']:
+        assert np.all(np.isfinite(temp_fit[name]))
+
+    q_sli = np.concatenate([dict_of_data[key]['Q_sli [uL/min]'].values for key in temp_fit['keys']])
+    temperature = np.concatenate([dict_of_data[key]['T [C]'].values for key in temp_fit['keys']])
+    group = np.concatenate([np.full(len(dict_of_data[key]), g) for g, key in enumerate(temp_fit['keys'])])
+    q_actual = apply_correction_bulk(q_sli, temp_fit['spec'], temp_fit['beta_hat'], group, temperature=temperature)
+    assert np.all(np.abs(q_actual - (0.5 + 1.1*q_sli)) < 0.05*np.abs(q_sli) + 5)
+
+
+def test_shared_temperature_dependence_through_viscosity():
+    beta_true = np.array([0.5, -0.1, 0.02, 1.2, -0.05, 0.004])
+    spec = {'kind': 'global', 'degree': 1, 'visc_degree': 2}
+    dict_of_data = {}
+    for key, temperature in [('5_cSt', 20.0), ('10_cSt', 23.0), ('20_cSt', 25.0), ('50_cSt', 27.0), ('100_cSt', 30.0)]:
+        q_sli = np.linspace(-500, 500, 11)
+        nu = kinematic_viscosity(key, temperature)
+        dict_of_data[key] = pd.DataFrame({'Q_sli [uL/min]': q_sli, 'T [C]': temperature,
+                                          'Q_mass_meas [uL/min]': model_matrix(q_sli, spec, nu) @ beta_true})
+    #one temperature per viscosity, the per viscosity temperature terms can not be fit
+    assert not fit_temperature_model(dict_of_data, k=3)['temperature_identifiable'].any()
+
+    nu_fit = fit_global_viscosity_model(dict_of_data, temperature=True)
+    np.testing.assert_allclose(nu_fit['beta_hat'], beta_true, rtol=1e-8, atol=1e-10)
+    assert max(nu_fit['lovo_rmse'].values()) < 1e-6
+    #coefficients of a fluid at a temperature outside of the calibration
+    log_nu_powers = np.log(kinematic_viscosity('10_cSt', 35.0))**np.arange(3)
+    np.testing.assert_allclose(global_model_coefficients(nu_fit, kinematic_viscosity('10_cSt', 35.0)),
+                               [[beta_true[:3] @ log_nu_powers, beta_true[3:] @ log_nu_powers]], rtol=1e-8)
+
+    #at 25 C the viscosity of each fluid is its nominal viscosity
+    for df in dict_of_data.values():
+        df['T [C]'] = 25.0
+    np.testing.assert_allclose(fit_global_viscosity_model(dict_of_data, temperature=True)['beta_hat'],
+                               fit_global_viscosity_model(dict_of_data)['beta_hat'], rtol=1e-10)
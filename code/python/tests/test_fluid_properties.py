@@ -0,0 +1,46 @@
+"""
+Title: test_fluid_properties.py
+
+Summary:
+Regression tests of fluid_properties.py, the generated property tables give the properties at 25 C and the viscosity
+temperature coefficient of each fluid, density and kinematic viscosity interpolate the tables (ln(nu) for the viscosity)
+and clip outside of them, and measured tables are read sorted by temperature.
+
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from fluid_properties import si_oil_properties, property_table, read_property_table, density, kinematic_viscosity
+
+
+def test_generated_tables():
+    for fluid_key, props in si_oil_properties.items():
+        np.testing.assert_allclose(density(fluid_key, 25.0), props['rho_25'], rtol=1e-14)
+        np.testing.assert_allclose(kinematic_viscosity(fluid_key, 25.0), props['nu_25'], rtol=1e-14)
+        table = property_table(fluid_key, [38.0, 99.0])
+        np.testing.assert_allclose(table['nu [cSt]'][1]/table['nu [cSt]'][0], 1 - props['vtc'], rtol=1e-12)
+        np.testing.assert_allclose(property_table(fluid_key, [35.0])['rho [kg/m^3]'],
+                                   props['rho_25']/(1 + 10*props['alpha']), rtol=1e-14)
+
+        #denser and more viscous when colder
+        temperatures = np.linspace(10, 40, 31)
+        assert np.all(np.diff(density(fluid_key, temperatures)) < 0)
+        assert np.all(np.diff(kinematic_viscosity(fluid_key, temperatures)) < 0)
+
+    with pytest.raises(ValueError):
+        property_table('water')
+
+
+def test_interpolation_of_measured_table(tmp_path):
+    df = pd.DataFrame({'T [C]': [30.0, 20.0], 'rho [kg/m^3]': [950.0, 960.0], 'nu [cSt]': [8.0, 12.5],
+                       'Source': ['lab', 'lab']})
+    df.to_csv(tmp_path / 'table.csv', index=False)
+    table = read_property_table(tmp_path / 'table.csv')
+    assert table['T [C]'].tolist() == [20.0, 30.0] and list(table.columns) == ['T [C]', 'rho [kg/m^3]', 'nu [cSt]']
+
+    np.testing.assert_allclose(density('5_cSt', [20.0, 22.5, 30.0], table), [960.0, 957.5, 950.0])
+    #linear in ln(nu)
+    np.testing.assert_allclose(kinematic_viscosity('5_cSt', 25.0, table), np.sqrt(8.0*12.5), rtol=1e-14)
+    np.testing.assert_allclose(kinematic_viscosity('5_cSt', [10.0, 40.0], table), [12.5, 8.0], rtol=1e-14)
+    assert np.ndim(density('5_cSt', 21.0, table)) == 0
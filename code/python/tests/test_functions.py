@@ -0,0 +1,71 @@
+"""
+Title: test_functions.py
+
+Summary:
+Regression tests of functions.py. The zero order uncertainty of scalar and array inputs is the closed form value, the
+result is written into out when given, the chunks of iter_zero_order_uncertainty equal the uncertainty of the whole run
+and the input dataframes are not modified. The quantized statistics of int16 codes equal the float statistics of the
+flow rates, histograms of parts of a run merge exactly and flow rates off the code grid are refused.
+
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from functions import (sensiron_specs, zero_order_uncertainty, iter_zero_order_uncertainty,
+                       sensiron_zero_order_uncertainty, sensiron_first_order_uncertainty, flow_to_codes, codes_to_flow,
+                       code_histogram, merge_code_histograms)
+
+
+def expected_uncertainty(flow):
+    specs = sensiron_specs('SLI-0430', 11)
+    return np.sqrt(np.maximum(np.abs(flow)*specs['mv_acc_percent'], specs['fs_acc'])**2 + specs['precision']**2)
+
+
+def make_runs(num_rows=2500):
+    rng = np.random.default_rng(0)
+    return {str(p): pd.DataFrame({'Sample #': np.arange(num_rows), 'Relative Time[s]': np.arange(num_rows)*0.05,
+                                  'Flow [ul/min]': p/10 + rng.normal(0, 5, num_rows)}) for p in [-500, 100, 800]}
+
+
+def test_zero_order_uncertainty_scalar_and_array():
+    u = zero_order_uncertainty(12.5)
+    assert u.shape == ()
+    np.testing.assert_allclose(u, expected_uncertainty(12.5))
+
+    flow = np.linspace(-1000, 1000, 101)
+    np.testing.assert_allclose(zero_order_uncertainty(flow), expected_uncertainty(flow))
+    out = np.empty(flow.shape)
+    assert zero_order_uncertainty(flow, out=out) is out
+    np.testing.assert_allclose(out, expected_uncertainty(flow))
+
+
+def test_chunks_match_whole_runs_and_inputs_unchanged():
+    dict_of_df = make_runs()
+    dict_of_copies = {key: df.copy() for key, df in dict_of_df.items()}
+    dict_of_u = sensiron_zero_order_uncertainty(dict_of_df)
+    for key, start, u_chunk in iter_zero_order_uncertainty(dict_of_df, chunk_size=1000):
+        np.testing.assert_array_equal(u_chunk, dict_of_u[key][start:start+len(u_chunk)])
+    for key, df in dict_of_df.items():
+        np.testing.assert_allclose(dict_of_u[key], expected_uncertainty(df['Flow [ul/min]'].values))
+        assert df.equals(dict_of_copies[key])
+
+
+def test_quantized_statistics_match_float_statistics():
+    rng = np.random.default_rng(1)
+    specs = sensiron_specs('SLI-0430', 11)
+    codes = np.rint(rng.normal(300, 40, 20000)).astype(np.int16)
+    flow = codes_to_flow(codes)
+    np.testing.assert_array_equal(flow_to_codes(flow, off_grid_tol=0.05), codes)
+
+    dict_of_df = {'150': pd.DataFrame({'Flow [ul/min]': flow})}
+    avg = sensiron_first_order_uncertainty(dict_of_df)['150']
+    avg_quantized = sensiron_first_order_uncertainty(dict_of_df, quantized=True)['150']
+    assert avg_quantized[:2] == avg[:2]
+    np.testing.assert_allclose(avg_quantized[2:], avg[2:], rtol=1e-12)
+
+    hist = merge_code_histograms([code_histogram(codes[:7000]), code_histogram(codes[7000:])])
+    np.testing.assert_array_equal(hist, code_histogram(codes))
+
+    with pytest.raises(ValueError):
+        flow_to_codes(flow + 0.3*specs['resolution'], off_grid_tol=0.05)
@@ -0,0 +1,84 @@
+"""
+Title: test_ingest_validation.py
+
+Summary:
+Regression tests of ingest_validation.py, rows dropped by read_sensirion_csv (rows with every value missing and trailing
+rows of a file that is still being written) are accepted, other missing values are reported, and a new sensor file
+without a mass balance measurement makes watch_pipeline.py skip its group and keep the other groups up to date.
+
+"""
+
+import numpy as np
+import pandas as pd
+from ingest_validation import validate_inputs, validate_sensor_file, file_group
+from watch_pipeline import new_pipeline_state, run_incremental
+
+
+def write_sensor_file(path, pressure, rows=None, seed=0, num_rows=200):
+    rng = np.random.default_rng(seed)
+    if rows is None:
+        rows = [[i, '%.2f' % (i*0.05), '%.3f' % (pressure/10 + rng.normal(0, 0.5))] for i in range(num_rows)]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', newline='') as f:
+        f.write(''.join('Header line ' + str(i) + '\r\n' for i in range(14)))
+        f.write('Sample #,Relative Time[s],Flow [ul/min]\r\n')
+        f.write(''.join(','.join(str(value) for value in row) + '\r\n' for row in rows))
+
+
+def write_campaign(data_dir, pressures=(100, 200, 300)):
+    for flow_case, sign, q in [('positive_q', 1, 'p'), ('negative_q', -1, 'n')]:
+        for visc in ['5', '10']:
+            for pressure in pressures:
+                write_sensor_file(data_dir / 'flow_rate_measurements' / flow_case / ('visc_' + visc + '_cSt') /
+                                  (str(pressure) + '_mbar.csv'), sign*pressure, seed=pressure)
+            mass_dir = data_dir / 'mass_balance_measurements' / flow_case
+            mass_dir.mkdir(parents=True, exist_ok=True)
+            pd.DataFrame({'P [mbar]': list(pressures), 'Measurement Time [s]': 300.0, 'M_i [g]': 10.0,
+                          'M_f [g]': [10.0 + 0.0027*p for p in pressures]}).to_csv(
+                mass_dir / ('visc_' + visc + '_cSt_mass_' + q + '_q.csv'), index=False)
+
+
+def test_dropped_rows_accepted(tmp_path):
+    rows = [[i, '%.2f' % (i*0.05), '1.0'] for i in range(50)]
+    write_sensor_file(tmp_path / '100_mbar.csv', 100, rows=rows + [['', '', ''], [50, '2.50', 'nan']])
+    assert validate_sensor_file(tmp_path, '100_mbar.csv') == (100, [])
+
+    write_sensor_file(tmp_path / '200_mbar.csv', 200, rows=rows[:10] + [[10, '0.50', 'nan']] + rows[11:])
+    pressure, list_of_problems = validate_sensor_file(tmp_path, '200_mbar.csv')
+    assert [problem[1:3] for problem in list_of_problems] == [['nan', 1]]
+
+
+def test_mass_file_missing_values_reported(tmp_path):
+    write_campaign(tmp_path)
+    mass_path = tmp_path / 'mass_balance_measurements' / 'positive_q' / 'visc_5_cSt_mass_p_q.csv'
+    with open(mass_path, 'a') as f:
+        f.write('400,300,10.0,\n')
+    df_problems = validate_inputs(tmp_path, [], max_workers=1)
+    assert 'nan' in set(df_problems['Check'])
+    assert set(df_problems['File'].map(file_group)) == {'positive_q/5_cSt'}
+
+
+def test_watcher_skips_invalid_group(tmp_path):
+    data_dir = tmp_path / 'data'
+    write_campaign(data_dir)
+    state = new_pipeline_state(data_dir, tmp_path / 'out', validate=True)
+    assert 'params_table' in run_incremental(state)
+    params_before = state['frames']['params/5_cSt'][0]
+
+    #new sensor file before its mass balance measurement, and a file of another group still being written
+    write_sensor_file(data_dir / 'flow_rate_measurements' / 'positive_q' / 'visc_5_cSt' / '400_mbar.csv', 400, seed=400)
+    sensor_path = data_dir / 'flow_rate_measurements' / 'positive_q' / 'visc_10_cSt' / '300_mbar.csv'
+    with open(sensor_path, 'a') as f:
+        f.write('200,10.00,nan\r\n')
+    recalculated = run_incremental(state)
+    assert 'params/10_cSt' in recalculated
+    assert not any('5_cSt' in node for node in recalculated)
+    assert state['frames']['params/5_cSt'][0] == params_before
+
+    #once the mass balance measurement is written the group is recalculated
+    mass_path = data_dir / 'mass_balance_measurements' / 'positive_q' / 'visc_5_cSt_mass_p_q.csv'
+    with open(mass_path, 'a') as f:
+        f.write('400,300.0,10.0,11.08\n')
+    recalculated = run_incremental(state)
+    assert 'params/5_cSt' in recalculated
+    assert len(state['frames']['pn/5_cSt']) == 7
@@ -0,0 +1,60 @@
+"""
+Title: test_lut_export.py
+
+Summary:
+Regression tests of lut_export.py, the written (float32 or fixed point) tables stay within their error bounds, the
+interpolated tables stay within their bounds for a smooth correction and the binary file is read back.
+
+"""
+
+import numpy as np
+import pandas as pd
+from lut_export import fit_for_lut, build_lut, verify_lut, write_lut_binary, read_lut_binary
+
+
+def smooth_fits(seed=0):
+    rng = np.random.default_rng(seed)
+    q_sli = np.linspace(-75, 75, 12)
+    dict_of_data = {}
+    for visc in [1, 2, 5, 10, 20, 50]:
+        q_actual = 0.3*np.log(visc) + (1.0 + 0.08*np.log(visc)**2)*q_sli
+        dict_of_data[str(visc) + '_cSt'] = pd.DataFrame({'Q_sli [uL/min]': q_sli, 'Q_mass_meas [uL/min]': q_actual +
+                                                         rng.normal(0, 0.05, len(q_sli))})
+    return fit_for_lut(dict_of_data)
+
+
+def test_bounds_cover_tables_and_interpolation():
+    fits = smooth_fits()
+    lut = build_lut(fits, bits=8)
+    for scale in [None, 0.1]:
+        verification = verify_lut(lut, fits, scale=scale, num_samples=10000)
+        assert verification['error_below_bound']
+        assert verification['interpolation_error_below_bound']
+    assert verification['min_bound [uL/min]'] >= 0.1
+
+
+def test_interpolated_bound_includes_interpolation_error():
+    fits = smooth_fits()
+    lut = build_lut(fits, [3.0, 5.0], bits=8)
+    assert list(lut['interpolated']) == [True, False]
+    lut_no_interp = build_lut(fits, [2.0, 5.0], bits=8)
+    assert np.all(lut['bound'][0] > np.minimum(lut_no_interp['bound'][0], lut_no_interp['bound'][1]))
+
+
+def test_calibrated_code_range():
+    fits = smooth_fits()
+    lut = build_lut(fits, bits=11)
+    resolution = lut['resolution']
+    assert np.all(lut['code_range'][:, 0]*resolution >= -75 - 1e-9)
+    assert np.all(lut['code_range'][:, 1]*resolution <= 75 + 1e-9)
+    assert np.all((lut['code_range'][:, 1]+1)*resolution > 75)
+
+
+def test_binary_round_trip(tmp_path):
+    fits = smooth_fits()
+    lut = build_lut(fits, bits=8)
+    write_lut_binary(lut, tmp_path / 'lut.bin')
+    lut_read = read_lut_binary(tmp_path / 'lut.bin')
+    assert np.array_equal(lut_read['code_range'], lut['code_range'])
+    assert np.array_equal(lut_read['inverse'], lut['inverse'])
+    assert np.allclose(lut_read['forward'], lut['forward'], rtol=1e-6)
@@ -0,0 +1,59 @@
+"""
+Title: test_monte_carlo_uncertainty.py
+
+Summary:
+Regression tests of monte_carlo_uncertainty.py, the standard uncertainty of the actual flow rates of the chunked
+simulation agrees with the first order (GUM) propagation of the balance, time and density uncertainties, the mean of
+the slope is the true slope (the systematic sensor accuracy does not attenuate it), and the distributions of the
+parameters do not depend on the chunk size.
+
+"""
+
+import numpy as np
+import pandas as pd
+from monte_carlo_uncertainty import mc_inputs, mc_calibration
+
+
+def make_inputs():
+    pressures = np.arange(100, 1100, 100)
+    q_sli = 0.08*pressures
+    t_meas = 300.0
+    rho = 960.0
+    m_diff = 1.05*q_sli*t_meas*rho/(60000*10**6/1000)
+    df_avg = pd.DataFrame({'Pressure [mbar]': pressures, '# Samples': 6000, 'Avg. Flow [uL/min]': q_sli,
+                           'u_sli_o [uL/min]': 0.5, 'u_sli_1 [uL/min]': 0.51})
+    df_mass = pd.DataFrame({'P [mbar]': pressures, 'Measurement Time [s]': t_meas, 'M_i [g]': 10.0,
+                            'M_f [g]': 10.0 + m_diff})
+    return mc_inputs(df_avg, df_mass, rho, 'positive_q')
+
+
+def test_actual_flow_uncertainty_matches_first_order_propagation():
+    inputs = make_inputs()
+    balance_resolution, u_time, u_rho_rel = 0.005, 0.1, 0.005
+    results = mc_calibration(inputs, num_draws=200000, chunk_size=30000, balance_resolution=balance_resolution,
+                             u_time=u_time, u_rho_rel=u_rho_rel)
+    m_diff = inputs['m_f'] - inputs['m_i']
+    q_actual = m_diff/(inputs['t_meas']*inputs['rho'])*(60000*10**6/1000)
+    #two uniform balance readings of width balance_resolution
+    u_rel = np.sqrt(2*balance_resolution**2/12/m_diff**2 + (u_time/inputs['t_meas'])**2 + u_rho_rel**2)
+    np.testing.assert_allclose(results['u_q_actual'], u_rel*q_actual, rtol=0.02)
+
+
+def test_mean_slope_recovers_true_slope():
+    inputs = make_inputs()
+    results = mc_calibration(inputs, num_draws=200000, chunk_size=50000)
+    #slope of make_inputs, the accuracy error shared by every point moves the fit along the true line
+    assert abs(results['beta_1']['mean'] - 1.05) < 0.05*results['beta_1']['u']
+    assert abs(results['beta_0']['mean']) < 0.1*results['beta_0']['u']
+    assert results['beta_1']['low_95'] < 1.05 < results['beta_1']['high_95']
+
+
+def test_parameters_independent_of_chunk_size():
+    inputs = make_inputs()
+    list_of_results = [mc_calibration(inputs, num_draws=100000, chunk_size=chunk_size, seed=seed)
+                       for chunk_size, seed in [(100000, 0), (7000, 1)]]
+    for name in ['beta_0', 'beta_1']:
+        u = list_of_results[0][name]['u']
+        assert abs(list_of_results[0][name]['mean'] - list_of_results[1][name]['mean']) < 5*u*np.sqrt(2/100000)
+        np.testing.assert_allclose(list_of_results[1][name]['u'], u, rtol=0.02)
+    np.testing.assert_allclose(list_of_results[0]['u_q_sli'], list_of_results[1]['u_q_sli'], rtol=0.02)
@@ -0,0 +1,80 @@
+"""
+Title: test_multi_sensor_ingest.py
+
+Summary:
+Regression tests of multi_sensor_ingest.py, a timed ingest of fast sensors whose queues are full (policy 'block') shuts
+down within a bound and keeps every block read, dropped blocks are counted with policy 'drop_oldest', and the rolling
+statistics of streams read from simulators and from a socket equal sensiron_first_order_uncertainty of their samples.
+
+"""
+
+import asyncio
+import time
+import numpy as np
+from functions import sensiron_first_order_uncertainty
+from multi_sensor_ingest import (RingBuffer, SimulatedSensorTransport, SocketSensorTransport, serve_simulated_sensor,
+                                 ingest_sensors, rolling_stats)
+
+
+def run_ingest(transports, timeout_s=5.0, **kwargs):
+    async def main():
+        return await asyncio.wait_for(ingest_sensors(transports, **kwargs), timeout_s)
+    return asyncio.run(main())
+
+
+def test_shutdown_under_backpressure():
+    for policy in ['block', 'drop_oldest']:
+        transports = [SimulatedSensorTransport('sensor_' + str(i), realtime=False, seed=i) for i in range(4)]
+        t_start = time.perf_counter()
+        streams = run_ingest(transports, queue_blocks=1, duration_s=0.2, policy=policy, buffer_capacity=1000)
+        assert time.perf_counter() - t_start < 2.0
+        for stream in streams.values():
+            assert stream['blocks'] > 0
+            assert stream['buffer'].total + stream['dropped'] == 100*stream['blocks']
+            if policy == 'block':
+                assert stream['dropped'] == 0
+
+
+def test_stats_of_ended_streams():
+    transports = [SimulatedSensorTransport('sensor_' + str(i), block_size=64, mean_flow=50*(i+1), num_samples=5000,
+                                           realtime=False, seed=i) for i in range(3)]
+    streams = run_ingest(transports, buffer_capacity=2000, queue_blocks=4)
+    df_stats = rolling_stats(streams)
+    for i, row in df_stats.iterrows():
+        buffer = streams[row['sensor_id']]['buffer']
+        df = buffer.view()
+        assert buffer.total == 5000 and df['Sample #'].tolist() == list(range(3000, 5000))
+        expected = sensiron_first_order_uncertainty({'0': df}, flow_meter='SLI-0430', bits=11)['0']
+        np.testing.assert_allclose(row[['# of Samples', 'Avg. Flow [uL/min]', 'u_sli_o [uL/min]', 'u_sli_1 [uL/min]']]
+                                   .astype(float), expected[1:], rtol=1e-12)
+
+
+def test_socket_transport():
+    async def main():
+        server = await serve_simulated_sensor(0, num_samples=3000, realtime=False, block_size=250, seed=1)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return await asyncio.wait_for(ingest_sensors([SocketSensorTransport('socket', '127.0.0.1', port,
+                                                                                chunk_bytes=4096)]), 5.0)
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    buffer = asyncio.run(main())['socket']['buffer']
+    async def read_simulator():
+        simulator = SimulatedSensorTransport('socket', num_samples=3000, realtime=False, block_size=250, seed=1)
+        return [block async for block in iter_blocks(simulator)]
+
+    async def iter_blocks(transport):
+        while (block := await transport.read_block()) is not None:
+            yield block
+
+    df = buffer.view()
+    assert df['Sample #'].tolist() == list(range(3000))
+    flow = np.concatenate([block[2] for block in asyncio.run(read_simulator())])
+    np.testing.assert_allclose(df['Flow [ul/min]'], flow, atol=1e-6)
+
+    #blocks larger than the buffer keep the most recent samples
+    ring = RingBuffer(100)
+    ring.extend(np.arange(250), np.arange(250)*0.01, np.arange(250.0))
+    assert ring.view()['Sample #'].tolist() == list(range(150, 250)) and ring.total == 250
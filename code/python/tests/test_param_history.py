@@ -0,0 +1,101 @@
+"""
+Title: test_param_history.py
+
+Summary:
+Regression tests of param_history.py, rows of a viscosity read through the byte offsets of the index equal the rows of
+the whole history, the incrementally updated control chart statistics equal EWMA and CUSUM charts computed from all
+previous calibrations, and appending the same fit again is skipped instead of distorting the charts.
+
+"""
+
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from param_history import (append_fit_history, read_fit_history, read_history_index, compare_fit_to_history,
+                           fit_source_hash)
+
+
+def make_params(seed, viscosities=(5, 10, 20)):
+    rng = np.random.default_rng(seed)
+    n = len(viscosities)
+    return pd.DataFrame({'Viscosity [cSt]': list(viscosities), 'beta_0_hat [uL/min]': rng.normal(0.5, 0.1, n),
+                         'u_beta_0_hat [uL/min]': 0.2, 'u_beta_0_hat_rel [%]': 40.0,
+                         'beta_1_hat': rng.normal(1.05, 0.01, n), 'u_beta_1_hat': 0.02, 'u_beta_1_hat_rel [%]': 2.0,
+                         'r_squared': 0.999})
+
+
+def append_calibrations(history_dir, num_calibrations):
+    list_of_params = []
+    list_of_stats = []
+    for c in range(num_calibrations):
+        df_params = make_params(c)
+        list_of_stats.append(append_fit_history(df_params, history_dir, 'si_oil', metadata={'operator': 'a,b'},
+                                                timestamp=datetime(2024, 1, 1) + timedelta(days=c)))
+        list_of_params.append(df_params)
+    return list_of_params, list_of_stats
+
+
+def test_offsets_index_matches_history(tmp_path):
+    list_of_params, list_of_stats = append_calibrations(tmp_path, 4)
+    df_history = read_fit_history(tmp_path)
+    assert len(df_history) == 12
+    for visc in [5, 10, 20]:
+        df_visc = read_fit_history(tmp_path, viscosity=visc)
+        df_expected = df_history[df_history['Viscosity [cSt]'] == visc].reset_index(drop=True)
+        assert list(df_visc['run_id']) == list(df_expected['run_id'])
+        for col in ['beta_0_hat [uL/min]', 'beta_1_hat', 'r_squared']:
+            np.testing.assert_allclose(df_visc[col], df_expected[col], rtol=1e-15)
+        assert set(df_visc['metadata']) == {'{"operator": "a,b"}'}
+    assert len(read_fit_history(tmp_path, viscosity=50)) == 0
+
+
+def test_control_charts_match_whole_history(tmp_path):
+    lam, L, k, h = 0.2, 3.0, 0.5, 5.0
+    list_of_params, list_of_stats = append_calibrations(tmp_path, 8)
+    for visc in [5, 10, 20]:
+        for param in ['beta_0_hat [uL/min]', 'beta_1_hat']:
+            x = np.array([df[df['Viscosity [cSt]'] == visc][param].iloc[0] for df in list_of_params])
+            ewma, cusum_pos, cusum_neg = 0.0, 0.0, 0.0
+            for t in range(len(x)):
+                stats = list_of_stats[t]
+                stats = stats[(stats['Viscosity [cSt]'] == visc) & (stats['parameter'] == param)].iloc[0]
+                if t < 2:
+                    assert np.isnan(stats['z']) and not stats['ewma_alarm']
+                    continue
+                z = (x[t] - np.mean(x[:t]))/np.std(x[:t], ddof=1)
+                ewma = lam*z + (1-lam)*ewma
+                cusum_pos = max(0.0, cusum_pos + z - k)
+                cusum_neg = max(0.0, cusum_neg - z - k)
+                np.testing.assert_allclose([stats['z'], stats['ewma'], stats['cusum_pos'], stats['cusum_neg']],
+                                           [z, ewma, cusum_pos, cusum_neg], rtol=1e-10, atol=1e-12)
+                assert stats['ewma_alarm'] == (abs(ewma) > L*np.sqrt(lam/(2-lam)))
+                assert stats['cusum_alarm'] == (cusum_pos > h or cusum_neg > h)
+            state = read_history_index(tmp_path)['combined/' + str(visc) + '_cSt'][param]
+            np.testing.assert_allclose([state['mean'], np.sqrt(state['m2']/(state['n']-1))],
+                                       [np.mean(x), np.std(x, ddof=1)], rtol=1e-10)
+
+
+def test_duplicate_fits_skipped(tmp_path):
+    append_calibrations(tmp_path, 3)
+    index = read_history_index(tmp_path)
+    df_compare = compare_fit_to_history(make_params(2), tmp_path)
+
+    #the same fit appended again (at a later time) leaves the history, index and comparison unchanged
+    df_stats = append_fit_history(make_params(2), tmp_path, 'si_oil', timestamp=datetime(2024, 2, 1))
+    assert len(df_stats) == 0
+    assert read_history_index(tmp_path) == index
+    assert len(read_fit_history(tmp_path)) == 9
+    assert compare_fit_to_history(make_params(2), tmp_path).equals(df_compare)
+
+    #fits keyed on the hash of their data, a new fit of the same data is skipped and new data is appended
+    df_data = pd.DataFrame({'Q_sli [uL/min]': [10.0, 20.0], 'Q_mass_meas [uL/min]': [10.6, 21.1]})
+    source_hashes = {5: fit_source_hash(df_data)}
+    assert len(append_fit_history(make_params(3, [5]), tmp_path, 'si_oil', source_hashes=source_hashes)) == 2
+    assert len(append_fit_history(make_params(4, [5]), tmp_path, 'si_oil', source_hashes=source_hashes)) == 0
+    df_data.loc[0, 'Q_mass_meas [uL/min]'] = 10.7
+    df_stats = append_fit_history(make_params(4, [5]), tmp_path, 'si_oil',
+                                  source_hashes={5: fit_source_hash(df_data)})
+    assert len(df_stats) == 2
+    entry = read_history_index(tmp_path)['combined/5_cSt']
+    assert len(entry['offsets']) == len(entry['sources']) == len(set(entry['sources'])) == 5
+    assert entry['beta_1_hat']['n'] == 5
@@ -0,0 +1,101 @@
+"""
+Title: test_raw_trace_viewer.py
+
+Summary:
+Regression tests of raw_trace_viewer.py, the bins of every level of the min/max pyramid hold the min, max, sum and count
+of the samples they cover, minmax decimation outputs at most num_points bins covering the requested time range, lttb
+decimation keeps the first and last samples, and a cached pyramid is used without reading the .csv file of the run until
+the file changes.
+
+"""
+
+import os
+import numpy as np
+import pytest
+import raw_trace_viewer
+from raw_trace_viewer import (build_minmax_pyramid, minmax_decimate, lttb_decimate, run_pyramid, plot_raw_trace,
+                              steady_state_summary)
+
+
+def make_trace(num_samples=10000, seed=0):
+    rng = np.random.default_rng(seed)
+    time = np.arange(num_samples)*0.05
+    flow = 80 + 20*(1 - np.exp(-time/20)) + rng.normal(0, 0.5, num_samples)
+    return time, flow
+
+
+def write_run(path, time, flow):
+    with open(path, 'w', newline='') as f:
+        f.write(''.join('Header line ' + str(i) + '\r\n' for i in range(14)))
+        f.write('Sample #,Relative Time[s],Flow [ul/min]\r\n')
+        f.write(''.join('%d,%.2f,%.3f\r\n' % (i, t, q) for i, (t, q) in enumerate(zip(time, flow))))
+
+
+def test_pyramid_bins_match_samples():
+    time, flow = make_trace(num_samples=5003)
+    pyramid = build_minmax_pyramid(time, flow, factor=4, min_bins=64)
+    assert len(pyramid['levels']) > 1
+    for level in pyramid['levels']:
+        assert level['count'].sum() == len(flow)
+        i_start = np.concatenate([[0], np.cumsum(level['count'])[:-1]]).astype(int)
+        for b in range(len(level['count'])):
+            samples = flow[i_start[b]:i_start[b] + int(level['count'][b])]
+            assert level['min'][b] == samples.min() and level['max'][b] == samples.max()
+            np.testing.assert_allclose(level['sum'][b], samples.sum(), rtol=1e-12)
+            assert level['t_start'][b] == time[i_start[b]]
+
+
+def test_decimation():
+    time, flow = make_trace()
+    pyramid = build_minmax_pyramid(time, flow, factor=4, min_bins=64)
+    for t_min, t_max, num_points in [(None, None, 300), (100.0, 200.0, 500), (10.0, 12.0, 2000)]:
+        t_start, t_end, flow_min, flow_max = minmax_decimate(pyramid, t_min=t_min, t_max=t_max, num_points=num_points)
+        assert len(t_start) <= num_points
+        t_0 = t_start[0] if t_min is None else t_min
+        t_1 = t_end[-1] if t_max is None else t_max
+        in_range = (time >= t_0) & (time <= t_1)
+        assert t_start[0] <= time[in_range][0] and t_end[-1] >= time[in_range][-1]
+        assert flow_min.min() <= flow[in_range].min() and flow_max.max() >= flow[in_range].max()
+
+    time_lttb, flow_lttb = lttb_decimate(time, flow, num_points=500)
+    assert len(time_lttb) == 500
+    assert (time_lttb[0], time_lttb[-1], flow_lttb[0], flow_lttb[-1]) == (time[0], time[-1], flow[0], flow[-1])
+    assert np.all(np.diff(time_lttb) > 0) and np.all(np.isin(time_lttb, time))
+
+
+def test_cached_pyramid_skips_reading_run(tmp_path, monkeypatch):
+    time, flow = make_trace(num_samples=4000)
+    csv_path = tmp_path / '500_mbar.csv'
+    pyramid_path = tmp_path / 'figures' / '500_mbar_pyramid.npz'
+    write_run(csv_path, time, flow)
+    df, pyramid = run_pyramid(csv_path, pyramid_path)
+    assert df is not None and pyramid_path.exists()
+    steady = steady_state_summary(df['Relative Time[s]'].values, df['Flow [ul/min]'].values)
+    assert pyramid['steady'] == steady
+
+    def read_sensirion_csv(*args, **kwargs):
+        raise AssertionError('the run was read although its pyramid is cached')
+
+    monkeypatch.setattr(raw_trace_viewer, 'read_sensirion_csv', read_sensirion_csv)
+    df_cached, pyramid_cached = run_pyramid(csv_path, pyramid_path)
+    assert df_cached is None and pyramid_cached['steady'] == steady
+    for level, level_cached in zip(pyramid['levels'], pyramid_cached['levels']):
+        for name in level:
+            np.testing.assert_array_equal(level[name], level_cached[name])
+
+    #the plot uses the stored steady state statistics instead of the samples
+    monkeypatch.setattr(raw_trace_viewer, 'steady_state_summary', read_sensirion_csv)
+    results = plot_raw_trace(None, tmp_path / '500_mbar.png', pyramid=pyramid_cached)
+    assert (results['i_start'], results['avg_flow']) == (steady['i_start'], steady['avg_flow'])
+    with pytest.raises(ValueError):
+        plot_raw_trace(None, tmp_path / '500_mbar.png', pyramid=pyramid_cached, method='lttb')
+
+    #a changed run (or other settings) rebuilds the pyramid
+    monkeypatch.undo()
+    write_run(csv_path, time[:3000], flow[:3000] + 5)
+    os.utime(csv_path, ns=(pyramid_path.stat().st_mtime_ns,)*2)
+    df_new, pyramid_new = run_pyramid(csv_path, pyramid_path)
+    assert df_new is not None and pyramid_new['levels'][0]['count'].sum() == 3000
+    assert pyramid_new['steady']['avg_flow'] > steady['avg_flow']
+    df_bits, pyramid_bits = run_pyramid(csv_path, pyramid_path, bits=12)
+    assert df_bits is not None and pyramid_bits['source']['bits'] == 12
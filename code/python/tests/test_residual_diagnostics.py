@@ -0,0 +1,36 @@
+"""
+Title: test_residual_diagnostics.py
+
+Summary:
+Regression tests of residual_diagnostics.py, clean simulated fits are rarely flagged as having outliers or influential
+points and a gross outlier is flagged.
+
+"""
+
+import numpy as np
+import pandas as pd
+from residual_diagnostics import residual_diagnostics
+
+
+def simulated_fits(num_fits, seed=0):
+    rng = np.random.default_rng(seed)
+    q_sli = np.concatenate([-np.arange(500, 0, -100), np.arange(100, 600, 100)])*0.5
+    dict_of_data = {}
+    for g in range(num_fits):
+        dict_of_data[str(g+1) + '_cSt'] = pd.DataFrame({'P [mbar]': np.arange(len(q_sli)), 'Q_sli [uL/min]': q_sli,
+                                                        'Q_mass_meas [uL/min]': 1.2*q_sli + 0.5 +
+                                                        rng.normal(0, 1, len(q_sli))})
+    return dict_of_data
+
+
+def test_clean_fits_false_flag_rate():
+    df_points, df_table = residual_diagnostics(simulated_fits(1000))
+    assert df_table['status'].str.contains('outlier').mean() < 0.07
+    assert df_table['status'].str.contains('influential').mean() < 0.10
+
+
+def test_gross_outlier_flagged():
+    dict_of_data = simulated_fits(1, seed=1)
+    dict_of_data['1_cSt'].loc[4, 'Q_mass_meas [uL/min]'] += 20
+    df_points, df_table = residual_diagnostics(dict_of_data)
+    assert 'outlier' in df_table['status'].iloc[0]
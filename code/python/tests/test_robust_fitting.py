@@ -0,0 +1,84 @@
+"""
+Title: test_robust_fitting.py
+
+Summary:
+Regression tests of robust_fitting.py, the batched Huber and Tukey IRLS fits converge to the same estimates and weights
+as statsmodels RLM fits of each group (with the median centered MAD scale), RANSAC separates gross outliers, and the
+points flagged by point_diagnostics agree with the outlier and influence verdicts of residual_diagnostics.py.
+
+"""
+
+import numpy as np
+import pandas as pd
+import statsmodels.api as sm
+from correction_models import model_matrix, stack_groups, batched_ols
+from robust_fitting import irls_fit, ransac_fit, point_diagnostics
+from residual_diagnostics import residual_diagnostics
+
+
+def make_groups_with_outliers(sizes=(15, 20, 25), seed=0):
+    rng = np.random.default_rng(seed)
+    list_of_x_mat = []
+    list_of_y = []
+    for g, n in enumerate(sizes):
+        q_sli = np.sort(rng.uniform(-200, 200, n))
+        y = 0.5 + (1.1 + 0.05*g)*q_sli + rng.normal(0, 2, n)
+        y[3] += 40
+        y[-2] -= 30
+        list_of_x_mat.append(model_matrix(q_sli, {'kind': 'polynomial', 'degree': 1}))
+        list_of_y.append(y)
+    return list_of_x_mat, list_of_y
+
+
+def test_irls_matches_statsmodels_rlm():
+    list_of_x_mat, list_of_y = make_groups_with_outliers()
+    x_stack, y_stack, w = stack_groups(list_of_x_mat, list_of_y)
+    scale_est = lambda model, resid: sm.robust.scale.mad(resid)
+    for norm, m_norm, update_scale in [('huber', sm.robust.norms.HuberT(1.345), True),
+                                       ('tukey', sm.robust.norms.TukeyBiweight(4.685), False)]:
+        results = irls_fit(x_stack, y_stack, w, norm=norm, max_iter=500, tol=1e-10)
+        assert results['converged']
+        for g, (x_mat, y) in enumerate(zip(list_of_x_mat, list_of_y)):
+            fit = sm.RLM(y, x_mat, M=m_norm).fit(scale_est=scale_est, conv='coefs', tol=1e-13, maxiter=500,
+                                                update_scale=update_scale)
+            np.testing.assert_allclose(results['beta_hat'][g], fit.params, rtol=1e-6, atol=1e-5)
+            np.testing.assert_allclose(results['robust_weights'][g, :len(y)], fit.weights, atol=1e-5)
+            np.testing.assert_allclose(results['scale'][g], fit.scale, rtol=1e-5)
+
+
+def test_ransac_rejects_outliers():
+    list_of_x_mat, list_of_y = make_groups_with_outliers()
+    x_stack, y_stack, w = stack_groups(list_of_x_mat, list_of_y)
+    results = ransac_fit(x_stack, y_stack, w, seed=0)
+    for g, (x_mat, y) in enumerate(zip(list_of_x_mat, list_of_y)):
+        n = len(y)
+        outliers = np.isin(np.arange(n), [3, n-2])
+        assert not np.any(results['inliers'][g, :n][outliers])
+        assert np.mean(results['inliers'][g, :n][~outliers]) > 0.9
+        assert not np.any(results['inliers'][g, n:])
+
+        #the final estimate is the OLS fit of the inliers
+        inliers = results['inliers'][g, :n]
+        x_stack_g, y_stack_g, w_g = stack_groups([x_mat[inliers]], [y[inliers]])
+        np.testing.assert_allclose(results['beta_hat'][g], batched_ols(x_stack_g, y_stack_g, w_g)['beta_hat'][0],
+                                   rtol=1e-10)
+
+
+def test_point_diagnostics_agree_with_residual_diagnostics():
+    list_of_x_mat, list_of_y = make_groups_with_outliers(sizes=(8, 12, 30))
+    dict_of_data = {}
+    for g, (x_mat, y) in enumerate(zip(list_of_x_mat, list_of_y)):
+        dict_of_data[str(5*(g+1)) + '_cSt'] = pd.DataFrame({'P [mbar]': np.arange(len(y))*100,
+                                                            'Q_sli [uL/min]': x_mat[:, 1], 'Q_mass_meas [uL/min]': y})
+    df_points, df_summary = point_diagnostics(dict_of_data)
+    df_residual_points, df_tests = residual_diagnostics(dict_of_data)
+    np.testing.assert_allclose(df_points['cooks_distance'], df_residual_points['cooks_distance'])
+    for column in ['t_threshold', 'cooks_threshold']:
+        np.testing.assert_allclose(df_summary[column], df_tests[column])
+    for visc, df_points_visc in df_points.groupby('Viscosity [cSt]'):
+        row = df_tests[df_tests['Viscosity [cSt]'] == visc].iloc[0]
+        assert df_points_visc['high_residual'].any() == ('outlier' in row['status'])
+        assert df_points_visc['influential'].sum() == row['num_influential']
+        num_flagged = df_summary[df_summary['Viscosity [cSt]'] == visc]['num_flagged'].iloc[0]
+        assert df_points_visc['flagged'].sum() == num_flagged
+    assert df_points['high_residual'].sum() >= 3
@@ -0,0 +1,126 @@
+"""
+Title: test_run_archive.py
+
+Summary:
+Regression tests of run_archive.py, runs written and appended to an archive are read back identically, replaced runs
+leave no dead blocks, runs are written one at a time as they are read and a failed append leaves the archive unchanged.
+
+"""
+
+import weakref
+import numpy as np
+import pandas as pd
+import pytest
+from run_archive import write_archive, read_archive_run, read_archive_index, archive_csv_files
+
+
+def make_run(seed, num_rows=5000):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({'Sample #': np.arange(num_rows),
+                       'Relative Time[s]': np.round(np.arange(num_rows)*0.01, 2),
+                       'Flow [ul/min]': np.round(50 + rng.normal(0, 5, num_rows), 3)})
+    header_lines = ['Sensor, SLI-0430', 'Seed, ' + str(seed)]
+    return df, header_lines
+
+
+def make_runs(seeds):
+    return {'visc_5_cSt/' + str(seed) + '_mbar': make_run(seed) for seed in seeds}
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / 'runs.sliarch'
+    runs = make_runs(range(100, 400, 100))
+    index = write_archive(path, runs, block_size=1024)
+    for run_name, (df, header_lines) in runs.items():
+        df_read, header_lines_read = read_archive_run(path, run_name, index=index)
+        assert df_read.equals(df)
+        assert header_lines_read == header_lines
+
+
+def test_time_range_and_columns(tmp_path):
+    path = tmp_path / 'runs.sliarch'
+    df, header_lines = make_run(1)
+    write_archive(path, {'run': (df, header_lines)}, block_size=1024)
+    df_read = read_archive_run(path, 'run', t_min=12.0, t_max=30.5, columns=['Flow [ul/min]'])[0]
+    expected = df[(df['Relative Time[s]'] >= 12.0) & (df['Relative Time[s]'] <= 30.5)][['Flow [ul/min]']]
+    assert df_read.equals(expected.reset_index(drop=True))
+
+
+def test_append_and_replace(tmp_path):
+    path = tmp_path / 'runs.sliarch'
+    runs = make_runs(range(100, 600, 100))
+    names = list(runs)
+    write_archive(path, {run_name: runs[run_name] for run_name in names[:3]}, block_size=1024)
+    write_archive(path, {run_name: runs[run_name] for run_name in names[3:]}, block_size=1024, append=True)
+
+    #replacing runs with new data
+    new_run = make_run(7)
+    runs[names[0]] = new_run
+    index = write_archive(path, {names[0]: new_run}, block_size=1024, append=True)
+
+    assert sorted(read_archive_index(path)[0]['runs']) == sorted(names)
+    for run_name, (df, header_lines) in runs.items():
+        df_read, header_lines_read = read_archive_run(path, run_name, index=index)
+        assert df_read.equals(df)
+        assert header_lines_read == header_lines
+
+    #no dead blocks, same size as writing the runs at once
+    fresh_path = tmp_path / 'fresh.sliarch'
+    write_archive(fresh_path, runs, block_size=1024)
+    assert path.stat().st_size == fresh_path.stat().st_size
+
+
+def test_runs_written_one_at_a_time(tmp_path):
+    path = tmp_path / 'runs.sliarch'
+    tmp_archive_path = tmp_path / 'runs.sliarch.tmp'
+    list_of_refs = []
+
+    def read_runs():
+        for seed in range(100, 500, 100):
+            #the previous run is written and no longer held when the next one is read
+            if list_of_refs:
+                assert list_of_refs[-1][0]() is None
+                assert tmp_archive_path.stat().st_size > list_of_refs[-1][1]
+            df, header_lines = make_run(seed)
+            list_of_refs.append((weakref.ref(df), tmp_archive_path.stat().st_size))
+            yield 'visc_5_cSt/' + str(seed) + '_mbar', (df, header_lines)
+            del df
+
+    index = write_archive(path, read_runs(), block_size=1024)
+    assert list(index['runs']) == list(make_runs(range(100, 500, 100)))
+    for run_name, (df, header_lines) in make_runs(range(100, 500, 100)).items():
+        assert read_archive_run(path, run_name, index=index)[0].equals(df)
+
+    with pytest.raises(ValueError):
+        write_archive(path, [('run', make_run(1)), ('run', make_run(2))], append=True)
+
+
+def test_archive_csv_files(tmp_path):
+    data_dir = tmp_path / 'data'
+    runs = make_runs([100, 200, 300])
+    for run_name, (df, header_lines) in runs.items():
+        csv_path = data_dir / (run_name + '.csv')
+        csv_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(csv_path, 'w', newline='') as f:
+            f.write(''.join(line + '\r\n' for line in header_lines + ['']*12))
+            df.to_csv(f, index=False, lineterminator='\r\n', float_format='%.3f')
+    index, csv_bytes = archive_csv_files(data_dir, tmp_path / 'runs.sliarch', pattern='**/*_mbar.csv')
+    assert csv_bytes == sum(path.stat().st_size for path in data_dir.glob('**/*.csv'))
+    assert sorted(index['runs']) == sorted(runs)
+    for run_name, (df, header_lines) in runs.items():
+        df_read, header_lines_read = read_archive_run(tmp_path / 'runs.sliarch', run_name, index=index)
+        pd.testing.assert_frame_equal(df_read, df, check_exact=False, rtol=1e-12)
+        assert header_lines_read == header_lines + ['']*12
+
+
+def test_failed_append_leaves_archive(tmp_path):
+    path = tmp_path / 'runs.sliarch'
+    write_archive(path, make_runs([100, 200]), block_size=1024)
+    archive_bytes = path.read_bytes()
+
+    df, header_lines = make_run(300)
+    df['Operator'] = 'x'
+    with pytest.raises(ValueError):
+        write_archive(path, {'good': make_run(400), 'bad': (df, header_lines)}, append=True)
+    assert path.read_bytes() == archive_bytes
+    assert not (tmp_path / 'runs.sliarch.tmp').exists()
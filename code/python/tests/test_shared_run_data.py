@@ -0,0 +1,89 @@
+"""
+Title: test_shared_run_data.py
+
+Summary:
+Regression tests of shared_run_data.py, the averages of runs calculated in worker processes from shared memory equal
+sensiron_first_order_uncertainty of the parsed runs calculated serially, and no shared memory segment is left in
+/dev/shm after the store is closed, after an exception inside its with block or while a column is still referenced.
+
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from functions import read_sensirion_csv, sensiron_first_order_uncertainty, steady_state_window
+from shared_run_data import SharedRunStore, run_average, run_steady_state_average
+
+pytestmark = pytest.mark.skipif(not os.path.isdir('/dev/shm'), reason='shared memory segments are not in /dev/shm')
+
+
+def write_run(path, pressure, seed, num_rows=3000):
+    rng = np.random.default_rng(seed)
+    time = np.arange(num_rows)*0.05
+    flow = pressure/10*(1 - np.exp(-time/10)) + rng.normal(0, 0.5, num_rows)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', newline='') as f:
+        f.write(''.join('Header line ' + str(i) + '\r\n' for i in range(14)))
+        f.write('Sample #,Relative Time[s],Flow [ul/min]\r\n')
+        f.write(''.join('%d,%.2f,%.3f\r\n' % (i, t, q) for i, (t, q) in enumerate(zip(time, flow))))
+
+
+def segment_exists(name):
+    return os.path.exists('/dev/shm/' + name.lstrip('/'))
+
+
+def test_map_runs_matches_serial(tmp_path):
+    for visc in ['5', '10']:
+        for pressure in [100, 200, 300]:
+            write_run(tmp_path / ('visc_' + visc + '_cSt') / (str(pressure) + '_mbar.csv'), pressure,
+                      seed=pressure + int(visc))
+    with SharedRunStore() as store:
+        store.add_csv_files(tmp_path)
+        assert len(store.run_names()) == 6
+        dict_of_avg = store.map_runs(run_average, max_workers=2)
+        dict_of_steady_avg = store.map_runs(run_steady_state_average, max_workers=2, chunksize=2)
+        for run_name in store.run_names():
+            df, header_lines = read_sensirion_csv(tmp_path / (run_name + '.csv'))
+            assert store.header_lines[run_name] == header_lines
+            flow = store.column(run_name, 'Flow [ul/min]')
+            np.testing.assert_array_equal(flow, df['Flow [ul/min]'].values)
+            assert not flow.flags.writeable
+            del flow
+
+            key = run_name.split('/')[1].replace('_mbar', '')
+            assert dict_of_avg[run_name] == sensiron_first_order_uncertainty({key: df})[key]
+            i_start, i_end = steady_state_window(df['Flow [ul/min]'].values)
+            df_steady = df.iloc[i_start:i_end].reset_index(drop=True)
+            expected = sensiron_first_order_uncertainty({key: df_steady})[key]
+            np.testing.assert_allclose(dict_of_steady_avg[run_name][:5], expected, rtol=1e-12)
+            assert dict_of_steady_avg[run_name][5] == df['Relative Time[s]'][i_start]
+
+
+def test_no_segments_left(tmp_path):
+    df = pd.DataFrame({'Sample #': np.arange(1000), 'Relative Time[s]': np.arange(1000)*0.05,
+                       'Flow [ul/min]': np.linspace(0, 100, 1000), 'Operator': 'x'})
+    store = SharedRunStore()
+    store.add_run('100_mbar', df)
+    store.add_run('200_mbar', df.iloc[:10])
+    with pytest.raises(ValueError):
+        store.add_run('100_mbar', df)
+    names = list(store.segments)
+    assert len(names) == 2 and all(segment_exists(name) for name in names)
+    assert list(store.layout['runs']['100_mbar']['columns']) == ['Sample #', 'Relative Time[s]', 'Flow [ul/min]']
+
+    #a column still referenced keeps the memory mapped but the segment is unlinked
+    flow = store.column('100_mbar', 'Flow [ul/min]')
+    store.close()
+    assert not any(segment_exists(name) for name in names)
+    np.testing.assert_array_equal(flow, df['Flow [ul/min]'].values)
+    del flow
+
+    #exception inside the with block
+    with pytest.raises(RuntimeError):
+        with SharedRunStore() as store:
+            store.add_run('100_mbar', df)
+            names = list(store.segments)
+            store.map_runs(run_average, max_workers=1)
+            raise RuntimeError('analysis failed')
+    assert names and not any(segment_exists(name) for name in names)
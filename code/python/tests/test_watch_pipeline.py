@@ -0,0 +1,117 @@
+"""
+Title: test_watch_pipeline.py
+
+Summary:
+Regression tests of watch_pipeline.py, a changed raw or mass balance file reruns only the stages downstream of it (and
+reparses only the changed raw file), a file rewritten with the same content reruns nothing, and the inotify watcher
+skips events of watch descriptors that were already removed instead of failing.
+
+"""
+
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+import pytest
+import watch_pipeline
+from watch_pipeline import new_pipeline_state, run_incremental, downstream_nodes, open_watcher, wait_for_change
+
+
+def write_sensor_file(path, pressure, seed=0, num_rows=200):
+    rng = np.random.default_rng(seed)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', newline='') as f:
+        f.write(''.join('Header line ' + str(i) + '\r\n' for i in range(14)))
+        f.write('Sample #,Relative Time[s],Flow [ul/min]\r\n')
+        f.write(''.join('%d,%.2f,%.3f\r\n' % (i, i*0.05, pressure/10 + rng.normal(0, 0.5)) for i in range(num_rows)))
+
+
+def write_campaign(data_dir, pressures=(100, 200, 300)):
+    for flow_case, sign, q in [('positive_q', 1, 'p'), ('negative_q', -1, 'n')]:
+        for visc in ['5', '10']:
+            for pressure in pressures:
+                write_sensor_file(data_dir / 'flow_rate_measurements' / flow_case / ('visc_' + visc + '_cSt') /
+                                  (str(pressure) + '_mbar.csv'), sign*pressure, seed=pressure)
+            mass_dir = data_dir / 'mass_balance_measurements' / flow_case
+            mass_dir.mkdir(parents=True, exist_ok=True)
+            pd.DataFrame({'P [mbar]': list(pressures), 'Measurement Time [s]': 300.0, 'M_i [g]': 10.0,
+                          'M_f [g]': [10.0 + 0.0027*p for p in pressures]}).to_csv(
+                mass_dir / ('visc_' + visc + '_cSt_mass_' + q + '_q.csv'), index=False)
+
+
+def test_changed_file_reruns_dependent_stages(tmp_path, monkeypatch):
+    data_dir = tmp_path / 'data'
+    write_campaign(data_dir)
+    parsed = []
+    average_run = watch_pipeline.average_run
+    monkeypatch.setattr(watch_pipeline, 'average_run', lambda path, **kwargs: parsed.append(path.name) or
+                        average_run(path, **kwargs))
+    state = new_pipeline_state(data_dir, tmp_path / 'out')
+    assert len(run_incremental(state)) == 4*3 + 2*3 + 1
+    assert len(parsed) == 12
+    assert run_incremental(state) == []
+
+    #new data of one raw file of one flow case and viscosity
+    parsed.clear()
+    sensor_path = data_dir / 'flow_rate_measurements' / 'positive_q' / 'visc_5_cSt' / '200_mbar.csv'
+    write_sensor_file(sensor_path, 210, seed=1)
+    params_10 = state['frames']['params/10_cSt'][0]
+    assert run_incremental(state) == ['avg/positive_q/5_cSt', 'vfr/positive_q/5_cSt', 'combined/positive_q/5_cSt',
+                                      'pn/5_cSt', 'params/5_cSt', 'figure/5_cSt', 'params_table']
+    assert parsed == ['200_mbar.csv']
+    assert state['frames']['params/10_cSt'][0] == params_10
+    assert state['frames']['params_table']['Viscosity [cSt]'].tolist() == [5, 10]
+
+    #a file rewritten with the same content reruns nothing
+    write_sensor_file(sensor_path, 210, seed=1)
+    assert run_incremental(state) == []
+
+    #a changed mass balance file does not reparse the raw files of its group
+    parsed.clear()
+    mass_path = data_dir / 'mass_balance_measurements' / 'negative_q' / 'visc_10_cSt_mass_n_q.csv'
+    with open(mass_path, 'a') as f:
+        f.write('400,300.0,10.0,11.08\n')
+    assert run_incremental(state) == ['vfr/negative_q/10_cSt', 'combined/negative_q/10_cSt', 'pn/10_cSt',
+                                      'params/10_cSt', 'figure/10_cSt', 'params_table']
+    assert parsed == []
+
+    #a restart reuses the cached averages of unchanged raw files
+    parsed.clear()
+    state = new_pipeline_state(data_dir, tmp_path / 'out')
+    assert len(run_incremental(state)) == 19 and parsed == []
+    assert downstream_nodes(['pn/5_cSt']) == {'pn/5_cSt', 'params/5_cSt', 'figure/5_cSt', 'params_table'}
+
+
+def test_watcher_skips_removed_watches(tmp_path):
+    pytest.importorskip('inotify_simple')
+    flags = watch_pipeline.inotify_simple.flags
+    (tmp_path / 'visc_5_cSt').mkdir()
+    watcher = open_watcher(tmp_path)
+    try:
+        assert sorted(watcher['paths'].values()) == [str(tmp_path), str(tmp_path / 'visc_5_cSt')]
+
+        #a new folder is watched, a removed folder is no longer watched
+        (tmp_path / 'visc_10_cSt').mkdir()
+        wait_for_change(watcher, 0.05)
+        assert str(tmp_path / 'visc_10_cSt') in watcher['paths'].values()
+        (tmp_path / 'visc_5_cSt').rmdir()
+        wait_for_change(watcher, 0.05)
+        assert str(tmp_path / 'visc_5_cSt') not in watcher['paths'].values()
+    finally:
+        watcher['inotify'].close()
+
+    #events of a removed watch descriptor queued behind its IGNORED event
+    Event = namedtuple('Event', ['wd', 'mask', 'cookie', 'name'])
+
+    class Inotify:
+        def __init__(self, batches):
+            self.batches = batches
+
+        def read(self, read_delay=None):
+            return self.batches.pop(0)
+
+    batches = [[Event(2, flags.IGNORED, 0, ''), Event(2, flags.CREATE | flags.ISDIR, 0, 'visc_20_cSt'),
+                Event(2, flags.CLOSE_WRITE, 0, '100_mbar.csv')],
+               [Event(1, flags.CLOSE_WRITE, 0, 'visc_5_cSt_mass_p_q.csv')]]
+    watcher = {'inotify': Inotify(batches), 'paths': {1: str(tmp_path), 2: str(tmp_path / 'visc_5_cSt')}}
+    wait_for_change(watcher, 0.05)
+    assert watcher['paths'] == {1: str(tmp_path)} and batches == []
@@ -0,0 +1,498 @@
+"""
+Title: watch_pipeline.py
+
+Summary:
+Program watches the folders of raw measurement data (sensiron flow viewer .csv files and mass balance .csv files) and
+reruns only the stages of the calibration pipeline affected by a new or changed file, instead of rerunning
+flow_rate_meas_to_avg.py, mass_fr_to_vol_fr.py, flow_meter_fr_and_meas_fr_to_csv.py, neg_and_pos_q_combined_file.py and
+plotting_combined_df.py for every viscosity and flow case. The pipeline is represented as a dependency graph of the form
+
+raw pressure_mbar.csv files  -> avg/flow_case/visc      (average flow rate of each pressure, per raw file cache)
+mass balance .csv file + avg -> vfr/flow_case/visc      (volume flow rate from mass flow rate at the run temperatures)
+avg + vfr                    -> combined/flow_case/visc (sensor and mass balance flow rates)
+combined positive + negative -> pn/visc                 (combined negative and positive flow rates)
+pn/visc                      -> params/visc, figure/visc
+all params                   -> params_table            (estimated_params_and_uncert.csv)
+
+Files are detected as changed from their modification time and size, confirmed by a sha1 hash of their content (so a file
+that is only touched or rewritten with the same content does not trigger any recalculation), and only the nodes downstream
+of changed files are recalculated. The average of each raw file is cached, so a new set-point only parses the new file.
+The average temperature of each run (if the sensor exports a temperature channel) is kept as T [C] in the average and
+combined files and the density of the fluid is taken at that temperature (see run_density fn in pipeline_stages.py), so
+the combined files can be used by fit_temperature_model in correction_models.py. The state (file signatures and cached
+averages) is stored in ./outputs/pipeline_state.json so a restart does not reparse
+every raw file. Outputs are written to the same folders as the individual programs.
+
+Changes are detected by polling the folders (os.scandir) or, if the inotify_simple package is installed, by waiting for
+inotify events (both work on a plain linux machine). A single inotify instance is kept for the life of the program, so
+events that arrive while the pipeline is recalculating are queued and handled on the next loop, and only completed
+writes (CLOSE_WRITE), moves and deletions wake the program (not the creation of a file that is still being written).
+Errors raised by a stage are reported and the program keeps watching.
+
+If validate is True, new and changed files are checked before any recalculation (see ingest_validation.py), every
+problem is reported and the flow cases and viscosities with problems (e.g. a sensor file whose pressure is not yet in
+the mass balance file) are not recalculated until their files are fixed, instead of failing in a stage or giving
+misaligned results. The program keeps watching.
+
+Dependencies:
+1. Path from pathlib
+2. hashlib
+3. json
+4. os
+5. time
+6. traceback
+7. numpy
+8. pandas
+9. pipeline_stages.py
+10. ingest_validation.py
+11. inotify_simple [optional]
+
+Notes:
+1. change data_dir and out_dir for different data, poll_interval for the polling period [s]
+2. program runs until interrupted (ctrl+c), set run_once = True to update the outputs once and exit
+3. files of flow cases and viscosities with problems are not recorded as processed, so they are checked again on the
+    next change and on the next start
+
+"""
+
+from pathlib import Path
+import hashlib
+import json
+import os
+import time
+import traceback
+import numpy as np
+import pandas as pd
+from pipeline_stages import average_run, average_runs_to_df, mass_to_volume_flow_rate, run_density, \
+    combine_sensor_and_mass, combine_pos_neg, fit_linear_correction, plot_correction_fit, si_oil_density, avg_columns, \
+    param_columns, temperature_column
+from ingest_validation import validate_inputs, file_group
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+flow_cases = ['negative_q', 'positive_q']
+
+#rank of each stage, nodes are recalculated in ascending order of rank
+stage_rank = {'avg': 0, 'vfr': 1, 'combined': 2, 'pn': 3, 'params': 4, 'figure': 5, 'params_table': 5}
+
+
+"""
+Function: scan_inputs(data_dir)
+
+Summary:
+Function lists the raw input files in data_dir (e.g. ../../data/si_oil/) and outputs a dictionary of the form
+{relative_path: (node, mtime_ns, size)} where node is the pipeline node the file is an input of, for
+
+flow_rate_measurements/flow_case/visc_(visc)_cSt/(pressure)_mbar.csv -> avg/flow_case/(visc)_cSt
+mass_balance_measurements/flow_case/visc_(visc)_cSt_mass_(n or p)_q.csv -> vfr/flow_case/(visc)_cSt
+
+"""
+
+def scan_inputs(data_dir):
+    data_dir = Path(data_dir)
+    inputs = {}
+    for flow_case in flow_cases:
+        case_dir = data_dir / 'flow_rate_measurements' / flow_case
+        if case_dir.is_dir():
+            for visc_entry in os.scandir(case_dir):
+                if not (visc_entry.is_dir() and visc_entry.name.startswith('visc_')):
+                    continue
+                node = 'avg/' + flow_case + '/' + visc_entry.name.replace('visc_', '')
+                for entry in os.scandir(visc_entry.path):
+                    if entry.name.endswith('_mbar.csv'):
+                        st = entry.stat()
+                        inputs[os.path.relpath(entry.path, data_dir)] = (node, st.st_mtime_ns, st.st_size)
+
+        mass_dir = data_dir / 'mass_balance_measurements' / flow_case
+        if mass_dir.is_dir():
+            for entry in os.scandir(mass_dir):
+                if entry.name.startswith('visc_') and '_mass_' in entry.name and entry.name.endswith('.csv'):
+                    visc = entry.name.replace('visc_', '').split('_mass_')[0]
+                    st = entry.stat()
+                    inputs[os.path.relpath(entry.path, data_dir)] = ('vfr/' + flow_case + '/' + visc, st.st_mtime_ns,
+                                                                      st.st_size)
+    return inputs
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: file_sha1(path)
+
+Summary:
+Function outputs the sha1 hash of the content of a file (read in 1 MB blocks).
+
+"""
+
+def file_sha1(path):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: downstream_nodes(dirty)
+
+Summary:
+Function outputs the set of all nodes of the dependency graph downstream of (and including) the given dirty nodes.
+
+"""
+
+def downstream_nodes(dirty):
+    nodes = set(dirty)
+    for node in list(nodes):
+        parts = node.split('/')
+        if parts[0] == 'avg':
+            nodes.add('vfr/' + parts[1] + '/' + parts[2])
+        if parts[0] in ('avg', 'vfr'):
+            nodes.add('combined/' + parts[1] + '/' + parts[2])
+    for node in list(nodes):
+        if node.startswith('combined/'):
+            nodes.add('pn/' + node.split('/')[2])
+    for node in list(nodes):
+        if node.startswith('pn/'):
+            visc = node.split('/')[1]
+            nodes.update(['params/' + visc, 'figure/' + visc, 'params_table'])
+    return nodes
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: new_pipeline_state(data_dir, out_dir, validate=False)
+
+Summary:
+Function outputs the state of the pipeline, loading the file signatures and cached averages from
+out_dir/pipeline_state.json if it exists. Dataframes of each node are kept in memory in state['frames'] (not stored). If
+validate is True new and changed files are checked before recalculation (see run_incremental fn).
+
+"""
+
+def new_pipeline_state(data_dir, out_dir, validate=False):
+    state = {'data_dir': Path(data_dir), 'out_dir': Path(out_dir), 'files': {}, 'avg_rows': {}, 'frames': {},
+             'first_run': True, 'validate': validate}
+    state_path = Path(out_dir) / 'pipeline_state.json'
+    if state_path.exists():
+        with open(state_path) as f:
+            stored = json.load(f)
+        state['files'] = stored['files']
+        state['avg_rows'] = stored['avg_rows']
+    return state
+
+
+def save_pipeline_state(state):
+    state_path = state['out_dir'] / 'pipeline_state.json'
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = state_path.with_suffix('.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump({'files': state['files'], 'avg_rows': state['avg_rows']}, f)
+    os.replace(tmp_path, state_path)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: run_incremental(state)
+
+Summary:
+Function scans the input files, determines the changed (new, modified or removed) files and recalculates only the nodes
+downstream of them. Outputs the list of recalculated nodes (empty if nothing changed). On the first run after a start
+every node is recalculated (raw files whose signature is unchanged use their cached average).
+
+If state['validate'] is True, the new and changed files are checked first (see validate_inputs fn in
+ingest_validation.py, missing mass balance files are not reported since they may not be written yet). The problems of
+the flow cases and viscosities of the changed files are printed and those groups are skipped, their files are not
+recorded as processed so they are checked again on the next change.
+
+"""
+
+def run_incremental(state):
+    data_dir = state['data_dir']
+    inputs = scan_inputs(data_dir)
+    skipped_groups = set()
+
+    if state['validate']:
+        modified = [rel_path for rel_path, (node, mtime_ns, size) in inputs.items()
+                    if rel_path not in state['files'] or
+                    (state['files'][rel_path]['mtime_ns'], state['files'][rel_path]['size']) != (mtime_ns, size)]
+        if modified:
+            df_problems = validate_inputs(data_dir, modified, require_counterparts=False)
+            problem_groups = df_problems['File'].map(file_group)
+            #only problems of the groups of the changed files, other groups are not recalculated anyway
+            in_modified = problem_groups.isin(set(file_group(rel_path) for rel_path in modified))
+            skipped_groups = set(problem_groups[in_modified])
+            if len(skipped_groups) > 0:
+                print('invalid input files, ' + ', '.join(sorted(skipped_groups)) + ' not recalculated until fixed:\n' +
+                      df_problems[in_modified].to_string(index=False))
+
+    dirty = set()
+    changed_files = set()
+    for rel_path, (node, mtime_ns, size) in inputs.items():
+        if file_group(rel_path) in skipped_groups:
+            continue
+        stored = state['files'].get(rel_path)
+        if stored is not None and stored['mtime_ns'] == mtime_ns and stored['size'] == size:
+            continue
+        sha1 = file_sha1(data_dir / rel_path)
+        if stored is None or stored['sha1'] != sha1:
+            changed_files.add(rel_path)
+            dirty.add(node)
+        state['files'][rel_path] = {'node': node, 'mtime_ns': mtime_ns, 'size': size, 'sha1': sha1}
+    for rel_path in list(state['files']):
+        if rel_path not in inputs:
+            dirty.add(state['files'].pop(rel_path)['node'])
+            state['avg_rows'].pop(rel_path, None)
+
+    if state['first_run']:
+        dirty.update(node for node, mtime_ns, size in inputs.values())
+        state['first_run'] = False
+    if not dirty:
+        return []
+
+    #nodes of skipped groups keep their last valid results (node names of the form stage/flow_case/visc)
+    nodes = [node for node in downstream_nodes(dirty) if node.count('/') < 2 or
+             node.split('/', 1)[1] not in skipped_groups]
+    nodes = sorted(nodes, key=lambda node: (stage_rank[node.split('/')[0]], node))
+    recalculated = [node for node in nodes if _run_node(state, node, inputs, changed_files)]
+    save_pipeline_state(state)
+    return recalculated
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: _run_node(state, node, inputs, changed_files)
+
+Summary:
+Function recalculates a single node of the pipeline, stores its dataframe in state['frames'] and writes its output file.
+Outputs True if the node was recalculated and False if its inputs are not (yet) available.
+
+"""
+
+def _run_node(state, node, inputs, changed_files):
+    out_dir = state['out_dir']
+    frames = state['frames']
+    parts = node.split('/')
+    stage = parts[0]
+
+    if stage == 'avg':
+        flow_case, visc = parts[1], parts[2]
+        list_of_avg = []
+        for rel_path, (input_node, mtime_ns, size) in sorted(inputs.items()):
+            if input_node != node:
+                continue
+            #cached rows without temperature (older state files) are recalculated
+            if rel_path in changed_files or len(state['avg_rows'].get(rel_path, [])) != len(avg_columns) + 1:
+                state['avg_rows'][rel_path] = [float(v) for v in average_run(state['data_dir'] / rel_path,
+                                                                             temperature=True)]
+            list_of_avg.append(state['avg_rows'][rel_path])
+        if not list_of_avg:
+            frames.pop(node, None)
+            return False
+        df = average_runs_to_df(list_of_avg)
+        df['Pressure [mbar]'] = df['Pressure [mbar]'].astype(int)
+        df['# Samples'] = df['# Samples'].astype(int)
+        frames[node] = df
+        _write_csv(df, out_dir / 'avg_flow_rate_from_meas' / flow_case / (visc + '.csv'))
+
+    elif stage == 'vfr':
+        flow_case, visc = parts[1], parts[2]
+        rel_paths = [rel_path for rel_path, value in inputs.items() if value[0] == node]
+        if not rel_paths or visc not in si_oil_density:
+            frames.pop(node, None)
+            return False
+        df_mass = pd.read_csv(state['data_dir'] / rel_paths[0])
+        rho, temperature = run_density(visc, df_mass['P [mbar]'], frames.get('avg/' + flow_case + '/' + visc))
+        df = mass_to_volume_flow_rate(df_mass, rho)
+        if np.any(np.isfinite(temperature)):
+            df[temperature_column] = temperature
+            df['rho [kg/m^3]'] = rho
+        frames[node] = df
+        #file named after the density at 25 C as in mass_fr_to_vol_fr.py
+        _write_csv(df, out_dir / 'v_fr_from_m_fr' / flow_case / (visc + '_' + str(si_oil_density[visc]) +
+                                                                 '_kg_per_m_cubed.csv'))
+
+    elif stage == 'combined':
+        flow_case, visc = parts[1], parts[2]
+        df_meas = frames.get('avg/' + flow_case + '/' + visc)
+        df_v_fr = frames.get('vfr/' + flow_case + '/' + visc)
+        if df_meas is None or df_v_fr is None:
+            frames.pop(node, None)
+            return False
+        df = combine_sensor_and_mass(df_meas, df_v_fr, flow_case)
+        frames[node] = df
+        _write_csv(df, out_dir / 'correction_data_for_fitting' / flow_case / (visc + '.csv'))
+
+    elif stage == 'pn':
+        visc = parts[1]
+        df_pos = frames.get('combined/positive_q/' + visc)
+        df_neg = frames.get('combined/negative_q/' + visc)
+        if df_pos is None or df_neg is None:
+            frames.pop(node, None)
+            return False
+        df = combine_pos_neg(df_pos, df_neg)
+        frames[node] = df
+        _write_csv(df, out_dir / 'combined_pos_neg_q' / (visc + '.csv'))
+
+    elif stage == 'params':
+        visc = parts[1]
+        df = frames.get('pn/' + visc)
+        if df is None:
+            frames.pop(node, None)
+            return False
+        row, beta_hat = fit_linear_correction(df, int(visc.replace('_cSt', '')))
+        frames[node] = (row, beta_hat)
+
+    elif stage == 'figure':
+        visc = parts[1]
+        df = frames.get('pn/' + visc)
+        fit = frames.get('params/' + visc)
+        if df is None or fit is None:
+            return False
+        plot_correction_fit(df, fit[1], fit[0][-1], out_dir / 'figures' / (visc + '.png'))
+
+    elif stage == 'params_table':
+        rows = [frames[name][0] for name in frames if name.startswith('params/')]
+        if not rows:
+            return False
+        df = pd.DataFrame(rows, columns=param_columns).sort_values(by=['Viscosity [cSt]']).reset_index(drop=True)
+        frames[node] = df
+        _write_csv(df, out_dir / 'est_params_and_uncert' / 'estimated_params_and_uncert.csv')
+
+    return True
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: _write_csv(df, path)
+
+Summary:
+Function writes a dataframe to a .csv file (creating its folder), via a temporary file so that readers never see a
+partially written file.
+
+"""
+
+def _write_csv(df, path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix('.csv.tmp')
+    df.to_csv(tmp_path)
+    os.replace(tmp_path, path)
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: open_watcher(data_dir)
+
+Summary:
+Function outputs the watcher of data_dir used by wait_for_change, a dictionary of the form {'inotify': INotify,
+'paths': {watch descriptor: folder}} with a watch on every folder of data_dir, or None if inotify_simple is not
+installed (polling). The watcher is kept for the life of the program and closed with watcher['inotify'].close().
+
+"""
+
+def open_watcher(data_dir):
+    if inotify_simple is None:
+        return None
+    watcher = {'inotify': inotify_simple.INotify(), 'paths': {}}
+    _add_watches(watcher, data_dir)
+    return watcher
+
+
+def _add_watches(watcher, folder):
+    flags = inotify_simple.flags
+    mask = flags.CLOSE_WRITE | flags.MOVED_TO | flags.MOVED_FROM | flags.DELETE | flags.CREATE
+    for dir_path, dir_names, file_names in os.walk(folder):
+        try:
+            watcher['paths'][watcher['inotify'].add_watch(dir_path, mask)] = dir_path
+        except FileNotFoundError:
+            #folder removed again before its watch was added
+            continue
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+"""
+Function: wait_for_change(watcher, poll_interval)
+
+Summary:
+Function blocks until a file in the watched folder may have changed. With a watcher (see open_watcher fn) it waits for
+a completed write (CLOSE_WRITE), a move or a deletion of a file, events of the creation of files are ignored since the
+file may still be written, new folders are added to the watch. Events of watch descriptors that were already removed
+(deleted folders, IGNORED) are skipped. Events that arrived since the last call (e.g. during a recalculation) are
+returned immediately. Without a watcher it sleeps for poll_interval [s].
+
+"""
+
+def wait_for_change(watcher, poll_interval):
+    if watcher is None:
+        time.sleep(poll_interval)
+        return
+    flags = inotify_simple.flags
+    while True:
+        changed = False
+        for event in watcher['inotify'].read(read_delay=int(poll_interval*1000)):
+            if event.mask & flags.IGNORED:
+                watcher['paths'].pop(event.wd, None)
+            elif event.wd not in watcher['paths']:
+                continue
+            elif event.mask & flags.ISDIR:
+                if event.mask & (flags.CREATE | flags.MOVED_TO):
+                    _add_watches(watcher, os.path.join(watcher['paths'][event.wd], event.name))
+                changed = True
+            elif event.mask & (flags.CLOSE_WRITE | flags.MOVED_TO | flags.MOVED_FROM | flags.DELETE):
+                changed = True
+        if changed:
+            return
+
+'''
+********************************************END OF FUNCTION************************************************************
+'''
+
+if __name__ == '__main__':
+    #input path of folder of raw data and of outputs
+    data_dir = Path('../../data/si_oil/')
+    out_dir = Path('./outputs/')
+
+    #polling period [s], whether to update outputs once and exit and whether to check new files before recalculation
+    poll_interval = 0.5
+    run_once = False
+    validate = True
+
+    state = new_pipeline_state(data_dir, out_dir, validate=validate)
+    watcher = None if run_once else open_watcher(data_dir)
+    try:
+        while True:
+            t_start = time.perf_counter()
+            try:
+                recalculated = run_incremental(state)
+            except Exception:
+                #reporting the error and recalculating every node (cached averages are kept) on the next change
+                print('pipeline stage failed, waiting for the next change:\n' + traceback.format_exc())
+                state['first_run'] = True
+                recalculated = []
+            if recalculated:
+                print('recalculated ' + str(len(recalculated)) + ' nodes in ' +
+                      str(round(time.perf_counter()-t_start, 3)) + ' s: ' + ', '.join(recalculated))
+            if run_once:
+                break
+            wait_for_change(watcher, poll_interval)
+    finally:
+        if watcher is not None:
+            watcher['inotify'].close()